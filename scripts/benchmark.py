@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Benchmarks for the Python request path and data loaders.
+
+Runs offline against the App Engine SDK's testbed stubs (./install_deps
+and gulp build first), writes the results as JSON and, given a baseline,
+exits with status 1 if any benchmark's median got slower than the allowed
+ratio:
+
+    python ./scripts/benchmark.py --save-baseline
+    python ./scripts/benchmark.py --baseline
+
+A baseline file is a results file, optionally with a "thresholds" object
+mapping benchmark names to their own allowed ratio. The saved baseline is
+scripts/benchmarks/baseline.json, outside the ignored build/, so it can be
+committed and compared against on any checkout.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from udon.boot import fix_path
+fix_path()
+
+
+VERSION = 1
+DEFAULT_OUTPUT = os.path.join(project_dir, 'build', 'benchmark.json')
+DEFAULT_BASELINE = os.path.join(script_dir, 'benchmarks', 'baseline.json')
+DEFAULT_THRESHOLD = 1.25
+
+# each measurement runs the function enough times to take at least this long
+MIN_RUN_TIME = 0.05  # seconds
+REPEAT = 5
+
+SERVE_FILE_SIZE = 8 * 1024 * 1024  # bytes
+SERVE_FILE_RANGE = 1024 * 1024  # bytes
+LARGEST_FILES = 3
+
+
+def setup_environment():
+    """Activates the testbed stubs and sets Django up on the local settings."""
+    from google.appengine.ext import testbed
+
+    os.chdir(project_dir)  # utils reads data.json relative to here
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'udon.conf.local')
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.setup_env(app_id='project-udon')
+    bed.init_app_identity_stub()
+    bed.init_blobstore_stub()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    bed.init_urlfetch_stub()
+
+    import django
+    django.setup()
+    return bed
+
+
+def measure(fn, repeat=REPEAT):
+    """Returns timings for fn, in milliseconds per call."""
+    number = 1
+    while True:
+        start = time.time()
+        for _ in xrange(number):
+            fn()
+        if time.time() - start >= MIN_RUN_TIME or number >= 1000000:
+            break
+        number *= 10
+
+    times = []
+    for _ in xrange(repeat):
+        start = time.time()
+        for _ in xrange(number):
+            fn()
+        times.append((time.time() - start) / number * 1000)
+    times.sort()
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_ms': times[0],
+        'median_ms': times[len(times) // 2],
+    }
+
+
+def bench_data_loading(results):
+    from django.test.utils import override_settings
+    from udon import utils
+
+    results['utils.load_data'] = measure(utils.load_data)
+    with override_settings(DEBUG=False):
+        results['utils.get_data (DEBUG off)'] = measure(utils.get_data)
+    with override_settings(DEBUG=True):
+        results['utils.get_data (DEBUG on)'] = measure(utils.get_data)
+
+
+def bench_lookups(results):
+    from django.test.utils import override_settings
+    from udon import utils
+
+    artist = utils.get_artists()[0]
+    session = utils.get_sessions(artist['slug'])[0]
+    lookups = [
+        ('get_artists', lambda: utils.get_artists()),
+        ('get_artist', lambda: utils.get_artist(artist['slug'])),
+        ('get_previous_artist', lambda: utils.get_previous_artist(artist['slug'])),
+        ('get_next_artist', lambda: utils.get_next_artist(artist['slug'])),
+        ('get_sessions', lambda: utils.get_sessions(artist['slug'])),
+        ('get_session', lambda: utils.get_session(artist['slug'], session['slug'])),
+        ('get_first_session', lambda: utils.get_first_session(artist['slug'])),
+        ('get_globals', lambda: utils.get_globals()),
+        ('get_full_path', lambda: utils.get_full_path('/')),
+    ]
+    with override_settings(DEBUG=False):
+        for name, fn in lookups:
+            results['utils.' + name] = measure(fn)
+
+
+def bench_views(results):
+    from django.core.urlresolvers import reverse
+    from django.test import Client
+    from django.test.utils import override_settings
+    from udon import utils
+
+    client = Client()
+    artist = utils.get_artists()[0]
+    session = utils.get_sessions(artist['slug'])[0]
+    pages = [
+        ('views.home', reverse('home')),
+        ('views.session', reverse('session', args=[artist['slug'], session['slug']])),
+    ]
+
+    def get(path):
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+
+    # measure rendering, not the page cache
+    with override_settings(PAGE_CACHE_ENABLED=False, INSTRUMENTATION_SAMPLE_RATE=0):
+        for name, path in pages:
+            results[name] = measure(lambda: get(path))
+
+
+def bench_serve_file(results):
+    from django.test import Client
+    from django.test.utils import override_settings
+    from udon import streaming
+
+    root = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(root, 'video.mp4'), 'wb') as video:
+            video.write(os.urandom(SERVE_FILE_SIZE))
+
+        client = Client()
+        rng = random.Random(0)
+
+        def get_range():
+            start = rng.randrange(0, SERVE_FILE_SIZE - SERVE_FILE_RANGE)
+            response = client.get(
+                '/serve-file/video.mp4/',
+                HTTP_RANGE='bytes=%d-%d' % (start, start + SERVE_FILE_RANGE - 1),
+            )
+            assert response.status_code == 206, response.status_code
+            assert sum(len(chunk) for chunk in response.streaming_content) == SERVE_FILE_RANGE
+
+        def get_range_cold():
+            streaming.get_block_cache().clear()
+            get_range()
+
+        with override_settings(SERVE_FILE_ROOT=root, SERVE_FILE_STREAMING=True, INSTRUMENTATION_SAMPLE_RATE=0):
+            for name, fn in [('serve_file range (cold)', get_range_cold), ('serve_file range (warm)', get_range)]:
+                result = measure(fn)
+                result['mb_per_s'] = SERVE_FILE_RANGE / 1024.0 / 1024.0 / (result['median_ms'] / 1000)
+                results[name] = result
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_parse_sketches(results):
+    sketches_dir = os.path.join(project_dir, 'data', 'sketches')
+    files = []
+    for sketch in os.listdir(sketches_dir):
+        for file_name in os.listdir(os.path.join(sketches_dir, sketch)):
+            path = os.path.join(sketches_dir, sketch, file_name)
+            if file_name.endswith('.json') and os.path.isfile(path):
+                files.append((os.path.getsize(path), path))
+
+    for size, path in sorted(files, reverse=True)[:LARGEST_FILES]:
+        data = open(path, 'rb').read()
+        result = measure(lambda: json.loads(data), repeat=3)
+        result['bytes'] = size
+        results['json.loads %s' % os.path.relpath(path, sketches_dir)] = result
+
+
+BENCHMARKS = [
+    ('data', bench_data_loading),
+    ('lookups', bench_lookups),
+    ('views', bench_views),
+    ('serve_file', bench_serve_file),
+    ('parse', bench_parse_sketches),
+]
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of (name, baseline ms, result ms, allowed ratio) that regressed."""
+    thresholds = baseline.get('thresholds', {})
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline['results'].get(name)
+        if expected is None:
+            continue
+        allowed = thresholds.get(name, threshold)
+        if result['median_ms'] > expected['median_ms'] * allowed:
+            regressions.append((name, expected['median_ms'], result['median_ms'], allowed))
+    return regressions
+
+
+def write_json(path, data):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as out:
+        out.write(json.dumps(data, indent=2, sort_keys=True))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the request path and data loaders.")
+    parser.add_argument('--only', action='append', choices=[name for name, _ in BENCHMARKS], help="only run this group (repeatable)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="file to write the results to")
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE, help="results file to compare against (%s if no file is given)" % DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="allowed ratio of median to baseline median")
+    parser.add_argument('--save-baseline', action='store_true', help="also write the results to %s" % DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    bed = setup_environment()
+    results = {}
+    try:
+        for name, bench in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            bench(results)
+    finally:
+        bed.deactivate()
+
+    for name, result in sorted(results.items()):
+        extra = ' (%.1f MB/s)' % result['mb_per_s'] if 'mb_per_s' in result else ''
+        print "%-56s %10.4f ms%s" % (name, result['median_ms'], extra)
+
+    report = {
+        'version': VERSION,
+        'time': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    write_json(args.output, report)
+    if args.save_baseline:
+        write_json(DEFAULT_BASELINE, report)
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print "No baseline at %s, run with --save-baseline first" % args.baseline
+            return 1
+        with open(args.baseline, 'rb') as baseline_file:
+            baseline = json.loads(baseline_file.read())
+        regressions = compare(results, baseline, args.threshold)
+        for name, expected, actual, allowed in regressions:
+            print "REGRESSION %s: %.4f ms -> %.4f ms (allowed x%.2f)" % (name, expected, actual, allowed)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,463 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+from cStringIO import StringIO
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+import compile_models
+import compile_sketches
+import compress_data
+import fingerprint_assets
+import pack_sketches
+import render_thumbnails
+from udon import archive, buildcache, buildfiles, bundles, fingerprint, meshes, precompressed, sketches, thumbnails
+
+
+build_dir = os.path.join(project_dir, 'build')
+cache_path = os.path.join(build_dir, buildcache.FILE_NAME)
+# Tasks build here and are kept until the build they are part of is in place
+staging_dir = os.path.join(build_dir, '.staging')
+# The next build/ is assembled here, from hard links to the files that did
+# not change, and swapped in once every task and step has succeeded
+next_dir = os.path.join(build_dir, '.next')
+# Written into next_dir once it is complete; lists the entries of build/
+ENTRIES_NAME = '.entries.json'
+
+sketches_dir = os.path.join(project_dir, 'data', 'sketches')
+models_dir = os.path.join(project_dir, 'data', 'models')
+
+# The code each kind of task runs; editing any of it rebuilds that kind
+CODE = {
+    'sketches': [
+        'scripts/compile_sketches.py', 'udon/bundles.py', 'udon/chunks.py', 'udon/lod.py',
+        'udon/sketches.py', 'udon/sketchformat.py', 'udon/snapshots.py', 'udon/spatial.py', 'udon/timeline.py',
+    ],
+    'models': ['scripts/compile_models.py', 'udon/meshes.py', 'udon/precompressed.py', 'udon/sketchformat.py'],
+    'thumbnails': ['scripts/render_thumbnails.py', 'udon/sketches.py', 'udon/thumbnails.py'],
+}
+KINDS = ['sketches', 'models', 'thumbnails']
+
+
+class BuildError(Exception):
+    pass
+
+
+def relative_files(root):
+    return [os.path.relpath(os.path.join(root, path), project_dir).replace(os.sep, '/')
+            for path in buildcache.list_outputs(root)]
+
+
+def video_sizes(name, manifest):
+    """The sizes bundle.json lists for a session's video, which come from the
+    fingerprint manifest rather than from data/sketches.
+    """
+    meta_path = os.path.join(sketches_dir, name, 'meta.json')
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, 'rb') as meta_file:
+            source = (json.loads(meta_file.read()).get('video') or {}).get('source')
+    except ValueError:
+        # compile_sketches.py reports it when the task runs
+        return {}
+    if not source:
+        return {}
+    prefix = bundles.video_url(source, '').rstrip('/') + '/'
+    return dict((url, entry['size']) for url, entry in manifest['files'].items() if url.startswith(prefix))
+
+
+def sketch_tasks(manifest):
+    for name in sorted(os.listdir(sketches_dir)):
+        if os.path.isdir(os.path.join(sketches_dir, name)):
+            yield name, relative_files(os.path.join(sketches_dir, name)), {
+                'numpy': sketches.np is not None,
+                'videos': video_sizes(name, manifest),
+            }
+
+
+def model_tasks():
+    for file_name in sorted(os.listdir(models_dir)):
+        if file_name.endswith('.obj'):
+            yield os.path.splitext(file_name)[0], ['data/models/' + file_name], {
+                'quantize': True,
+                'encodings': sorted(precompressed.available_encodings()),
+            }
+
+
+def thumbnail_tasks():
+    with open(render_thumbnails.data_path, 'rb') as data_file:
+        names = render_thumbnails.session_sketches(json.loads(data_file.read()))
+    for name in sorted(set(names)):
+        if os.path.exists(os.path.join(sketches_dir, name, 'actions.json')):
+            yield name, ['data/sketches/%s/actions.json' % name], {'formats': thumbnails.formats()}
+
+
+def plan(kinds, cache, rehash):
+    """Returns a list of {'task', 'kind', 'name', 'key', 'sources'}, one
+    for every output the given kinds of task can build.
+    """
+    manifest = fingerprint.load_manifest(fingerprint_assets.manifest_path)
+    generators = {
+        'sketches': lambda: sketch_tasks(manifest),
+        'models': model_tasks,
+        'thumbnails': thumbnail_tasks,
+    }
+    tasks = []
+    for kind in kinds:
+        code = buildcache.digest_files(project_dir, CODE[kind], cache, rehash)
+        for name, sources, options in generators[kind]():
+            digests = buildcache.digest_files(project_dir, sources, cache, rehash)
+            digests.update(code)
+            tasks.append({
+                'task': '%s/%s' % (kind, name),
+                'kind': kind,
+                'name': name,
+                'key': buildcache.task_key(digests, options),
+                'sources': digests,
+            })
+    return tasks
+
+
+def stale_reason(cache, task):
+    entry = cache['tasks'].get(task['task'])
+    if entry is None:
+        return 'new'
+    if entry['key'] == task['key']:
+        return 'outputs missing'
+    previous = entry.get('sources', {})
+    changed = sorted(path for path in set(previous) | set(task['sources'])
+                     if previous.get(path) != task['sources'].get(path))
+    if not changed:
+        return 'options changed'
+    return 'changed ' + ', '.join(changed[:3]) + (' and %d more' % (len(changed) - 3) if len(changed) > 3 else '')
+
+
+def build_sketch(name, output, verify):
+    argv = ['--sketch', name, '--output', output] + (['--verify'] if verify else [])
+    if compile_sketches.main(argv):
+        raise BuildError("compile_sketches.py failed")
+
+
+def build_model(name, output, verify):
+    argv = ['--output', output, '--quantize'] + (['--verify'] if verify else []) + [name]
+    if compile_models.main(argv):
+        raise BuildError("compile_models.py failed")
+
+
+def build_thumbnails(name, output, verify):
+    _, _, _, error = render_thumbnails.render((name, sketches_dir, output, thumbnails.formats()))
+    if error:
+        raise BuildError(error)
+
+
+BUILDERS = {
+    'sketches': build_sketch,
+    'models': build_model,
+    'thumbnails': build_thumbnails,
+}
+
+
+def capture(function, *args):
+    """Calls function with its prints collected; returns (result, output,
+    seconds, error).
+    """
+    started = time.time()
+    stdout, sys.stdout = sys.stdout, StringIO()
+    result = error = None
+    try:
+        result = function(*args)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        output, sys.stdout = sys.stdout.getvalue(), stdout
+    return result, output, time.time() - started, error
+
+
+def run(job):
+    """Builds one task in a worker process, into <staging>.tmp and then
+    renamed to <staging>, so only complete outputs are ever staged. Returns
+    (task, seconds, output, error).
+    """
+    task, kind, name, staging, verify = job
+
+    def build():
+        tmp_dir = staging + '.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        BUILDERS[kind](name, tmp_dir, verify)
+        os.rename(tmp_dir, staging)
+
+    _, output, seconds, error = capture(build)
+    return task, seconds, output, error
+
+
+def link(source, target):
+    """Hard links the file or directory source to target, copying where links
+    are not supported. Every step writes a temporary file and renames it, so
+    a file is never changed in place under both names.
+    """
+    if os.path.isdir(source):
+        if not os.path.exists(target):
+            os.makedirs(target)
+        for path in buildcache.list_outputs(source):
+            link(os.path.join(source, path), os.path.join(target, path))
+        return
+    if not os.path.exists(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except (AttributeError, OSError):
+        shutil.copy2(source, target)
+
+
+def replace(source, target):
+    """Moves the file or directory source to target, replacing what is there."""
+    if not os.path.exists(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    if os.path.isdir(target):
+        old = source + '.old'
+        os.rename(target, old)
+        os.rename(source, target)
+        shutil.rmtree(old)
+    else:
+        os.rename(source, target)
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def remove_outputs(root, paths):
+    for path in paths:
+        full_path = os.path.join(root, path)
+        remove(full_path)
+        parent = os.path.dirname(full_path)
+        if os.path.isdir(parent) and not os.listdir(parent) and parent != root:
+            os.rmdir(parent)
+
+
+def promote(task, staging, root, model_index):
+    """Links a task's staged outputs into root and returns their paths,
+    relative to it.
+    """
+    kind, name = task['kind'], task['name']
+    if kind == 'models':
+        staged_index = precompressed.load_index(staging)
+        outputs = []
+        for file_name in sorted(os.listdir(staging)):
+            if file_name != precompressed.INDEX_NAME:
+                link(os.path.join(staging, file_name), os.path.join(root, kind, file_name))
+                outputs.append('%s/%s' % (kind, file_name))
+        model_index['files'].update(staged_index['files'])
+    else:
+        staged = os.path.join(staging, name)
+        target = os.path.join(root, kind, name)
+        outputs = ['%s/%s/%s' % (kind, name, path) for path in buildcache.list_outputs(staged)]
+        remove(target)
+        if os.path.isdir(staged):
+            link(staged, target)
+    return outputs
+
+
+def start_next():
+    """Starts next_dir as a copy of build/ made of hard links."""
+    remove(next_dir)
+    os.makedirs(next_dir)
+    for entry in sorted(os.listdir(build_dir)):
+        if not entry.startswith('.'):
+            link(os.path.join(build_dir, entry), os.path.join(next_dir, entry))
+
+
+def swap_next():
+    """Moves the complete build in next_dir into build/ and removes what it
+    no longer has. An interrupted swap is finished by running it again.
+    """
+    with open(os.path.join(next_dir, ENTRIES_NAME), 'rb') as entries_file:
+        entries = json.loads(entries_file.read())
+    for entry in os.listdir(build_dir):
+        if not entry.startswith('.') and entry not in entries:
+            remove(os.path.join(build_dir, entry))
+    # sorted, so the archive's index is only replaced after its segments,
+    # and the cache last, as it says which outputs are in place
+    for entry in sorted(entries, key=lambda entry: (entry == buildcache.FILE_NAME, entry)):
+        if os.path.exists(os.path.join(next_dir, entry)):
+            replace(os.path.join(next_dir, entry), os.path.join(build_dir, entry))
+    shutil.rmtree(next_dir)
+
+
+def write_thumbnail_index(root):
+    index_path = os.path.join(root, os.path.basename(render_thumbnails.index_path))
+    count = render_thumbnails.write_index(os.path.join(root, 'thumbnails'), index_path)
+    print "%d sketches in %s" % (count, index_path)
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Rebuild the compiled sketches, models and thumbnails in build/ whose sources have changed, then pack, compress and fingerprint them.")
+    parser.add_argument('--kind', action='append', choices=KINDS, help="only build this kind of output (repeatable)")
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help="tasks built at once")
+    parser.add_argument('--force', action='store_true', help="rebuild outputs that are up to date")
+    parser.add_argument('--rehash', action='store_true', help="rehash source files even if their size and mtime are unchanged")
+    parser.add_argument('--verify', action='store_true', help="check the sketches and models that are rebuilt against their sources")
+    parser.add_argument('--dry-run', action='store_true', help="list the outputs that would be rebuilt")
+    parser.add_argument('--verbose', action='store_true', help="print the output of every task and step")
+    args = parser.parse_args(argv)
+
+    kinds = [kind for kind in KINDS if not args.kind or kind in args.kind]
+    if 'thumbnails' in kinds and thumbnails.np is None:
+        print "numpy is not installed, not rendering thumbnails (pip install numpy)"
+        kinds.remove('thumbnails')
+
+    started = time.time()
+    if os.path.exists(os.path.join(next_dir, ENTRIES_NAME)):
+        print "finishing the swap of the build an earlier run completed"
+        swap_next()
+    elif os.path.isdir(next_dir):
+        shutil.rmtree(next_dir)
+    cache = buildcache.load(cache_path)
+    tasks = plan(kinds, cache, args.rehash)
+    print "%d sources hashed in %.1fs" % (len(cache['files']), time.time() - started)
+
+    stale = [task for task in tasks
+             if args.force or not buildcache.is_current(cache, task['task'], task['key'], build_dir)]
+    planned = set(task['task'] for task in tasks)
+    removed = [task for task in sorted(cache['tasks'])
+               if task.split('/')[0] in kinds and task not in planned]
+    if args.dry_run:
+        for task in stale:
+            print "%-36s %s" % (task['task'], 'forced' if args.force else stale_reason(cache, task))
+        for task in removed:
+            print "%-36s source removed" % task
+        print "%d of %d outputs are stale" % (len(stale), len(tasks))
+        return 0
+
+    # Leftovers of interrupted runs; a staged task whose key is still wanted
+    # is complete and is reused
+    keys = set(task['key'] for task in stale)
+    if os.path.isdir(staging_dir):
+        for entry in os.listdir(staging_dir):
+            if entry not in keys:
+                shutil.rmtree(os.path.join(staging_dir, entry))
+
+    # Longest first, going by the last build, so one slow task does not run alone at the end
+    stale.sort(key=lambda task: -cache['tasks'].get(task['task'], {}).get('seconds', 0))
+    jobs = []
+    for task in stale:
+        staging = os.path.join(staging_dir, task['key'])
+        if os.path.isdir(staging):
+            print "%-36s staged by an earlier run" % task['task']
+        else:
+            jobs.append((task['task'], task['kind'], task['name'], staging, args.verify))
+
+    built_at = time.time()
+    seconds = {}
+    failures = 0
+    for task, task_seconds, output, error in buildfiles.imap(run, jobs, args.processes):
+        seconds[task] = task_seconds
+        if error:
+            failures += 1
+            print "%-36s failed after %.1fs\n%s%s" % (task, task_seconds, output, error)
+        else:
+            print "%-36s %6.1fs" % (task, task_seconds)
+            if args.verbose and output:
+                print output.rstrip()
+    if jobs:
+        print "%d tasks in %.1fs on %d processes (%.1fs of work)" % (
+            len(jobs), time.time() - built_at, max(1, min(args.processes, len(jobs))), sum(seconds.values()))
+
+    if failures:
+        # The files hashed so far are still worth keeping
+        buildcache.save(cache_path, cache)
+        print "%d tasks failed, build/ was left as it was; the %d that succeeded stay staged in %s" % (
+            failures, len(jobs) - failures, staging_dir)
+        return 1
+
+    start_next()
+    model_index = precompressed.load_index(os.path.join(next_dir, 'models'))
+    for task in stale:
+        entry = {
+            'key': task['key'],
+            'sources': task['sources'],
+            'outputs': promote(task, os.path.join(staging_dir, task['key']), next_dir, model_index),
+        }
+        if task['task'] in seconds:
+            entry['seconds'] = round(seconds[task['task']], 2)
+        cache['tasks'][task['task']] = entry
+    for task in removed:
+        remove_outputs(next_dir, cache['tasks'].pop(task)['outputs'])
+        if task.startswith('models/'):
+            model_index['files'].pop(task.split('/', 1)[1] + meshes.FILE_SUFFIX, None)
+    if 'models' in kinds and (stale or removed):
+        buildfiles.write_file(
+            os.path.join(next_dir, 'models', precompressed.INDEX_NAME), precompressed.dumps(model_index))
+    print "%d of %d outputs rebuilt, %d removed" % (len(stale), len(tasks), len(removed))
+
+    # Steps over the whole of the next build/, each quick or incremental by itself
+    steps = []
+    archive_path = os.path.join(next_dir, os.path.basename(pack_sketches.archive_path))
+    sketches_changed = any(task['kind'] == 'sketches' for task in stale) or any(
+        task.startswith('sketches/') for task in removed)
+    if sketches_changed or not os.path.exists(archive.index_path(archive_path)):
+        steps.append(('pack_sketches.py', pack_sketches.main,
+                      ['--source', os.path.join(next_dir, 'sketches'), '--output', archive_path]))
+    if 'thumbnails' in kinds:
+        steps.append(('thumbnail index', lambda argv: write_thumbnail_index(next_dir), []))
+    steps.append(('compress_data.py', compress_data.main, ['--output', os.path.join(next_dir, 'data')]))
+    steps.append(('fingerprint_assets.py', fingerprint_assets.main,
+                  ['--build', next_dir, '--output', os.path.join(next_dir, os.path.basename(fingerprint_assets.manifest_path))]))
+    for name, step, step_argv in steps:
+        result, output, step_seconds, error = capture(step, step_argv)
+        if error or result:
+            print "%-36s failed after %.1fs\n%s%s" % (name, step_seconds, output, error or '')
+            print "build/ was left as it was; the rebuilt outputs stay staged in %s" % staging_dir
+            return 1
+        print "%-36s %6.1fs" % (name, step_seconds)
+        if args.verbose and output:
+            print output.rstrip()
+
+    sources = set()
+    for task in tasks:
+        sources.update(task['sources'])
+    cache['files'] = dict((path, entry) for path, entry in cache['files'].items() if path in sources)
+    buildcache.save(os.path.join(next_dir, buildcache.FILE_NAME), cache)
+
+    entries = sorted(entry for entry in os.listdir(next_dir) if not entry.startswith('.'))
+    buildfiles.write_file(os.path.join(next_dir, ENTRIES_NAME), json.dumps(entries))
+    swap_next()
+    if os.path.isdir(staging_dir):
+        shutil.rmtree(staging_dir)
+    print "built in %.1fs" % (time.time() - started)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
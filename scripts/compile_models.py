@@ -0,0 +1,105 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import gzip
+import os
+import sys
+from cStringIO import StringIO
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from udon import meshes, precompressed
+from udon.buildfiles import write_file
+
+
+models_dir = os.path.join(project_dir, 'data', 'models')
+build_dir = os.path.join(project_dir, 'build', 'models')
+
+
+def gzip_size(data):
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as out:
+        out.write(data)
+    return len(buf.getvalue())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compile the OBJ models in data/models into indexed binary meshes.")
+    parser.add_argument('--source', default=models_dir, help="directory of OBJ files")
+    parser.add_argument('--output', default=build_dir, help="directory to write the .mesh files to")
+    parser.add_argument('--quantize', action='store_true', help="store normals as bytes and texture coordinates as 16 bit integers")
+    parser.add_argument('--verify', action='store_true', help="check every triangle of each mesh against its OBJ")
+    parser.add_argument('models', nargs='*', help="models to compile, e.g. HMD (default: all)")
+    args = parser.parse_args(argv)
+
+    names = args.models or sorted(
+        os.path.splitext(file_name)[0]
+        for file_name in os.listdir(args.source)
+        if file_name.endswith('.obj')
+    )
+
+    # gzip and brotli variants for udon.views.model_file, as compress_data.py
+    # writes for data/
+    index = precompressed.load_index(args.output)
+    failures = 0
+    totals = [0, 0, 0, 0]
+    print "%-18s %9s %9s %9s  %10s %10s %10s %10s" % (
+        'model', 'v', 'vertices', 'indices', 'obj', 'obj gzip', 'mesh', 'mesh gzip')
+    for name in names:
+        with open(os.path.join(args.source, name + '.obj'), 'rb') as obj_file:
+            text = obj_file.read()
+        try:
+            data = meshes.compile_obj(text, quantize=args.quantize)
+        except meshes.MeshError as e:
+            print "%s: %s" % (name, e)
+            failures += 1
+            continue
+
+        if args.verify:
+            problems = meshes.verify(text, data)
+            for problem in problems:
+                print "%s: %s" % (name, problem)
+            if problems:
+                failures += 1
+                continue
+
+        path = name + meshes.FILE_SUFFIX
+        write_file(os.path.join(args.output, path), data)
+        entry, variants = precompressed.compress_file(data)
+        for encoding, compressed in variants.items():
+            write_file(os.path.join(args.output, precompressed.variant_name(path, encoding)), compressed)
+        index['files'][path] = entry
+
+        header = meshes.decode_mesh(data)
+        sizes = [len(text), gzip_size(text), len(data), entry['encodings'].get('gzip', len(data))]
+        totals = [total + size for total, size in zip(totals, sizes)]
+        print "%-18s %9d %9d %9d  %10d %10d %10d %10d" % tuple(
+            [name, text.count('\nv '), header['vertex_count'], header['index_count']] + sizes)
+
+    write_file(os.path.join(args.output, precompressed.INDEX_NAME), precompressed.dumps(index))
+
+    if totals[0]:
+        print "%-18s %29s  %10d %10d %10d %10d" % tuple(['total', ''] + totals)
+        print "%d bytes saved (%.1f%%), %d gzipped (%.1f%%)" % (
+            totals[0] - totals[2], 100.0 * (totals[0] - totals[2]) / totals[0],
+            totals[1] - totals[3], 100.0 * (totals[1] - totals[3]) / totals[1])
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import json
+import os
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from download_videos import videos_dir
+from udon import bundles, chunks, fingerprint, lod, sketches, sketchformat, snapshots, spatial, timeline
+from udon.buildfiles import write_file
+
+
+data_dir = os.path.join(project_dir, 'data', 'sketches')
+build_dir = os.path.join(project_dir, 'build', 'sketches')
+manifest_path = os.path.join(project_dir, 'build', 'fingerprints.json')
+
+
+def compile_actions(sketch, sources, args):
+    compiled = sketchformat.compile_actions(sources['actions'])
+    if args.verify and sketchformat.decode_actions(compiled) != sources['actions']:
+        raise sketchformat.FormatError("round trip does not match the source")
+    return {'actions.bin': compiled}
+
+
+def compile_input(sketch, sources, args):
+    compiled = sketchformat.compile_input(sources['input'], args.quantize_input)
+    if args.verify:
+        header, _ = sketchformat.read_container(compiled, sketchformat.INPUT_MAGIC)
+        decoded = sketchformat.decode_input(compiled)
+        if len(decoded) != len(sources['input']) or any(
+                abs(a - b) > header['max_error'] for a, b in zip(decoded, sources['input'])):
+            raise sketchformat.FormatError("round trip does not match the source")
+    return {'input.bin': compiled}
+
+
+def compile_chunks(sketch, sources, args):
+    # indexes byte ranges of the source files, so they are read as text
+    return chunks.build_chunks(os.path.join(data_dir, sketch), args.chunk_window)
+
+
+def compile_snapshots(sketch, sources, args):
+    result = snapshots.build_snapshots(sources['actions'], args.snapshot_interval)
+    if args.verify:
+        for time in xrange(-1, result['duration'] + args.snapshot_interval, 997):
+            expected = set(
+                stroke[0] for stroke in result['strokes']
+                if stroke[2] <= time and (stroke[4] is None or stroke[4] > time)
+            )
+            if snapshots.live_at(result, time) != expected:
+                raise sketchformat.FormatError("snapshot at %dms does not match a full replay" % time)
+    return {snapshots.FILE_NAME: snapshots.dumps(result)}
+
+
+def compile_lod(sketch, sources, args):
+    files, reports = lod.build_levels(sources['actions'])
+    for level, report in sorted(reports.items()):
+        print "%-36s %10d -> %9d points (%.1f%%), max error %.4f" % (
+            'lod%d' % level, report['source_points'], report['points'],
+            100.0 * report['points'] / max(report['source_points'], 1), report['max_error'])
+    return files
+
+
+def compile_spatial(sketch, sources, args):
+    if sketches.np is None:
+        print "%s (spatial): skipped, numpy is not installed" % sketch
+        return {}
+    loaded = sketches.Sketch(sketch, data_dir)
+    index = spatial.build_index(loaded, args.chunk_window)
+    if args.verify:
+        failures = spatial.verify(index, loaded)
+        if failures:
+            raise sketchformat.FormatError("%d queries differ from brute force, e.g. %r" % (len(failures), failures[0]))
+    print "%-36s %10d strokes, %5d nodes" % ('spatial', len(index['strokes']['id']), len(index['bvh']))
+    return {spatial.FILE_NAME: spatial.dumps(index)}
+
+
+def compile_bundle(sketch, sources, args):
+    # runs last so that the sizes of this run's outputs are the ones listed
+    manifest = fingerprint.load_manifest(manifest_path) if os.path.exists(manifest_path) else None
+    bundle = bundles.build_bundle(sketch, data_dir, args.output, manifest, videos_dir)
+    if args.verify:
+        timeline.verify(bundle['timeline'])
+    if bundle['timeline']:
+        for i, table in enumerate(bundle['timeline']['edits']):
+            print "%-36s %10d segments, %.1fs of video" % (
+                'edit %d' % i, len(table['video']), sum(end - start for start, end in table['video']))
+        if bundle['timeline']['drift'] is not None:
+            print "%-36s %10.0fms from offsets.time, %s" % (
+                'playback', bundle['timeline']['drift'],
+                'played through the edit' if bundle['timeline']['playback'] else 'played with offsets.time')
+    return {bundles.FILE_NAME: bundles.dumps(bundle)}
+
+
+# (stage name, source files it needs at least one of, compiler)
+STAGES = [
+    ('actions', ['actions'], compile_actions),
+    ('input', ['input'], compile_input),
+    ('chunks', ['actions', 'input'], compile_chunks),
+    ('snapshots', ['actions'], compile_snapshots),
+    ('lod', ['actions'], compile_lod),
+    ('spatial', ['actions'], compile_spatial),
+    ('bundle', ['meta'], compile_bundle),
+]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compile data/sketches into the derived files served from build/sketches.")
+    parser.add_argument('--sketch', action='append', help="only compile this sketch (repeatable)")
+    parser.add_argument('--stage', action='append', choices=[name for name, _, _ in STAGES], help="only run this stage (repeatable)")
+    parser.add_argument('--output', default=build_dir, help="directory to write compiled sketches to")
+    parser.add_argument('--verify', action='store_true', help="decode each file again and compare it to the source")
+    parser.add_argument('--quantize-input', action='store_true', help="store input frames as 16 bit integers")
+    parser.add_argument('--chunk-window', type=int, default=chunks.DEFAULT_WINDOW, help="chunk length in milliseconds")
+    parser.add_argument('--snapshot-interval', type=int, default=snapshots.DEFAULT_INTERVAL, help="time between keyframes in milliseconds")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    totals = {}
+    for sketch in sorted(os.listdir(data_dir)):
+        if args.sketch and sketch not in args.sketch:
+            continue
+
+        sources = {}
+        source_sizes = {}
+        for name in ('actions', 'input', 'meta'):
+            source_path = os.path.join(data_dir, sketch, name + '.json')
+            if os.path.exists(source_path):
+                sources[name] = json.loads(open(source_path, 'rb').read())
+                source_sizes[name] = os.path.getsize(source_path)
+
+        for stage, needs, compiler in STAGES:
+            if args.stage and stage not in args.stage:
+                continue
+            if not any(name in sources for name in needs):
+                continue
+
+            try:
+                outputs = compiler(sketch, sources, args)
+            except (sketchformat.FormatError, timeline.TimelineError), e:
+                print "%s (%s): %s" % (sketch, stage, e)
+                failed += 1
+                continue
+
+            for file_name, data in sorted(outputs.items()):
+                write_file(os.path.join(args.output, sketch, file_name), data)
+
+            source_size = sum(source_sizes.get(name, 0) for name in needs)
+            output_size = sum(len(data) for data in outputs.values())
+            total = totals.setdefault(stage, [0, 0])
+            total[0] += source_size
+            total[1] += output_size
+            print "%-36s %10d -> %9d bytes (%.1f%%)" % (
+                '%s/%s' % (sketch, stage), source_size, output_size, 100.0 * output_size / source_size)
+
+    for stage, (source_size, output_size) in sorted(totals.items()):
+        if source_size:
+            print "%-36s %10d -> %9d bytes (%.1f%%)" % (
+                'total ' + stage, source_size, output_size, 100.0 * output_size / source_size)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import hashlib
+import os
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from udon import precompressed
+from udon.buildfiles import write_file
+
+
+data_dir = os.path.join(project_dir, 'data')
+build_dir = os.path.join(project_dir, 'build', 'data')
+
+
+def is_current(entry, data, output, path):
+    """True if the variants from a previous run still match the source."""
+    if entry is None or entry['sha1'] != hashlib.sha1(data).hexdigest():
+        return False
+    # e.g. brotli has been installed since the last run
+    tried = set(entry['encodings']) | set(entry.get('incompressible', ()))
+    if set(precompressed.available_encodings()) - tried:
+        return False
+    return all(
+        os.path.exists(os.path.join(output, precompressed.variant_name(path, encoding)))
+        for encoding in entry['encodings']
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Write gzip and brotli variants of the JSON and OBJ files in data/.")
+    parser.add_argument('--source', default=data_dir, help="directory to compress")
+    parser.add_argument('--output', default=build_dir, help="directory to write the variants and index to")
+    parser.add_argument('--force', action='store_true', help="recompress files that have not changed")
+    args = parser.parse_args(argv)
+
+    if precompressed.brotli is None:
+        print "brotli is not installed, only writing gzip variants (pip install brotli)"
+
+    encodings = [encoding for encoding, _ in precompressed.SUFFIXES
+                 if encoding in precompressed.available_encodings()]
+    previous = {} if args.force else precompressed.load_index(args.output)['files']
+    index = {'version': precompressed.VERSION, 'files': {}}
+    totals = {}
+    source_total = 0
+
+    for path in precompressed.find_sources(args.source):
+        with open(os.path.join(args.source, path), 'rb') as source_file:
+            data = source_file.read()
+
+        entry = previous.get(path)
+        if is_current(entry, data, args.output, path):
+            index['files'][path] = entry
+        else:
+            entry, variants = precompressed.compress_file(data)
+            for encoding, compressed in variants.items():
+                write_file(os.path.join(args.output, precompressed.variant_name(path, encoding)), compressed)
+            index['files'][path] = entry
+
+        source_total += entry['size']
+        ratios = []
+        for encoding in encodings:
+            size = entry['encodings'].get(encoding, entry['size'])
+            totals[encoding] = totals.get(encoding, 0) + size
+            ratios.append('%s %5.1f%%' % (encoding, 100.0 * size / max(entry['size'], 1)))
+        print "%-52s %10d bytes  %s" % (path, entry['size'], '  '.join(ratios))
+
+    write_file(os.path.join(args.output, precompressed.INDEX_NAME), precompressed.dumps(index))
+
+    for encoding in encodings:
+        if source_total:
+            print "%-52s %10d -> %10d bytes (%.1f%%)" % (
+                'total ' + encoding, source_total, totals[encoding], 100.0 * totals[encoding] / source_total)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -16,4 +16,5 @@
  * limitations under the License.
 """
 gulp build
+python ./scripts/build_assets.py || exit 1
 ./sitepackages/google_appengine/appcfg.py update ./
@@ -14,10 +14,16 @@
  * See the License for the specific language governing permissions and
  * limitations under the License.
 """
-import os
+import argparse
+import httplib
 import json
-import urllib2
+import os
+import Queue
 import sys
+import threading
+import time
+import urllib
+import urlparse
 
 
 remote_url = 'https://storage.googleapis.com/udon-media-usa/'
@@ -26,18 +32,20 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 videos_dir = os.path.join(script_dir, 'videos')
 
 resolutions = ['1024_848', '512_424', '256_212']
-
-if not os.path.exists(videos_dir):
-    os.makedirs(videos_dir)
-
+codecs = ['mp4', 'webm']
 
 data_dir = os.path.join(script_dir, '..', 'data', 'sketches')
 
+CHUNK_SIZE = 64 * 1024
+
 
-def gather_paths():
+def gather_paths(base_url=remote_url, sketches=None, resolutions=resolutions, codecs=codecs):
     paths = []
 
-    for dir in os.listdir(data_dir):
+    for dir in sorted(os.listdir(data_dir)):
+        if sketches and dir not in sketches:
+            continue
+
         try:
             meta_file = open(os.path.join(data_dir, dir, 'meta.json'), 'r')
         except IOError:
@@ -46,38 +54,240 @@ def gather_paths():
         meta_json = json.loads(meta_file.read())
         try:
             for res in resolutions:
-                for ext in ['mp4', 'webm']:
-                    source = remote_url + meta_json['video']['source'] + '/%s/video.%s' % (res, ext)
+                for ext in codecs:
+                    source = base_url + meta_json['video']['source'] + '/%s/video.%s' % (res, ext)
                     paths.append(source)
 
         except KeyError:
             continue
 
-    return paths
+    # several sketches share a video
+    return sorted(set(paths))
+
+
+class ConnectionPool(object):
+    """Keeps up to `size` persistent connections open to a single host."""
+
+    def __init__(self, scheme, netloc, size):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.connections = Queue.Queue()
+        self.semaphore = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.netloc, timeout=60)
+        return httplib.HTTPConnection(self.netloc, timeout=60)
+
+    def request(self, method, path, headers, handle):
+        """Calls handle(response) with a response for the request, retrying
+        once on a fresh connection if a kept-alive one has gone stale.
+        """
+        with self.semaphore:
+            try:
+                connection = self.connections.get_nowait()
+            except Queue.Empty:
+                connection = self._connect()
+
+            for attempt in range(2):
+                try:
+                    connection.request(method, path, headers=headers)
+                    response = connection.getresponse()
+                    break
+                except (httplib.HTTPException, IOError):
+                    connection.close()
+                    if attempt:
+                        raise
+                    connection = self._connect()
+
+            try:
+                result = handle(response)
+                # The body must be fully read before the connection is reused
+                response.read()
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.connections.put(connection)
+            return result
+
+
+class Downloader(object):
+
+    def __init__(self, output_dir, workers, base_url=remote_url):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.base_path = urlparse.urlsplit(base_url).path
+        self.pools = {}
+        self.pools_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {'downloaded': 0, 'resumed': 0, 'skipped': 0, 'missing': 0, 'failed': 0, 'bytes': 0}
+
+    def pool_for(self, url):
+        parts = urlparse.urlsplit(url)
+        with self.pools_lock:
+            key = (parts.scheme, parts.netloc)
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(parts.scheme, parts.netloc, self.workers)
+            return self.pools[key]
+
+    def local_path(self, url):
+        """Where a URL under the base URL is downloaded to: its path relative
+        to the base URL's, under the output directory.
+        """
+        path = urlparse.urlsplit(url).path
+        if not path.startswith(self.base_path):
+            raise ValueError("%s is not under %s" % (url, self.base_path))
+        return os.path.join(self.output_dir, *urllib.unquote(path[len(self.base_path):]).split('/'))
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def download(self, url):
+        parts = urlparse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        pool = self.pool_for(url)
+
+        target = self.local_path(url)
+        partial = target + '.part'
+        etag_file = target + '.etag'
+
+        head = pool.request('HEAD', path, {}, lambda response: (
+            response.status, response.getheader('content-length'), response.getheader('etag')
+        ))
+        status, length, etag = head
+        if status == 404:
+            print "File %s not found" % url
+            self.count('missing')
+            return
+        if status >= 300:
+            raise IOError("HEAD %s returned %d" % (url, status))
+        length = int(length) if length is not None else None
+
+        if os.path.exists(target) and os.path.getsize(target) == length:
+            stored_etag = open(etag_file).read().strip() if os.path.exists(etag_file) else None
+            if etag is None or stored_etag is None or stored_etag == etag:
+                self.count('skipped')
+                return
+
+        if not os.path.exists(os.path.dirname(target)):
+            try:
+                os.makedirs(os.path.dirname(target))
+            except OSError:
+                pass  # another worker got there first
+
+        # Resume a partial download only if it belongs to the same version
+        offset = 0
+        if os.path.exists(partial) and os.path.exists(partial + '.etag'):
+            if open(partial + '.etag').read().strip() == (etag or ''):
+                offset = os.path.getsize(partial)
+        with open(partial + '.etag', 'w') as partial_etag:
+            partial_etag.write(etag or '')
+
+        headers = {}
+        if offset and (length is None or offset < length):
+            headers['Range'] = 'bytes=%d-' % offset
+            if etag:
+                headers['If-Range'] = etag
+        else:
+            offset = 0
+
+        def write(response):
+            if response.status == 206:
+                # Only append if the server resumed where the partial file ends
+                content_range = response.getheader('content-range') or ''
+                if not content_range.startswith('bytes %d-' % offset):
+                    os.remove(partial)
+                    raise IOError("GET %s returned %r for a range from %d" % (url, content_range, offset))
+                mode = 'ab'
+                self.count('resumed')
+            elif response.status == 200:
+                mode = 'wb'
+            else:
+                raise IOError("GET %s returned %d" % (url, response.status))
+
+            with open(partial, mode) as local_file:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    local_file.write(chunk)
+                    self.count('bytes', len(chunk))
+
+        print "Downloading %s..." % url
+        pool.request('GET', path, headers, write)
+
+        if length is not None and os.path.getsize(partial) != length:
+            raise IOError("%s is %d bytes, expected %d" % (url, os.path.getsize(partial), length))
+
+        # os.rename won't replace an existing file on Windows
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(partial, target)
+        os.remove(partial + '.etag')
+        with open(etag_file, 'w') as local_etag:
+            local_etag.write(etag or '')
+
+        print "Download complete. Written to %s" % target
+        self.count('downloaded')
+
+    def worker(self, queue):
+        while True:
+            try:
+                url = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                self.download(url)
+            except Exception, e:
+                print "Failed to download %s: %s" % (url, e)
+                self.count('failed')
+
+    def run(self, urls):
+        queue = Queue.Queue()
+        for url in urls:
+            queue.put(url)
+
+        threads = [threading.Thread(target=self.worker, args=(queue,)) for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # join with a timeout so Ctrl-C still gets through
+            while thread.is_alive():
+                thread.join(1)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Download the session videos into scripts/videos.")
+    parser.add_argument('--remote-url', default=remote_url, help="base URL to download from")
+    parser.add_argument('--output', default=videos_dir, help="directory to write videos to")
+    parser.add_argument('--sketch', action='append', help="only download videos for this sketch (repeatable)")
+    parser.add_argument('--resolution', action='append', choices=resolutions, help="only this resolution (repeatable)")
+    parser.add_argument('--codec', action='append', choices=codecs, help="only this codec (repeatable)")
+    parser.add_argument('--workers', type=int, default=4, help="number of concurrent downloads")
+    args = parser.parse_args(argv)
 
+    base_url = args.remote_url if args.remote_url.endswith('/') else args.remote_url + '/'
+    urls = gather_paths(base_url, args.sketch, args.resolution or resolutions, args.codec or codecs)
 
-for remote_path in gather_paths():
-    path = remote_path[remote_path.find('videos'):]
-    dir_path, _, file_name = path.rpartition('/')
-    local_video_path = os.path.join(videos_dir, dir_path.strip(os.sep))
-    if not os.path.exists(local_video_path):
-        os.makedirs(local_video_path)
+    downloader = Downloader(args.output, max(args.workers, 1), base_url)
+    start = time.time()
+    downloader.run(urls)
+    elapsed = time.time() - start
 
-    print "Downloading %s..." % remote_path
-    try:
-        remote_file = urllib2.urlopen(remote_path)
-    except urllib2.HTTPError, e:
-        print "File %s not found" % remote_path
-        continue
+    stats = downloader.stats
+    megabytes = stats['bytes'] / (1024.0 * 1024.0)
+    print
+    print "%d files: %d downloaded (%d resumed), %d up to date, %d not found, %d failed" % (
+        len(urls), stats['downloaded'], stats['resumed'], stats['skipped'], stats['missing'], stats['failed'])
+    print "%.1f MB in %.1fs (%.2f MB/s)" % (megabytes, elapsed, megabytes / elapsed if elapsed else 0)
 
+    return 1 if stats['failed'] else 0
 
-    local_video_path_parts = local_video_path.split('/')
-    local_video_path = os.path.join(*local_video_path_parts)
-    local_video_path_full = os.path.join(local_video_path, file_name)
 
-    if not sys.platform.startswith('win'):
-        local_video_path_full = os.sep + local_video_path_full
-    print "Download complete. Writing to %s" % local_video_path_full
-    local_file = open(local_video_path_full, 'wb+')
-    local_file.write(remote_file.read())
-    local_file.close()
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Moves the moov box of every MP4 under scripts/videos/ in front of its media
+data, checks the rewritten file against the original and writes a
+<name>.keyframes.json index next to each video. With --upload, the videos
+and indexes that differ from the bucket's are then copied into it.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import urlparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from download_videos import remote_url, videos_dir
+from udon import mp4
+from udon.buildfiles import write_file
+
+
+bucket_url = 'gs://' + urlparse.urlsplit(remote_url).path.strip('/')
+# Only the MP4s and their indexes are uploaded; WebM files, partial
+# downloads and temporary files stay local
+UPLOAD_EXCLUDE = r'^(?!.*\.(mp4|keyframes\.json)$).*'
+
+
+def find_videos(root):
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith('.mp4'):
+                yield os.path.join(dir_path, file_name)
+
+
+def faststart(path):
+    """Rewrites path in place with moov first. The original is only replaced
+    once the rewritten copy has been verified.
+    """
+    tmp_path = path + '.faststart.tmp'
+    try:
+        mp4.faststart(path, tmp_path)
+        mp4.verify_faststart(path, tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def is_current(index_path, path):
+    return (
+        os.path.exists(index_path) and
+        os.path.getmtime(index_path) >= os.path.getmtime(path)
+    )
+
+
+def upload(videos, bucket):
+    """Copies the files under videos that are missing from the bucket or
+    whose checksums differ, with gsutil. Returns its exit status.
+    """
+    command = ['gsutil', '-m', 'rsync', '-r', '-c', '-x', UPLOAD_EXCLUDE, videos, bucket]
+    print ' '.join(command)
+    try:
+        return subprocess.call(command)
+    except OSError:
+        print "gsutil is not installed (https://cloud.google.com/storage/docs/gsutil_install)"
+        return 1
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fast-start the MP4 videos and index their keyframes.")
+    parser.add_argument('--videos', default=videos_dir, help="directory to look for videos in")
+    parser.add_argument('--check', action='store_true', help="only report, exit with status 1 if any video needs rewriting")
+    parser.add_argument('--force', action='store_true', help="rewrite indexes that are up to date")
+    parser.add_argument('--upload', action='store_true', help="copy the rewritten videos and their indexes to the bucket")
+    parser.add_argument('--bucket', default=bucket_url, help="bucket to upload to")
+    args = parser.parse_args(argv)
+
+    pending = 0
+    failed = 0
+    for path in find_videos(args.videos):
+        name = os.path.relpath(path, args.videos)
+        try:
+            needs_faststart = mp4.needs_faststart(mp4.top_level(path))
+        except mp4.MP4Error as e:
+            print "%-52s %s" % (name, e)
+            failed += 1
+            continue
+
+        index_path = path + mp4.INDEX_SUFFIX
+        if args.check:
+            stale = not is_current(index_path, path)
+            if needs_faststart or stale:
+                pending += 1
+            print "%-52s %s%s" % (
+                name, 'moov at the end' if needs_faststart else 'fast start',
+                ', index out of date' if stale else '')
+            continue
+
+        try:
+            if needs_faststart:
+                faststart(path)
+            if args.force or needs_faststart or not is_current(index_path, path):
+                write_file(index_path, mp4.dumps(mp4.build_index(path)))
+        except (mp4.MP4Error, IOError, OSError) as e:
+            print "%-52s failed: %s" % (name, e)
+            failed += 1
+            continue
+
+        index = mp4.load_index(index_path)
+        frames = index['keyframes']
+        gop = index['size'] / max(len(frames), 1)
+        print "%-52s %s, %4d keyframes, %8d bytes between them" % (
+            name, 'rewritten' if needs_faststart else 'already fast start', len(frames), gop)
+
+    if failed or pending:
+        return 1
+    if args.upload:
+        return upload(args.videos, args.bucket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
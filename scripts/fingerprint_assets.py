@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from download_videos import gather_paths, videos_dir
+from udon import fingerprint, meshes
+from udon.buildfiles import write_file
+
+
+data_dir = os.path.join(project_dir, 'data')
+build_dir = os.path.join(project_dir, 'build')
+manifest_path = os.path.join(project_dir, 'build', 'fingerprints.json')
+
+# The compiled files udon.views.sketch_asset and sketch_bundle serve from build/sketches
+SKETCH_ASSET_RE = re.compile(r'^([\w.-]+\.bin|snapshots\.json|spatial\.json|actions\.lod\d\.json|bundle\.json)$')
+
+
+def walk(root):
+    """Yields the paths of the files under root, relative to it, in order."""
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            yield os.path.relpath(os.path.join(dir_path, file_name), root).replace(os.sep, '/')
+
+
+def video_sources(sketches_dir):
+    sources = {}
+    for sketch in sorted(os.listdir(sketches_dir)):
+        meta_path = os.path.join(sketches_dir, sketch, 'meta.json')
+        if not os.path.exists(meta_path):
+            continue
+        meta = json.loads(open(meta_path, 'rb').read())
+        if 'video' in meta:
+            sources[sketch] = meta['video']['source']
+    return sources
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Hash data/, build/sketches, build/models, build/thumbnails and the session videos into a manifest of fingerprinted URLs.")
+    parser.add_argument('--videos', default=videos_dir, help="directory the videos were downloaded to")
+    parser.add_argument('--build', default=build_dir, help="directory with the compiled sketches/, models/ and thumbnails/")
+    parser.add_argument('--output', default=manifest_path, help="manifest to write")
+    parser.add_argument('--force', action='store_true', help="rehash files even if their size and mtime are unchanged")
+    args = parser.parse_args(argv)
+
+    previous = {} if args.force else fingerprint.load_manifest(args.output)['files']
+    manifest = {
+        'version': fingerprint.VERSION,
+        'files': {},
+        'videos': video_sources(os.path.join(data_dir, 'sketches')),
+    }
+
+    sketch_build_dir = os.path.join(args.build, 'sketches')
+    model_build_dir = os.path.join(args.build, 'models')
+    thumbnail_build_dir = os.path.join(args.build, 'thumbnails')
+
+    def add(url, path):
+        manifest['files'][url] = fingerprint.fingerprint_file(path, previous.get(url))
+
+    for path in walk(data_dir):
+        add('/data/' + path, os.path.join(data_dir, path))
+
+    if os.path.isdir(sketch_build_dir):
+        for path in walk(sketch_build_dir):
+            if SKETCH_ASSET_RE.match(os.path.basename(path)):
+                add('/data/sketches/' + path, os.path.join(sketch_build_dir, path))
+
+    if os.path.isdir(model_build_dir):
+        for path in walk(model_build_dir):
+            if path.endswith(meshes.FILE_SUFFIX):
+                add('/data/models/' + path, os.path.join(model_build_dir, path))
+
+    if os.path.isdir(thumbnail_build_dir):
+        for path in walk(thumbnail_build_dir):
+            if not path.endswith('.tmp'):
+                add('/data/thumbnails/' + path, os.path.join(thumbnail_build_dir, path))
+
+    missing = 0
+    for path in gather_paths(base_url=''):
+        local_path = os.path.join(args.videos, *path.split('/'))
+        if os.path.exists(local_path):
+            add('/serve-file/' + path + '/', local_path)
+        else:
+            missing += 1
+
+    write_file(args.output, fingerprint.dumps(manifest))
+
+    print "%d files fingerprinted into %s" % (len(manifest['files']), args.output)
+    if missing:
+        print "%d videos are not in %s and keep their plain URLs (run download_videos.py)" % (missing, args.videos)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
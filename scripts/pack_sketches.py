@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from udon import archive
+from udon.buildfiles import write_file
+
+
+build_dir = os.path.join(project_dir, 'build', 'sketches')
+archive_path = os.path.join(project_dir, 'build', 'sketches.pack')
+
+# What udon.views.sketch_asset, sketch_bundle, sketch_strokes and
+# sketch_chunks read from the archive; anything else in build/sketches is
+# left out
+PACKED_RE = re.compile(r'^([\w.-]+\.bin|snapshots\.json|spatial\.json|chunks\.json|actions\.lod\d\.json|bundle\.json)$')
+
+
+def find_sources(root):
+    """Returns {'<sketch>/<file>': path} for every file under root that the
+    app serves from the archive.
+    """
+    sources = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            if not PACKED_RE.match(file_name):
+                continue
+            path = os.path.join(dir_path, file_name)
+            sources[os.path.relpath(path, root).replace(os.sep, '/')] = path
+    return sources
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Pack the served files in build/sketches into the segments of an archive for udon.archive.")
+    parser.add_argument('--source', default=build_dir, help="directory to pack")
+    parser.add_argument('--output', default=archive_path, help="archive to write, as <output>.0, <output>.1, ...; its index is written next to it")
+    parser.add_argument('--verify-only', action='store_true', help="compare an existing archive with the source files")
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.source)
+    if args.verify_only:
+        with open(archive.index_path(args.output), 'rb') as index_file:
+            index = json.loads(index_file.read())
+    else:
+        if not os.path.exists(os.path.dirname(args.output)):
+            os.makedirs(os.path.dirname(args.output))
+        index = archive.pack(sources, args.output)
+        write_file(archive.index_path(args.output), archive.dumps(index))
+
+    problems = archive.verify(args.output, index, sources)
+    for name, problem in problems:
+        print "%s %s" % (name, problem)
+
+    total = sum(entry['length'] for entry in index['files'].values())
+    size = sum(index['segments'])
+    print "%d files, %d bytes in %d segments of %d bytes at most (%d bytes of padding)%s" % (
+        len(index['files']), total, len(index['segments']), max(index['segments'] or [0]), size - total,
+        ", %d problems" % len(problems) if problems else ", verified")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
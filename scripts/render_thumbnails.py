@@ -0,0 +1,132 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.dirname(script_dir)
+sys.path.insert(0, project_dir)
+
+from udon import sketches, thumbnails
+from udon.buildfiles import imap, write_file
+
+
+data_path = os.path.join(project_dir, 'data.json')
+sketches_dir = os.path.join(project_dir, 'data', 'sketches')
+build_dir = os.path.join(project_dir, 'build', 'thumbnails')
+index_path = os.path.join(project_dir, 'build', 'thumbnails.json')
+
+
+def output_paths(output, name, image_formats):
+    return [
+        os.path.join(output, name, thumbnails.file_name(width, image_format))
+        for width, _ in thumbnails.SIZES
+        for image_format in image_formats
+    ]
+
+
+def is_current(source, output, name, image_formats):
+    """True if every thumbnail of a sketch is newer than its actions.json."""
+    try:
+        source_mtime = os.stat(os.path.join(source, name, 'actions.json')).st_mtime
+        return all(os.stat(path).st_mtime >= source_mtime for path in output_paths(output, name, image_formats))
+    except OSError:
+        return False
+
+
+def render(job):
+    """Renders one sketch in a worker process; returns (name, seconds,
+    bytes written, error).
+    """
+    name, source, output, image_formats = job
+    started = time.time()
+    try:
+        images = thumbnails.render_sketch(sketches.Sketch(name, source), image_formats=image_formats)
+        for (width, image_format), data in images.items():
+            write_file(os.path.join(output, name, thumbnails.file_name(width, image_format)), data)
+        return name, time.time() - started, sum(len(data) for data in images.values()), None
+    except Exception:
+        return name, time.time() - started, 0, traceback.format_exc()
+
+
+def session_sketches(data):
+    return [
+        session['sketch']
+        for artist in data['artists']
+        for session in artist['sessions']
+    ]
+
+
+def write_index(output, path):
+    """Lists the thumbnails under output in the index at path; returns the
+    number of sketches in it.
+    """
+    index = thumbnails.build_index(output)
+    write_file(path, thumbnails.dumps_index(index))
+    return len(index)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Render preview images of the sessions in data.json and list them in the thumbnail index.")
+    parser.add_argument('--source', default=sketches_dir, help="directory of sketches")
+    parser.add_argument('--output', default=build_dir, help="directory to write the thumbnails to")
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help="sketches rendered at once")
+    parser.add_argument('--force', action='store_true', help="render sketches whose thumbnails are newer than their actions.json")
+    parser.add_argument('--index', default=index_path, help="thumbnail index to write")
+    parser.add_argument('sketches', nargs='*', help="sketches to render (default: every session in data.json)")
+    args = parser.parse_args(argv)
+
+    with open(data_path, 'rb') as data_file:
+        data = json.loads(data_file.read())
+
+    image_formats = thumbnails.formats()
+    if 'webp' not in image_formats:
+        print "Pillow is not installed, only writing PNG thumbnails (pip install pillow)"
+
+    names = []
+    for name in args.sketches or session_sketches(data):
+        if name in names:
+            continue
+        if not os.path.exists(os.path.join(args.source, name, 'actions.json')):
+            print "%-28s no actions.json, skipped" % name
+        elif not args.force and is_current(args.source, args.output, name, image_formats):
+            print "%-28s up to date" % name
+        else:
+            names.append(name)
+
+    started = time.time()
+    jobs = [(name, args.source, args.output, image_formats) for name in names]
+    failures = 0
+    for name, seconds, size, error in imap(render, jobs, args.processes):
+        if error:
+            failures += 1
+            print "%-28s failed after %.1fs\n%s" % (name, seconds, error)
+        else:
+            print "%-28s %6.1fs %9d bytes" % (name, seconds, size)
+    if names:
+        print "%d sketches in %.1fs on %d processes" % (len(names), time.time() - started, max(1, min(args.processes, len(jobs))))
+
+    print "%d sketches in %s" % (write_index(args.output, args.index), args.index)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
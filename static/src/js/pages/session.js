@@ -78,7 +78,7 @@ function init(options) {
     $enterFullscreen.hide();
   }
 
-  viewer.load(options.sessionSlug).then(sketch => {
+  viewer.load(options.sessionSlug, options.assets).then(sketch => {
     const now = new Date().getTime();
     const loadEndTime = now - loadStartTime;
 
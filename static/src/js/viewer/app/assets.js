@@ -0,0 +1,28 @@
+/**
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+//  content-hashed urls for the session's data, models and videos, given to
+//  the page by Django (see udon/fingerprint.py); anything not listed is
+//  loaded from its plain url
+let urls = {};
+
+export function register( assets ){
+  urls = assets || {};
+}
+
+export function url( path ){
+  return urls[ path ] || path;
+}
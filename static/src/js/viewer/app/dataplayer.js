@@ -14,8 +14,15 @@
  * limitations under the License.
  */
  import * as Signal from './signal';
+import * as Timeline from './timeline';
 
-export function create( start, end, offsets ){
+//  the data is offsets.time behind the video. playback (optional) is the
+//  compiled playback mapping of the session's timeline, which
+//  udon/timeline.py only sets when its edit agrees with offsets.time.
+//  Playing, seeking and getTimeAtRatio all go through the same mapping.
+export function create( start, end, offsets, playback ){
+
+  const mapping = Timeline.create( playback, offsets );
 
   const onTick = Signal.create();
   const onSeek = Signal.create();
@@ -53,7 +60,7 @@ export function create( start, end, offsets ){
     else{
       time = curTime;
     }
-    return ( curTime - offsets.time ) * 1000.0;
+    return mapping.videoToData( curTime );
   }
 
   function update( t ){
@@ -77,7 +84,7 @@ export function create( start, end, offsets ){
   }
 
   function getTimeAtRatio( ratio ){
-    return ( ( duration / 1000.0 * ratio ) - offsets.time ) * 1000.0
+    return mapping.videoToData( duration / 1000.0 * ratio );
   }
 
   function bindEvents( { onTick: bTick, onSeek: bSeek } = {} ){
@@ -18,6 +18,7 @@ import $ from 'jquery';
 import R from 'ramda';
 
 import * as Loader from './loader';
+import * as Assets from './assets';
 import * as Signal from './signal';
 
 const BG_COLOR = 0x000000;
@@ -45,11 +46,13 @@ export function create( {
   const events = createSignals();
 
   let sketch;
-  function load( sketchName ){
+  function load( sketchName, assets ){
 
     //  unload in case another sketch is here
     unload();
 
+    Assets.register( assets );
+
     console.log( 'loading', sketchName );
     return new Promise( function( resolve, reject ){
       sketch = configuredLoader( events, sketchName, resolve, reject );
@@ -24,6 +24,8 @@ import * as StraightEdgeTool from './straightedgetool';
 import * as DataPlayer from './dataplayer';
 import * as InputView from './inputview';
 import * as VRMesh from './vrmesh';
+import * as DeviceCheck from './devicecheck';
+import * as Assets from './assets';
 
 export var sketchLoader = R.curry( function( { renderer, povCamera, frameLoop, control }, events, sketchName, resolve, reject ){
 
@@ -38,7 +40,9 @@ export var sketchLoader = R.curry( function( { renderer, povCamera, frameLoop, c
 
   let player;
 
-  $.getJSON( path + 'meta.json' ).then( function( meta ){
+  const bundle = loadBundle( path );
+
+  bundle.then( function( { meta, playback, offsets, editing, timeline } ){
     const hasVideo = ( meta.video !== undefined );
     const videoSource = hasVideo ? meta.video.source : '';
     const artistSettings = meta.artistSettings ? meta.artistSettings : {};
@@ -48,13 +52,19 @@ export var sketchLoader = R.curry( function( { renderer, povCamera, frameLoop, c
     player = createPlayer( {
       path, hasVideo, videoSource, artistSettings, mainGroup,
       frameLoop, zUp, renderer, povCamera, control,
-      resolve, reject, events
+      resolve, reject, events, playback, offsets, editing, timeline
     } );
+  })
+  .catch( function( err ){
+    reject( err );
   });
 
   //  Props can load separately..
-  $.getJSON( path + 'props.json' )
-  .then( function( props ){
+  bundle.then( function( { props } ){
+    if( !props ){
+      console.log( 'no props detected for this sketch' );
+      return;
+    }
     if( props.pos && props.type === 'P' ){
       const position = Sketch.ThreeJSVec3FromTiltbrushData( props.pos );
       const scale = Sketch.ThreeJSScaleFromTiltbrushData( props.scale );
@@ -74,9 +84,6 @@ export var sketchLoader = R.curry( function( { renderer, povCamera, frameLoop, c
     else if( props.type === 'dress' ){
       zUp.add( VRMesh.getMannequin() );
     }
-  })
-  .fail( function(){
-    console.log( 'no props detected for this sketch' );
   });
 
   function unload(){
@@ -101,7 +108,7 @@ function createZUp(){
 function createPlayer( {
   path, hasVideo, videoSource, artistSettings, mainGroup,
   frameLoop, zUp, renderer, povCamera, control,
-  resolve, reject, events } ){
+  resolve, reject, events, playback, offsets, editing, timeline } ){
 
   const orbit = control.orbit();
 
@@ -120,17 +127,15 @@ function createPlayer( {
   $(window).on( 'tap', disableAutoRotate );
 
   const loadList = [
-    $.getJSON( path + 'actions.json' ),
-    $.getJSON( path + 'input.json' )
+    loadActions( path ),
+    $.getJSON( Assets.url( path + 'input.json' ) )
   ];
 
   const vc = VideoController
       .create( VideoController.defaultVideoSettings(), frameLoop );
 
   if( hasVideo ){
-    loadList.push( $.getJSON( path + 'playback.json' ) );
-    loadList.push( $.getJSON( path + 'offsets.json' ) );
-    loadList.push( $.getJSON( path + 'editing.json' ) );
+    loadList.push( playback, offsets, editing );
     loadList.push( vc.load( videoSource ) );
   }
 
@@ -243,7 +248,7 @@ function createPlayer( {
     const { dataMesh, endTime, bindings: sketchBindings } = Sketch.createPlayer( sketchData );
     zUp.add( dataMesh );
 
-    const dataPlayer = DataPlayer.create( 0, endTime, offsets );
+    const dataPlayer = DataPlayer.create( 0, endTime, offsets, timeline ? timeline.playback : undefined );
     dataPlayer.bindEvents( sketchBindings );
     console.log( endTime, offsets );
 
@@ -572,3 +577,48 @@ function createGround(){
   ground.receiveShadow = true;
   return ground;
 }
+
+function getUrlParam( name, url ) {
+  const results = new RegExp( '[\\?&]' + name + '=([^&#]*)' ).exec( url );
+  return results === null ? null : results[1];
+}
+
+// decimated strokes (actions.lod1.json, actions.lod2.json) are built by
+// scripts/compile_sketches.py; mobile gets level 1 unless ?lod= says otherwise
+function loadActions( path ){
+  let level = getUrlParam( 'lod', window.location.href );
+  if( level === null ){
+    level = DeviceCheck.isMobile() ? '1' : '0';
+  }
+
+  const full = () => Promise.resolve( $.getJSON( Assets.url( path + 'actions.json' ) ) );
+  if( level !== '1' && level !== '2' ){
+    return full();
+  }
+  return Promise.resolve( $.getJSON( Assets.url( path + 'actions.lod' + level + '.json' ) ) )
+    .catch( full );
+}
+
+function getJSONOrNull( url ){
+  return Promise.resolve( $.getJSON( Assets.url( url ) ) )
+    .catch( () => null );
+}
+
+// meta, props, playback, offsets and editing in one request (see
+// udon/bundles.py), or fetched one by one if there is no bundle
+function loadBundle( path ){
+  return Promise.resolve( $.getJSON( Assets.url( path + 'bundle.json' ) ) )
+    .catch( function(){
+      return Promise.resolve( $.getJSON( Assets.url( path + 'meta.json' ) ) )
+        .then( function( meta ){
+          const parts = [ 'props' ];
+          if( meta.video !== undefined ){
+            parts.push( 'playback', 'offsets', 'editing' );
+          }
+          return Promise.all( parts.map( part => getJSONOrNull( path + part + '.json' ) ) )
+            .then( function( [ props, playback = null, offsets = null, editing = null ] ){
+              return { meta, props, playback, offsets, editing, timeline: null };
+            });
+        });
+    });
+}
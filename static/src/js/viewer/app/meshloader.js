@@ -0,0 +1,127 @@
+/**
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+//  reads the indexed binary meshes scripts/compile_models.py writes for
+//  data/models (see udon/meshes.py) into the same object OBJLoader builds:
+//  an Object3D with one mesh per object of the OBJ
+
+import THREE from 'three';
+
+const MAGIC = 'VASM';
+const PREAMBLE_LENGTH = 12;
+const NORMAL_STEPS = 127;
+
+const ARRAY_TYPES = {
+  B: Uint8Array,
+  b: Int8Array,
+  H: Uint16Array,
+  h: Int16Array,
+  I: Uint32Array,
+  f: Float32Array
+};
+
+function parse( buffer ){
+  const view = new DataView( buffer );
+  const magic = String.fromCharCode.apply( null, new Uint8Array( buffer, 0, 4 ) );
+  if( magic !== MAGIC ){
+    throw new Error( 'not a mesh file' );
+  }
+  const headerLength = view.getUint32( 8, true );
+  const header = JSON.parse( String.fromCharCode.apply( null, new Uint8Array( buffer, PREAMBLE_LENGTH, headerLength ) ) );
+
+  //  sections are 8 byte aligned little endian arrays, so they are wrapped
+  //  rather than copied
+  const sections = {};
+  Object.keys( header.sections ).forEach( function( name ){
+    const [ offset, count, type ] = header.sections[ name ];
+    sections[ name ] = new ARRAY_TYPES[ type ]( buffer, offset, count );
+  });
+  return { header, sections };
+}
+
+//  three's attributes have to be floats, so quantized values are expanded here
+function dequantize( { header, sections } ){
+  let normal = sections.normal;
+  let uv = sections.uv;
+  if( header.quantized && normal ){
+    normal = new Float32Array( sections.normal.length );
+    for( let i = 0; i < normal.length; i++ ){
+      normal[ i ] = sections.normal[ i ] / NORMAL_STEPS;
+    }
+  }
+  if( header.quantized && uv ){
+    const offset = sections[ 'uv.offset' ];
+    const scale = sections[ 'uv.scale' ];
+    uv = new Float32Array( sections.uv.length );
+    for( let i = 0; i < uv.length; i++ ){
+      uv[ i ] = offset[ i & 1 ] + sections.uv[ i ] * scale[ i & 1 ];
+    }
+  }
+  return { position: sections.position, normal, uv, index: sections.index };
+}
+
+export function build( buffer ){
+  const mesh = parse( buffer );
+  const { position, normal, uv, index } = dequantize( mesh );
+  const container = new THREE.Object3D();
+
+  mesh.header.groups.forEach( function( group ){
+    const vertexEnd = group.vertex_start + group.vertex_count;
+    const geometry = new THREE.BufferGeometry();
+    geometry.setIndex( new THREE.BufferAttribute( index.subarray( group.index_start, group.index_start + group.index_count ), 1 ) );
+    geometry.addAttribute( 'position', new THREE.BufferAttribute( position.subarray( group.vertex_start * 3, vertexEnd * 3 ), 3 ) );
+    if( normal ){
+      geometry.addAttribute( 'normal', new THREE.BufferAttribute( normal.subarray( group.vertex_start * 3, vertexEnd * 3 ), 3 ) );
+    }
+    if( uv ){
+      geometry.addAttribute( 'uv', new THREE.BufferAttribute( uv.subarray( group.vertex_start * 2, vertexEnd * 2 ), 2 ) );
+    }
+    const [ x0, y0, z0, x1, y1, z1 ] = group.bounds;
+    geometry.boundingBox = new THREE.Box3( new THREE.Vector3( x0, y0, z0 ), new THREE.Vector3( x1, y1, z1 ) );
+
+    const material = new THREE.MeshLambertMaterial();
+    material.name = group.material;
+
+    const object = new THREE.Mesh( geometry, material );
+    object.name = group.name;
+    container.add( object );
+  });
+
+  return container;
+}
+
+export function load( url, onLoad, onError ){
+  const request = new XMLHttpRequest();
+  request.open( 'GET', url, true );
+  request.responseType = 'arraybuffer';
+  request.onload = function(){
+    if( request.status !== 200 ){
+      onError( new Error( url + ': ' + request.status ) );
+      return;
+    }
+    let object;
+    try{
+      object = build( request.response );
+    }
+    catch( e ){
+      onError( e );
+      return;
+    }
+    onLoad( object );
+  };
+  request.onerror = () => onError( new Error( url + ': request failed' ) );
+  request.send();
+}
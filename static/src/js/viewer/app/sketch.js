@@ -17,6 +17,7 @@
 import THREE from 'three';
 
 import Brushes from './brushes';
+import * as Assets from './assets';
 
 const TEXTURES_IN_ATLAS = 4;
 
@@ -181,7 +182,7 @@ function generateBrushPlayback( actionsRaw, brush ){
   let shouldCastShadow = true;
 
   const materialsettings = {
-    map: textureLoader.load( brush.texture ),
+    map: textureLoader.load( Assets.url( brush.texture ) ),
     transparent: true,
     depthTest: true,
     depthWrite: true,
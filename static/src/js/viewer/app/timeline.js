@@ -0,0 +1,79 @@
+/**
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+
+//  the playback mapping between video time (seconds) and sketch time
+//  (milliseconds) compiled by udon/timeline.py. Playback moves forward a
+//  frame at a time, so the corner found last is tried first and only a seek
+//  needs a binary search.
+
+//  returns a function finding the rightmost of the sorted values at or
+//  before a value, or -1 if there is none
+function finder( values ){
+  let last = 0;
+  return function( value ){
+    if( !values.length || value < values[ 0 ] ){
+      return -1;
+    }
+    const next = values[ last + 1 ];
+    if( values[ last ] <= value && ( next === undefined || value < next ) ){
+      return last;
+    }
+    let lo = 0;
+    let hi = values.length - 1;
+    while( lo < hi ){
+      const mid = ( lo + hi + 1 ) >> 1;
+      if( values[ mid ] <= value ){
+        lo = mid;
+      }
+      else{
+        hi = mid - 1;
+      }
+    }
+    last = lo;
+    return lo;
+  };
+}
+
+//  the mapping the whole session plays with: the corners of a piecewise
+//  linear function that runs at the speed of the video beyond them. Without
+//  a compiled one, or when its edit did not agree with offsets.time, the
+//  sketch is simply offsets.time behind the video.
+export function create( table, offsets ){
+
+  const { video, data } = table || { video: [ 0 ], data: [ -offsets.time * 1000.0 ] };
+  const findVideo = finder( video );
+  const findData = finder( data );
+
+  function interpolate( find, xs, ys, value, speed ){
+    const i = Math.max( find( value ), 0 );
+    if( value < xs[ i ] || i + 1 === xs.length ){
+      return ys[ i ] + ( value - xs[ i ] ) * speed;
+    }
+    const span = xs[ i + 1 ] - xs[ i ];
+    return span > 0 ? ys[ i ] + ( value - xs[ i ] ) / span * ( ys[ i + 1 ] - ys[ i ] ) : ys[ i ];
+  }
+
+  function videoToData( seconds ){
+    return interpolate( findVideo, video, data, seconds, 1000.0 );
+  }
+
+  function dataToVideo( milliseconds ){
+    return interpolate( findData, data, video, milliseconds, 0.001 );
+  }
+
+  return { videoToData, dataToVideo };
+}
@@ -18,6 +18,7 @@
 import $ from 'jquery';
 import * as Signal from './signal';
 import * as DeviceCheck from './devicecheck';
+import * as Assets from './assets';
 
 const VideoTypes = {
   WEBM: 'webm',
@@ -57,7 +58,8 @@ function resolvePath( path, settings ){
     suffix = "/";
   }
 
-  return baseURL + path + '/' + settings.resolution + '/video.' + settings.videoType + suffix;
+  const url = baseURL + path + '/' + settings.resolution + '/video.' + settings.videoType + suffix;
+  return settings.source == VideoSource.LOCAL ? Assets.url( url ) : url;
 }
 
 function getUrlParam( name, url ) {
@@ -15,16 +15,26 @@
  */
  import * as OBJLoader from '../../third_party/threejs_extra/OBJLoader';
 import THREE from 'three';
+import * as Assets from './assets';
+import * as MeshLoader from './meshloader';
 
 const manager = new THREE.LoadingManager();
 const objLoader = new THREE.OBJLoader( manager );
 const textureLoader = new THREE.TextureLoader();
 
+//  loads data/models/<name>.mesh, compiled by scripts/compile_models.py, and
+//  falls back to parsing the OBJ when it has not been built
+function loadModel( name, onLoad ){
+  MeshLoader.load( Assets.url( '/data/models/' + name + '.mesh' ), onLoad, function(){
+    objLoader.load( Assets.url( '/data/models/' + name + '.obj' ), onLoad, undefined, ( e ) => console.warn( e ) );
+  });
+}
+
 export function getControllerInstance(){
 
   const controllerGroup = new THREE.Group();
 
-  objLoader.load( '/data/models/Controller_opt.obj', function ( object ) {
+  loadModel( 'Controller_opt', function ( object ) {
     object.traverse( function ( child ) {
       if ( child instanceof THREE.Mesh ) {
         child.material = new THREE.MeshBasicMaterial({
@@ -40,7 +50,7 @@ export function getControllerInstance(){
     // object.rotation.x = Math.PI;
     object.rotation.y = Math.PI;
     controllerGroup.add( object );
-  }, undefined, ( e ) => console.warn( e ) );
+  } );
 
   return controllerGroup;
 
@@ -50,7 +60,7 @@ export function getHMDInstance(){
 
   const group = new THREE.Group();
 
-  objLoader.load( '/data/models/HMD.obj', function ( object ) {
+  loadModel( 'HMD', function ( object ) {
     object.traverse( function ( child ) {
       if ( child instanceof THREE.Mesh ) {
         child.material = new THREE.MeshBasicMaterial({
@@ -67,14 +77,14 @@ export function getHMDInstance(){
     object.rotation.y = Math.PI;
     object.position.z = -8;
     group.add( object );
-  }, undefined, ( e ) => console.warn( e ) );
+  } );
 
   return group;
 
 }
 
 export function getMirrorInstance(){
-  const texture = textureLoader.load( '/data/models/mirror.png' );
+  const texture = textureLoader.load( Assets.url( '/data/models/mirror.png' ) );
   const mirrorPlaneGeo = new THREE.PlaneGeometry( 250, 250, 1, 1 );
   mirrorPlaneGeo.applyMatrix( new THREE.Matrix4().makeRotationY( Math.PI * 0.5 ) );
 
@@ -97,7 +107,7 @@ export function getMirrorInstance(){
 export function getMannequin(){
   const group = new THREE.Group();
 
-  objLoader.load( '/data/models/Dressform_opt.obj', function ( object ) {
+  loadModel( 'Dressform_opt', function ( object ) {
     object.traverse( function ( child ) {
       if ( child instanceof THREE.Mesh ) {
         child.material = new THREE.MeshPhongMaterial({
@@ -114,7 +124,7 @@ export function getMannequin(){
     object.scale.set( 100, 100, 100 );
     // object.rotation.x = Math.PI;
     group.add( object );
-  }, undefined, ( e ) => console.warn( e ) );
+  } );
 
   return group;
 }
@@ -126,7 +136,7 @@ export function getPalette(){
     side: THREE.DoubleSide,
     depthWrite: false,
     transparent: true,
-    map: textureLoader.load( '/data/models/palette.png' )
+    map: textureLoader.load( Assets.url( '/data/models/palette.png' ) )
   })
   const geometry = new THREE.PlaneGeometry( 15,20,1,1 );
   geometry.applyMatrix( new THREE.Matrix4().makeTranslation( 0, 0, 0 ) );
@@ -0,0 +1,286 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+The compiled sketch files that the app serves, packed into a few large
+segment files, so serving them needs a handful of open files (memory-mapped
+where the platform allows it) instead of one open per request.
+
+scripts/pack_sketches.py writes the segments SKETCH_ARCHIVE.0,
+SKETCH_ARCHIVE.1, ... and, next to them, an index:
+
+    {
+        "version": 2,
+        "alignment": 4096,
+        "segment_size": 33554432,
+        "segments": [33550336, 12345678],
+        "files": {
+            "ab_bull/actions.bin": {"segment": 0, "offset": 0, "length": 1234, "sha1": "..."},
+            ...
+        }
+    }
+
+App Engine does not deploy files over 32 MB, so no segment is larger than
+`segment_size` and no file spans two segments. Each file starts on an
+`alignment` boundary of its segment, so a file's slice of the mapping covers
+whole pages and shares the OS page cache across requests and processes.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+
+try:
+    import mmap
+except ImportError:  # not available everywhere on App Engine
+    mmap = None
+
+from django.conf import settings
+
+from .streaming import ObjectNotFound, ObjectStat
+
+
+VERSION = 2
+ALIGNMENT = 4096
+SEGMENT_SIZE = 32 * 1024 * 1024
+INDEX_SUFFIX = '.json'
+
+READ_SIZE = 1024 * 1024
+
+
+def index_path(archive_path):
+    return archive_path + INDEX_SUFFIX
+
+
+def segment_path(archive_path, segment):
+    return '%s.%d' % (archive_path, segment)
+
+
+def _padding(offset, alignment):
+    return -offset % alignment
+
+
+def _copy(source_path, out):
+    """Appends a file to out; returns (length, sha1)."""
+    digest = hashlib.sha1()
+    length = 0
+    with open(source_path, 'rb') as source:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+            out.write(data)
+            length += len(data)
+    return length, digest.hexdigest()
+
+
+def pack(sources, archive_path, alignment=ALIGNMENT, segment_size=SEGMENT_SIZE):
+    """Writes the files in `sources` ({name: path}) into the segments of an
+    archive and returns its index. Segments are written to temporary files
+    first and only renamed into place once all of them are complete, so a
+    running server never sees a partial one.
+    """
+    index = {'version': VERSION, 'alignment': alignment, 'segment_size': segment_size, 'segments': [], 'files': {}}
+    outs = []
+    offset = 0
+    try:
+        for name in sorted(sources):
+            size = os.path.getsize(sources[name])
+            if size > segment_size:
+                raise ValueError("%s is %d bytes, more than a whole segment" % (name, size))
+            padding = _padding(offset, alignment)
+            if not outs or offset + padding + size > segment_size:
+                if outs:
+                    index['segments'].append(offset)
+                outs.append(open(segment_path(archive_path, len(outs)) + '.tmp', 'wb'))
+                offset = padding = 0
+            outs[-1].write('\0' * padding)
+            offset += padding
+            length, sha1 = _copy(sources[name], outs[-1])
+            index['files'][name] = {'segment': len(outs) - 1, 'offset': offset, 'length': length, 'sha1': sha1}
+            offset += length
+        if outs:
+            index['segments'].append(offset)
+    finally:
+        for out in outs:
+            out.close()
+
+    for segment in xrange(len(outs)):
+        path = segment_path(archive_path, segment)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+    # segments left over from a larger archive, and the single file archives
+    # were before they were split
+    segment = len(outs)
+    while os.path.exists(segment_path(archive_path, segment)):
+        os.remove(segment_path(archive_path, segment))
+        segment += 1
+    if os.path.exists(archive_path):
+        os.remove(archive_path)
+    return index
+
+
+def verify(archive_path, index, sources=None):
+    """Returns a list of (name, problem) for every file whose bytes in the
+    archive do not match its hash or, given `sources` ({name: path}), the
+    source file.
+    """
+    problems = []
+    for segment, size in enumerate(index['segments']):
+        path = segment_path(archive_path, segment)
+        actual = os.path.getsize(path) if os.path.exists(path) else None
+        if actual != size:
+            problems.append(('', "%s is %s bytes, the index says %d" % (path, actual, size)))
+        elif size > index['segment_size']:
+            problems.append(('', "%s is larger than a segment" % path))
+    if problems:
+        return problems
+
+    segments = [open(segment_path(archive_path, segment), 'rb') for segment in xrange(len(index['segments']))]
+    try:
+        for name, entry in sorted(index['files'].items()):
+            archive = segments[entry['segment']]
+            archive.seek(entry['offset'])
+            data = archive.read(entry['length'])
+            if hashlib.sha1(data).hexdigest() != entry['sha1']:
+                problems.append((name, "does not match its hash"))
+            elif sources is not None:
+                if name not in sources:
+                    problems.append((name, "has no source file"))
+                else:
+                    with open(sources[name], 'rb') as source:
+                        if source.read() != data:
+                            problems.append((name, "does not match %s" % sources[name]))
+    finally:
+        for segment in segments:
+            segment.close()
+    for name in sorted(set(sources or ()) - set(index['files'])):
+        problems.append((name, "is missing from the archive"))
+    return problems
+
+
+def dumps(index):
+    return json.dumps(index, sort_keys=True, separators=(',', ':'))
+
+
+class ArchiveBucket(object):
+    """Serves the files of an archive through streaming.serve.
+
+    Slices come straight from the mapping, which the OS already caches, so
+    they are not copied into the block cache as well.
+    """
+
+    cache_blocks = False
+    cache_stats = False
+
+    def __init__(self, archive_path, index):
+        if index.get('version') != VERSION:
+            raise ValueError("%s is not a version %d archive" % (archive_path, VERSION))
+        self.archive_path = archive_path
+        self.index = index
+        self.key = 'archive:%s:%s' % (archive_path, ','.join(str(size) for size in index['segments']))
+        self._files = []
+        self._maps = []
+        self._lock = threading.Lock()
+        try:
+            for segment, size in enumerate(index['segments']):
+                path = segment_path(archive_path, segment)
+                segment_file = open(path, 'rb')
+                self._files.append(segment_file)
+                if os.fstat(segment_file.fileno()).st_size != size:
+                    # the archive has been replaced but not its index yet
+                    raise ValueError("%s does not match its index" % path)
+                self._maps.append(self._map(segment_file, size, path))
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def _map(segment_file, size, path):
+        if mmap is None or not size:
+            return None
+        try:
+            return mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            logging.warning("Could not map %s, reading it instead", path)
+            return None
+
+    def close(self):
+        for segment_map in self._maps:
+            if segment_map is not None:
+                segment_map.close()
+        for segment_file in self._files:
+            segment_file.close()
+        self._maps = []
+        self._files = []
+
+    def stat(self, name):
+        entry = self.index['files'].get(name)
+        if entry is None:
+            raise ObjectNotFound(name)
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return ObjectStat(name, entry['length'], entry['sha1'], content_type)
+
+    def read(self, name, offset, length):
+        entry = self.index['files'].get(name)
+        if entry is None:
+            raise ObjectNotFound(name)
+        start = entry['offset'] + min(offset, entry['length'])
+        end = entry['offset'] + min(offset + length, entry['length'])
+        segment_map = self._maps[entry['segment']]
+        if segment_map is not None:
+            return segment_map[start:end]
+        with self._lock:
+            segment_file = self._files[entry['segment']]
+            segment_file.seek(start)
+            return segment_file.read(end - start)
+
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+def get_bucket():
+    """Returns an ArchiveBucket for SKETCH_ARCHIVE, reopened whenever the
+    archive is rewritten, or None if there is no archive.
+    """
+    global _bucket
+    path = settings.SKETCH_ARCHIVE
+    try:
+        mtime = os.stat(index_path(path)).st_mtime
+    except OSError:
+        return None
+
+    bucket = _bucket
+    if bucket is not None and bucket[0] == (path, mtime):
+        return bucket[1]
+
+    with _bucket_lock:
+        if _bucket is None or _bucket[0] != (path, mtime):
+            try:
+                with open(index_path(path), 'rb') as index_file:
+                    index = json.loads(index_file.read())
+                archive_bucket = ArchiveBucket(path, index)
+            except (IOError, OSError, ValueError):
+                logging.exception("Could not open the sketch archive %s", path)
+                return None
+            if _bucket is not None:
+                _bucket[1].close()
+            _bucket = ((path, mtime), archive_bucket)
+        return _bucket[1]
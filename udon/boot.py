@@ -13,13 +13,28 @@
  * See the License for the specific language governing permissions and
  * limitations under the License.
 """
+import logging
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from os.path import dirname, abspath, join, exists
 
 PROJECT_DIR = dirname(dirname(abspath(__file__)))
 SITEPACKAGES_DIR = join(PROJECT_DIR, "sitepackages")
 APPENGINE_DIR = join(SITEPACKAGES_DIR, "google_appengine")
 
+SECRET_KEY_CACHE_KEY = 'udon:secret_key'
+
+# Compiled into the cached template loader while the instance warms up
+WARM_UP_TEMPLATES = ['home.html', 'session.html', 'unsupported.html', 'video.html']
+
+# Milliseconds spent in each stage of starting this instance, in order.
+# secret_key is part of settings.
+STARTUP_TIMINGS = OrderedDict()
+STARTED = time.time()
+
 
 def fix_path():
     if exists(APPENGINE_DIR) and APPENGINE_DIR not in sys.path:
@@ -29,6 +44,16 @@ def fix_path():
         sys.path.insert(1, SITEPACKAGES_DIR)
 
 
+@contextmanager
+def timed(stage):
+    """Records how long the block takes in STARTUP_TIMINGS[stage]."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[stage] = STARTUP_TIMINGS.get(stage, 0) + (time.time() - start) * 1000
+
+
 def get_app_config():
     """Returns the application configuration, creating it if necessary."""
     from django.utils.crypto import get_random_string
@@ -42,10 +67,60 @@ def get_app_config():
     chars = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)'
     secret_key = get_random_string(50, chars)
 
-    key = ndb.Key(Config, 'config')
-    entity = key.get()
-    if not entity:
-        entity = Config(key=key)
-        entity.secret_key = str(secret_key)
-        entity.put()
-    return entity
+    # get_or_insert only creates the entity inside a transaction, so two
+    # instances booting at once can't end up with different keys
+    return Config.get_or_insert('config', secret_key=str(secret_key))
+
+
+_secret_key = None
+_secret_key_lock = threading.Lock()
+
+
+def get_secret_key():
+    """Returns SECRET_KEY from the first of this process, memcache or the
+    datastore that has it. Concurrent callers wait for a single lookup.
+    """
+    global _secret_key
+    if _secret_key is None:
+        with _secret_key_lock:
+            if _secret_key is None:
+                with timed('secret_key'):
+                    _secret_key = _load_secret_key()
+    return _secret_key
+
+
+def _load_secret_key():
+    from google.appengine.api import memcache
+
+    secret_key = memcache.get(SECRET_KEY_CACHE_KEY)
+    if secret_key is None:
+        secret_key = get_app_config().secret_key
+        memcache.add(SECRET_KEY_CACHE_KEY, secret_key)
+    return secret_key
+
+
+def warm_up():
+    """Loads everything the first request would otherwise have to, and logs
+    how long each stage of starting the instance took.
+    """
+    from django.core.urlresolvers import get_resolver
+    from django.template.loader import get_template
+
+    from udon import utils
+
+    # The first import of utils loads the catalog and times it as load_data;
+    # asking for it here makes sure that happens before the first request
+    utils.get_data()
+
+    with timed('urlconf'):
+        get_resolver(None).url_patterns
+
+    with timed('templates'):
+        for template_name in WARM_UP_TEMPLATES:
+            get_template(template_name)
+
+    logging.info(
+        "Instance started in %.0fms: %s",
+        (time.time() - STARTED) * 1000,
+        ', '.join('%s %.0fms' % item for item in STARTUP_TIMINGS.items()),
+    )
@@ -0,0 +1,117 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+The build cache of scripts/build_assets.py, kept in build/cache.json:
+
+    {
+        "version": 1,
+        "files": {
+            "data/sketches/ab_bull/actions.json": {
+                "digest": "3d4f7f23f695", "size": 1234, "mtime": 1467000000
+            },
+            ...
+        },
+        "tasks": {
+            "sketches/ab_bull": {
+                "key": "<sha1 of the task's inputs>",
+                "outputs": ["sketches/ab_bull/actions.bin", ...],
+                "seconds": 1.2
+            },
+            ...
+        }
+    }
+
+A task's key hashes the content of its source files, the code that builds
+it and its options, so an output is only rebuilt when one of those changes.
+File digests are the ones udon.fingerprint makes and are reused while a
+file's size and mtime stay the same.
+"""
+import hashlib
+import json
+import os
+
+from udon import buildfiles, fingerprint
+
+
+VERSION = 1
+FILE_NAME = 'cache.json'
+
+
+def _empty_cache():
+    return {'version': VERSION, 'files': {}, 'tasks': {}}
+
+
+def load(path):
+    """Returns the cache at path, or an empty one if it is missing or was
+    written by another version.
+    """
+    try:
+        with open(path, 'rb') as cache_file:
+            cache = json.loads(cache_file.read())
+    except (IOError, ValueError):
+        return _empty_cache()
+    if cache.get('version') != VERSION:
+        return _empty_cache()
+    return cache
+
+
+def dumps(cache):
+    return json.dumps(cache, sort_keys=True, indent=1, separators=(',', ':'))
+
+
+def save(path, cache):
+    buildfiles.write_file(path, dumps(cache))
+
+
+def digest_files(root, paths, cache, rehash=False):
+    """Returns {path: digest} for files given relative to root, recording
+    them in the cache. Missing files are left out.
+    """
+    files = cache['files']
+    digests = {}
+    for path in paths:
+        full_path = os.path.join(root, path)
+        if not os.path.isfile(full_path):
+            continue
+        files[path] = fingerprint.fingerprint_file(full_path, None if rehash else files.get(path))
+        digests[path] = files[path]['digest']
+    return digests
+
+
+def task_key(digests, options):
+    """Hashes a task's file digests and its options, which have to be JSON
+    serialisable.
+    """
+    return hashlib.sha1(json.dumps([sorted(digests.items()), options], sort_keys=True)).hexdigest()
+
+
+def is_current(cache, task, key, root):
+    """True if the task was last built with this key and all of its outputs
+    are still under root.
+    """
+    entry = cache['tasks'].get(task)
+    if entry is None or entry['key'] != key:
+        return False
+    return all(os.path.exists(os.path.join(root, path)) for path in entry['outputs'])
+
+
+def list_outputs(root):
+    """Returns the files under root, relative to it, in order."""
+    outputs = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            outputs.append(os.path.relpath(os.path.join(dir_path, file_name), root).replace(os.sep, '/'))
+    return sorted(outputs)
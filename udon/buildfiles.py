@@ -0,0 +1,53 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+File and process helpers shared by the build scripts in scripts/ and by
+udon.buildcache. Nothing here is imported by the app itself.
+"""
+import multiprocessing
+import os
+
+
+def write_file(path, data):
+    """Writes data to path through <path>.tmp, so a reader or an interrupted
+    build never sees a partly written file.
+    """
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def imap(function, jobs, processes):
+    """Yields function(job) for every job as they finish, on a pool of up to
+    `processes` worker processes, or in this one if there is only one.
+    """
+    processes = max(1, min(processes, len(jobs)))
+    if processes == 1:
+        for job in jobs:
+            yield function(job)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(function, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
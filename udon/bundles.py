@@ -0,0 +1,205 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Everything the viewer needs before it can start loading a session, in one
+document instead of five requests:
+
+    {
+        "version": 1,
+        "sketch": "cn_piano_edit",
+        "meta": {...},              # meta.json
+        "props": {...},             # props.json, or null if the sketch has none
+        "playback": {...},          # playback.json, or null
+        "offsets": {...},           # offsets.json, or null
+        "editing": {...},           # editing.json, or null
+        "timeline": {...},          # editing.json's edits and fades as lookup
+                                    # tables and, if the edit agrees with
+                                    # offsets.time, the playback mapping
+                                    # (see udon/timeline.py), or null
+        "assets": {
+            "actions.json": {"url": "/data/sketches/cn_piano_edit/actions.json", "size": 1234},
+            ...
+        },
+        "videos": {
+            "512_424/video.mp4": {"url": "/serve-file/videos/cn_piano/edit_v1b/512_424/video.mp4/", "size": 1234},
+            ...
+        }
+    }
+
+assets lists the heavy files of the sketch that exist; URLs are the plain
+ones, which the viewer maps to fingerprinted ones itself. A video's size is
+null when neither the fingerprint manifest nor a local copy knows it.
+
+scripts/compile_sketches.py writes bundle.json into build/sketches; the
+bundle view builds it on the fly when that copy is missing or older than
+its sources.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from . import timeline
+
+
+VERSION = 1
+FILE_NAME = 'bundle.json'
+
+PARTS = ('meta', 'props', 'playback', 'offsets', 'editing')
+
+# (file name, whether it lives in the build directory rather than data/)
+ASSETS = (
+    ('actions.json', False),
+    ('input.json', False),
+    ('actions.lod1.json', True),
+    ('actions.lod2.json', True),
+    ('actions.bin', True),
+    ('input.bin', True),
+    ('chunks.json', True),
+    ('snapshots.json', True),
+    ('spatial.json', True),
+)
+
+# The variants VideoController chooses between
+VIDEO_RESOLUTIONS = ('1024_848', '512_424', '256_212')
+VIDEO_CODECS = ('mp4', 'webm')
+
+
+def asset_url(sketch, file_name):
+    return '/data/sketches/%s/%s' % (sketch, file_name)
+
+
+def video_url(source, variant):
+    return '/serve-file/%s/%s/' % (source, variant)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'rb') as json_file:
+            return json.loads(json_file.read())
+    except IOError:
+        return None
+
+
+def build_bundle(sketch, data_dir, build_dir, manifest=None, videos_dir=None, strict=True):
+    """Returns the bundle of a sketch, or None if it has no meta.json.
+
+    manifest is a fingerprint manifest and videos_dir a directory of
+    downloaded videos, both only used for the size of the videos. Invalid
+    edits raise TimelineError, unless strict is False, in which case they
+    are logged and left out of the timeline.
+    """
+    sketch_dir = os.path.join(data_dir, sketch)
+    bundle = {'version': VERSION, 'sketch': sketch}
+    for part in PARTS:
+        bundle[part] = _read_json(os.path.join(sketch_dir, part + '.json'))
+    if bundle['meta'] is None:
+        return None
+
+    try:
+        bundle['timeline'] = timeline.build_timeline(bundle['editing'], bundle['offsets'])
+    except timeline.TimelineError as e:
+        if strict:
+            raise
+        logging.error("Ignoring the edits of %s: %s", sketch, e)
+        bundle['timeline'] = None
+
+    bundle['assets'] = {}
+    for file_name, built in ASSETS:
+        path = os.path.join(build_dir if built else data_dir, sketch, file_name)
+        if os.path.exists(path):
+            bundle['assets'][file_name] = {
+                'url': asset_url(sketch, file_name),
+                'size': os.path.getsize(path),
+            }
+
+    bundle['videos'] = {}
+    source = (bundle['meta'].get('video') or {}).get('source')
+    if source:
+        files = (manifest or {}).get('files', {})
+        for resolution in VIDEO_RESOLUTIONS:
+            for codec in VIDEO_CODECS:
+                variant = '%s/video.%s' % (resolution, codec)
+                url = video_url(source, variant)
+                size = files.get(url, {}).get('size')
+                if size is None and videos_dir:
+                    path = os.path.join(videos_dir, source, variant)
+                    if os.path.exists(path):
+                        size = os.path.getsize(path)
+                bundle['videos'][variant] = {'url': url, 'size': size}
+    return bundle
+
+
+def source_paths(sketch, data_dir, build_dir):
+    """The files a bundle is built from."""
+    paths = [os.path.join(data_dir, sketch, part + '.json') for part in PARTS]
+    paths.extend(
+        os.path.join(build_dir if built else data_dir, sketch, file_name)
+        for file_name, built in ASSETS
+    )
+    return paths
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def dumps(bundle):
+    return json.dumps(bundle, sort_keys=True, separators=(',', ':'))
+
+
+_bundles = {}
+_lock = threading.Lock()
+
+
+def load_bundle(sketch, data_dir, build_dir, manifest=None, manifest_mtime=None):
+    """Returns (payload, sha1) of a sketch's bundle, or None if there is no
+    such sketch.
+
+    The copy in build_dir is used if it is newer than everything it was
+    built from; otherwise the bundle is built here. Either way the result is
+    kept until one of those files changes.
+    """
+    if not os.path.isdir(os.path.join(data_dir, sketch)):
+        return None
+
+    built_path = os.path.join(build_dir, sketch, FILE_NAME)
+    mtimes = tuple(_mtime(path) for path in source_paths(sketch, data_dir, build_dir))
+    key = (sketch, data_dir, build_dir)
+    signature = (mtimes, _mtime(built_path), manifest_mtime)
+
+    cached = _bundles.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    built_mtime = signature[1]
+    if built_mtime is not None and all(mtime is None or mtime <= built_mtime for mtime in mtimes):
+        with open(built_path, 'rb') as built_file:
+            payload = built_file.read()
+    else:
+        bundle = build_bundle(sketch, data_dir, build_dir, manifest, strict=False)
+        if bundle is None:
+            return None
+        payload = dumps(bundle)
+
+    result = (payload, hashlib.sha1(payload).hexdigest())
+    with _lock:
+        _bundles[key] = (signature, result)
+    return result
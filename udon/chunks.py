@@ -0,0 +1,243 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Time-windowed chunks of a sketch's actions and input tracks.
+
+Each track is split into windows of `window` milliseconds. Chunks are not
+copied anywhere: chunks.json records the byte range of each window in the
+source actions.json or input.json, which is deployed as it is:
+
+    {
+        "version": 2,
+        "window": 10000,
+        "metadata": {...},          # actions.json metadata (brush index)
+        "tracks": {
+            "actions": {
+                "file": "actions.json",
+                "size": 1234567,
+                "chunks": [{"index", "start", "end", "offset", "length",
+                            "sha1", "actions", "strokes", "deletes"}, ...]
+            },
+            "input": {
+                "file": "input.json",
+                "size": 1234567,
+                "chunks": [{"index", "start", "end", "offset", "length",
+                            "sha1", "frames"}, ...]
+            }
+        }
+    }
+
+start/end bound the times of everything in the chunk; for actions that
+includes the last point of every stroke begun in the window. A range runs
+from the first byte of a window's first item to the last byte of its last
+one, so wrapping it in brackets gives a JSON list of actions exactly as in
+actions.json, or a flat JSON list of whole input frames, and the existing
+parsing code can consume chunks as they arrive. sha1 is the hash of that
+bracketed payload; size is the length of the source file, so a chunk is
+never cut from a source that has changed since it was indexed.
+"""
+import hashlib
+import json
+import os
+import re
+
+from . import sketchformat
+from .streaming import ObjectNotFound
+
+
+VERSION = 2
+DEFAULT_WINDOW = 10000  # milliseconds
+
+MANIFEST_NAME = 'chunks.json'
+TRACK_FILES = {
+    'actions': 'actions.json',
+    'input': 'input.json',
+}
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+def _action_end(action):
+    end = action['time']
+    if action['type'] == 'STROKE':
+        for segment in action['data']['points']:
+            if segment:
+                end = max(end, segment[-1]['t'])
+    elif action['type'] == 'STRAIGHT_TOOL_START':
+        end = max(end, action['data'].get('endTime', end))
+    return end
+
+
+def _expect(text, pos, characters):
+    pos = WHITESPACE.match(text, pos).end()
+    if text[pos:pos + 1] not in characters:
+        raise sketchformat.FormatError("expected %r at byte %d" % (characters, pos))
+    return text[pos], WHITESPACE.match(text, pos + 1).end()
+
+
+def _array_items(text, pos=0):
+    """Yields (value, start, end) for each item of the JSON array at pos, with
+    start and end the byte range of its text.
+    """
+    _, pos = _expect(text, pos, '[')
+    if text[pos:pos + 1] == ']':
+        return
+    while True:
+        value, end = _decoder.raw_decode(text, pos)
+        yield value, pos, end
+        separator, pos = _expect(text, end, ',]')
+        if separator == ']':
+            return
+
+
+def _member(text, key):
+    """Returns the position of the value of key in the JSON object that
+    makes up text.
+    """
+    _, pos = _expect(text, 0, '{')
+    while text[pos:pos + 1] != '}':
+        name, pos = _decoder.raw_decode(text, pos)
+        _, pos = _expect(text, pos, ':')
+        if name == key:
+            return pos
+        _, pos = _decoder.raw_decode(text, pos)
+        separator, pos = _expect(text, pos, ',}')
+        if separator == '}':
+            break
+    raise sketchformat.FormatError("no %r member" % key)
+
+
+def _windows(items, time_of, window):
+    """Groups consecutive (item, start, end) tuples by the window their time
+    falls in.
+    """
+    groups = []
+    for item in items:
+        index = int(time_of(item[0]) // window)
+        if not groups or groups[-1][0] != index:
+            groups.append((index, []))
+        groups[-1][1].append(item)
+    return groups
+
+
+def _locate(text, chunk, group):
+    """Fills in a chunk's byte range from its first and last items."""
+    start, end = group[0][1], group[-1][2]
+    chunk['offset'] = start
+    chunk['length'] = end - start
+    chunk['sha1'] = hashlib.sha1('[' + text[start:end] + ']').hexdigest()
+    return chunk
+
+
+def chunk_actions(text, window=DEFAULT_WINDOW):
+    """Returns the chunk entries for the text of an actions.json.
+
+    Actions are expected in time order; an action that arrives out of order
+    simply starts a new chunk so the original order is always preserved.
+    """
+    chunks = []
+    items = _array_items(text, _member(text, 'actions'))
+    for _, group in _windows(items, lambda action: action['time'], window):
+        actions = [action for action, _, _ in group]
+        chunks.append(_locate(text, {
+            'index': len(chunks),
+            'start': min(action['time'] for action in actions),
+            'end': max(_action_end(action) for action in actions),
+            'actions': len(actions),
+            'strokes': sum(1 for action in actions if action['type'] == 'STROKE'),
+            'deletes': sum(1 for action in actions if action['type'] == 'DELETE'),
+        }, group))
+    return chunks
+
+
+def chunk_input(text, window=DEFAULT_WINDOW):
+    """Returns the chunk entries for the text of an input.json."""
+    stride = sketchformat.INPUT_STRIDE
+    values = list(_array_items(text))
+    if len(values) % stride:
+        raise sketchformat.FormatError(
+            "%d values is not a whole number of %d value frames" % (len(values), stride))
+    # one (frame time, start of its first value, end of its last) per frame
+    frames = [
+        (values[i][0], values[i][1], values[i + stride - 1][2])
+        for i in xrange(0, len(values), stride)
+    ]
+
+    chunks = []
+    for _, group in _windows(frames, lambda time: time, window):
+        chunks.append(_locate(text, {
+            'index': len(chunks),
+            'start': group[0][0],
+            'end': group[-1][0],
+            'frames': len(group),
+        }, group))
+    return chunks
+
+
+def build_chunks(sketch_dir, window=DEFAULT_WINDOW):
+    """Returns {MANIFEST_NAME: contents} for the sketch in sketch_dir."""
+    manifest = {'version': VERSION, 'window': window, 'metadata': {}, 'tracks': {}}
+    for track, file_name in sorted(TRACK_FILES.items()):
+        path = os.path.join(sketch_dir, file_name)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as source:
+            text = source.read()
+        if track == 'actions':
+            chunks = chunk_actions(text, window)
+            try:
+                manifest['metadata'] = _decoder.raw_decode(text, _member(text, 'metadata'))[0]
+            except sketchformat.FormatError:
+                pass
+        else:
+            chunks = chunk_input(text, window)
+        manifest['tracks'][track] = {'file': file_name, 'size': len(text), 'chunks': chunks}
+    return {MANIFEST_NAME: json.dumps(manifest, sort_keys=True, separators=(',', ':'))}
+
+
+_manifests = {}
+
+
+def load_manifest(bucket, name):
+    """Returns a parsed chunks.json from a streaming bucket, re-reading it
+    only when it changes.
+    """
+    stat = bucket.stat(name)
+    key = (bucket.key, name)
+    cached = _manifests.get(key)
+    if cached is None or cached[0] != stat.generation:
+        cached = _manifests[key] = (stat.generation, json.loads(bucket.read(name, 0, stat.size)))
+    return cached[1]
+
+
+def read_chunk(manifest_bucket, source_bucket, sketch, track, index):
+    """Returns (chunk entry, payload) for one chunk of a sketch's track, with
+    chunks.json read from manifest_bucket and the range from the source file
+    in source_bucket.
+
+    Raises streaming.ObjectNotFound if the sketch has no chunks or its
+    source has changed since they were indexed, and KeyError or IndexError
+    for an unknown track or chunk.
+    """
+    track_info = load_manifest(manifest_bucket, '%s/%s' % (sketch, MANIFEST_NAME))['tracks'][track]
+    if index < 0:
+        raise IndexError(index)
+    chunk = track_info['chunks'][index]
+    source_name = '%s/%s' % (sketch, track_info['file'])
+    if source_bucket.stat(source_name).size != track_info['size']:
+        raise ObjectNotFound(source_name)
+    return chunk, '[' + source_bucket.read(source_name, chunk['offset'], chunk['length']) + ']'
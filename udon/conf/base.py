@@ -38,9 +38,9 @@ SHORT_URL = "g.co/VirtualArtSessions"
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.6/howto/deployment/checklist/
 
-from ..boot import get_app_config
+from ..boot import get_secret_key
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = get_app_config().secret_key
+SECRET_KEY = get_secret_key()
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -59,6 +59,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'udon.instrumentation.InstrumentationMiddleware',
     'djangae.contrib.security.middleware.AppEngineSecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'csp.middleware.CSPMiddleware',
@@ -190,6 +191,58 @@ CSP_CONNECT_SRC = (
 
 BUCKET_KEY = get_default_gcs_bucket_name()
 
+# serve_file streams objects itself in fixed-size blocks, keeping the most
+# recently served blocks in memory so seeking around a video rarely has to go
+# back to Cloud Storage. Set SERVE_FILE_STREAMING to False to hand requests
+# to djangae instead.
+SERVE_FILE_STREAMING = True
+SERVE_FILE_BLOCK_SIZE = 256 * 1024  # bytes
+SERVE_FILE_CACHE_SIZE = 32 * 1024 * 1024  # bytes
+SERVE_FILE_STAT_TTL = 60  # seconds
+# Serve from this directory instead of BUCKET_KEY (e.g. scripts/videos)
+SERVE_FILE_ROOT = None
+
+# Assets derived from data/sketches by the scripts in scripts/
+SKETCH_BUILD_DIR = os.path.join(PROJECT_DIR, 'build', 'sketches')
+# The files of SKETCH_BUILD_DIR the app serves, packed into 32 MB segments by
+# scripts/pack_sketches.py (udon/archive.py). Only the archive is deployed;
+# locally, files that are not in it, or everything if it has not been
+# written, are served from SKETCH_BUILD_DIR.
+SKETCH_ARCHIVE = os.path.join(PROJECT_DIR, 'build', 'sketches.pack')
+
+# data/models/*.obj compiled into indexed binary meshes by
+# scripts/compile_models.py (udon/meshes.py), with their gzip and brotli variants
+MODEL_BUILD_DIR = os.path.join(PROJECT_DIR, 'build', 'models')
+
+# Previews of each session's finished sketch, rendered by
+# scripts/render_thumbnails.py (udon/thumbnails.py)
+THUMBNAIL_BUILD_DIR = os.path.join(PROJECT_DIR, 'build', 'thumbnails')
+# The thumbnails that exist, which the catalog adds to data.json's sessions
+THUMBNAIL_INDEX = os.path.join(PROJECT_DIR, 'build', 'thumbnails.json')
+
+# JSON and OBJ files under data/ are served by Django so that the gzip and
+# brotli variants written by scripts/compress_data.py can be negotiated
+DATA_DIR = os.path.join(PROJECT_DIR, 'data')
+PRECOMPRESSED_DIR = os.path.join(PROJECT_DIR, 'build', 'data')
+
+# Rendered home and session pages are cached for PAGE_CACHE_TIMEOUT, then
+# served stale for up to PAGE_CACHE_STALE_TIMEOUT while one request renders
+# a fresh copy (see udon/pagecache.py)
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_TIMEOUT = 5 * 60  # seconds
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60  # seconds
+PAGE_CACHE_LOCK_TIMEOUT = 10  # seconds
+PAGE_CACHE_WAIT = 2  # seconds
+
+# Share of requests timed by udon.instrumentation (0 turns it off) and how
+# many request times per URL name /_ah/stats/ works out percentiles from
+INSTRUMENTATION_SAMPLE_RATE = 1.0
+INSTRUMENTATION_WINDOW = 1000
+
+# Content hashes written by scripts/fingerprint_assets.py; files listed here
+# are also served from /v/<hash>/... with a year long immutable max-age
+FINGERPRINT_MANIFEST = os.path.join(PROJECT_DIR, 'build', 'fingerprints.json')
+
 DEFAULT_FILE_STORAGE = 'google.appengine.api.blobstore.blobstore_stub.BlobStorage'
 
 DJANGAE_RUNSERVER_IGNORED_FILES_REGEXES = [
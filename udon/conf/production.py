@@ -30,6 +30,8 @@ except KeyError:  # get raised when running checksecure on localhost
 
 CACHE_TIMEOUT = 61  # seconds
 
+INSTRUMENTATION_SAMPLE_RATE = 0.1
+
 ########## END CACHING CONFIGURATION
 
 ########## STORAGE CONFIGURATION
@@ -14,14 +14,15 @@
  * limitations under the License.
 """
 from django.conf import settings
-from . import utils
+from . import instrumentation, utils
 
 
 def context_processor(request):
-    return {
-        'ANALYTICS_KEY': settings.ANALYTICS_KEY,
-        'DEBUG': settings.DEBUG,
-        'SITE_URL': settings.SITE_URL,
-        'SHORT_URL': settings.SHORT_URL,
-        'globals': utils.get_globals()
-    }
+    with instrumentation.span('context_processor'):
+        return {
+            'ANALYTICS_KEY': settings.ANALYTICS_KEY,
+            'DEBUG': settings.DEBUG,
+            'SITE_URL': settings.SITE_URL,
+            'SHORT_URL': settings.SHORT_URL,
+            'globals': utils.get_globals()
+        }
@@ -0,0 +1,149 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Content-hashed URLs for sketch data, models and videos.
+
+scripts/fingerprint_assets.py hashes every file under data/, the compiled
+files in build/sketches, build/models and build/thumbnails and the
+downloaded session videos, and writes FINGERPRINT_MANIFEST:
+
+    {
+        "version": 1,
+        "files": {
+            "/data/sketches/ab_bull/actions.json": {
+                "digest": "3d4f7f23f695", "size": 1234, "mtime": 1467000000
+            },
+            "/serve-file/videos/cn_piano/edit_v1b/512_424/video.webm/": {...},
+            ...
+        },
+        "videos": {"cn_piano_edit": "videos/cn_piano/edit_v1b", ...}
+    }
+
+Keys are the URLs the files are normally served at. The fingerprinted URL
+of a file is /v/<digest><url>; it never changes content, so it is served
+with a year long immutable Cache-Control.
+
+Videos are hashed from the local copies download_videos.py makes, while
+production serves the objects in the bucket. The two only agree if the
+bucket is written from those copies, which faststart_videos.py --upload
+does; after changing a video anywhere else, download it again before
+fingerprinting.
+"""
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+
+
+VERSION = 1
+DIGEST_LENGTH = 12
+URL_PREFIX = '/v/'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # seconds
+
+READ_SIZE = 1024 * 1024
+
+# A file whose mtime is this close to the time it is hashed can still be
+# rewritten with the same size and mtime, so its digest is never reused
+RACY_SECONDS = 2
+
+# Every page loads these, whichever session it shows
+SHARED_PREFIXES = ('/data/models/', '/data/brushassets/')
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        while True:
+            data = source.read(READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()[:DIGEST_LENGTH]
+
+
+def fingerprint_file(path, previous=None):
+    """Returns the manifest entry for a file, reusing `previous` if the file's
+    size and mtime have not changed since it was made. Files modified within
+    RACY_SECONDS of being hashed get no mtime, so they are hashed again next
+    time.
+    """
+    info = os.stat(path)
+    mtime = int(info.st_mtime)
+    if previous and previous['size'] == info.st_size and previous['mtime'] == mtime:
+        return previous
+    digest = file_digest(path)
+    if time.time() - info.st_mtime < RACY_SECONDS:
+        mtime = None
+    return {'digest': digest, 'size': info.st_size, 'mtime': mtime}
+
+
+def _empty_manifest():
+    return {'version': VERSION, 'files': {}, 'videos': {}}
+
+
+_manifest = {}
+
+
+def manifest_mtime():
+    try:
+        return os.stat(settings.FINGERPRINT_MANIFEST).st_mtime
+    except OSError:
+        return None
+
+
+def load_manifest(path=None):
+    """Returns the parsed manifest, re-reading it only when it changes. Without
+    a manifest nothing is fingerprinted and files keep their plain URLs.
+    """
+    path = path or settings.FINGERPRINT_MANIFEST
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return _empty_manifest()
+    cached = _manifest.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as manifest_file:
+            cached = _manifest[path] = (mtime, json.loads(manifest_file.read()))
+    return cached[1]
+
+
+def fingerprinted_url(url, manifest=None):
+    entry = (manifest or load_manifest())['files'].get(url)
+    if entry is None:
+        return url
+    return URL_PREFIX + entry['digest'] + url
+
+
+def sketch_urls(sketch, manifest=None):
+    """Returns {url: fingerprinted url} for everything a session of `sketch`
+    loads: its data files, its video and the shared models and brushes.
+    """
+    manifest = manifest or load_manifest()
+    prefixes = ('/data/sketches/%s/' % sketch,) + SHARED_PREFIXES
+    video = manifest['videos'].get(sketch)
+    if video:
+        prefixes += ('/serve-file/%s/' % video,)
+    return dict(
+        (url, URL_PREFIX + entry['digest'] + url)
+        for url, entry in manifest['files'].items()
+        if url.startswith(prefixes)
+    )
+
+
+def dumps(manifest):
+    return json.dumps(manifest, sort_keys=True, separators=(',', ':'))
@@ -0,0 +1,220 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Per-request timings.
+
+InstrumentationMiddleware samples INSTRUMENTATION_SAMPLE_RATE of requests.
+For those, code can time a stage with
+
+    with instrumentation.span('render'):
+        ...
+
+and the middleware adds the spans (summed by name) to the response as a
+Server-Timing header, logs them as one JSON line and keeps the total time
+in a rolling window per URL name for the /_ah/stats/ endpoint. For requests
+that are not sampled span() hands back a shared no-op object, so leaving
+spans in hot paths costs next to nothing.
+
+A streaming response's body is only read after the middleware has run and
+its headers are sent, so spans inside it (the storage reads of serve_file)
+cannot be in Server-Timing. Its body is wrapped so they are still timed,
+and the request is logged once the body has been sent or closed, with the
+bytes actually sent and the time it took as body_ms.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.spans = OrderedDict()  # name -> [milliseconds, count]
+
+    def add(self, name, elapsed):
+        span = self.spans.get(name)
+        if span is None:
+            span = self.spans[name] = [0.0, 0]
+        span[0] += elapsed * 1000
+        span[1] += 1
+
+
+class _Span(object):
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.time() - self.start)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Times a block as part of the current request, if it is being sampled."""
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        return _NULL_SPAN
+    return _Span(timer, name)
+
+
+def timed_body(timer, content, finished):
+    """Yields the chunks of a streaming body with timer as the current
+    request's timer while each one is produced, then calls finished(bytes
+    sent, milliseconds) when the body runs out or is closed.
+    """
+    started = time.time()
+    served = 0
+    try:
+        chunks = iter(content)
+        while True:
+            previous, _local.timer = getattr(_local, 'timer', None), timer
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                _local.timer = previous
+            served += len(chunk)
+            yield chunk
+    finally:
+        finished(served, (time.time() - started) * 1000)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(int(round(p / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class RollingStats(object):
+    """The last `window` request times for each URL name."""
+
+    def __init__(self, window):
+        self.window = window
+        self._times = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, milliseconds):
+        with self._lock:
+            times = self._times.get(name)
+            if times is None:
+                times = self._times[name] = deque(maxlen=self.window)
+            times.append(milliseconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            snapshot = dict((name, sorted(times)) for name, times in self._times.items())
+            counts = dict(self._counts)
+
+        summary = {}
+        for name, ordered in snapshot.items():
+            entry = {'count': counts[name], 'window': len(ordered)}
+            for p in PERCENTILES:
+                entry['p%d' % p] = percentile(ordered, p)
+            summary[name] = entry
+        return summary
+
+
+_stats = None
+
+
+def get_stats():
+    global _stats
+    if _stats is None:
+        _stats = RollingStats(settings.INSTRUMENTATION_WINDOW)
+    return _stats
+
+
+def server_timing(timer, total):
+    parts = ['%s;dur=%.1f' % (name, elapsed) for name, (elapsed, _) in timer.spans.items()]
+    parts.append('total;dur=%.1f' % total)
+    return ', '.join(parts)
+
+
+class InstrumentationMiddleware(object):
+
+    def process_request(self, request):
+        sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        if sample_rate and (sample_rate >= 1 or random.random() < sample_rate):
+            _local.timer = RequestTimer()
+        else:
+            _local.timer = None
+
+    def process_response(self, request, response):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return response
+        _local.timer = None
+
+        total = (time.time() - timer.start) * 1000
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.url_name if match else None) or 'unknown'
+        get_stats().record(url_name, total)
+
+        response['Server-Timing'] = server_timing(timer, total)
+
+        def log(served, body_ms=None):
+            line = {
+                'url_name': url_name,
+                'path': request.path,
+                'method': request.method,
+                'status': response.status_code,
+                'bytes': served,
+                'total_ms': round(total, 1),
+                'spans': dict(
+                    (name, {'ms': round(elapsed, 1), 'count': count})
+                    for name, (elapsed, count) in timer.spans.items()
+                ),
+            }
+            if body_ms is not None:
+                line['body_ms'] = round(body_ms, 1)
+            logging.info("request %s", json.dumps(line, sort_keys=True))
+
+        if response.streaming:
+            response.streaming_content = timed_body(timer, response.streaming_content, log)
+        else:
+            log(len(response.content))
+        return response
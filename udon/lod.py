@@ -0,0 +1,158 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Level-of-detail decimation of stroke control points.
+
+Each stroke segment is simplified with Douglas-Peucker, where a point may
+only be dropped if the stroke interpolated between the points either side
+of it stays within the level's tolerances for position (distance to the
+chord, in sketch units), orientation (angle to the normalised lerp of the
+neighbouring quaternions, in degrees) and pressure. Interpolation follows
+the points' timestamps, and the first and last points are always kept.
+
+Simplified sketches keep the actions.json structure, so the viewer loads
+actions.lod<N>.json exactly as it loads actions.json.
+"""
+import json
+import math
+from collections import namedtuple
+
+
+Tolerance = namedtuple('Tolerance', ['position', 'angle', 'pressure'])
+
+LEVELS = {
+    1: Tolerance(position=0.02, angle=4.0, pressure=0.05),
+    2: Tolerance(position=0.08, angle=12.0, pressure=0.15),
+}
+
+
+def file_name(level):
+    return 'actions.json' if level == 0 else 'actions.lod%d.json' % level
+
+
+def _segment_distance(point, start, end):
+    """Distance from point to the line segment start-end."""
+    dx, dy, dz = end[0] - start[0], end[1] - start[1], end[2] - start[2]
+    px, py, pz = point[0] - start[0], point[1] - start[1], point[2] - start[2]
+    length_squared = dx * dx + dy * dy + dz * dz
+    u = 0.0
+    if length_squared > 0:
+        u = min(max((px * dx + py * dy + pz * dz) / length_squared, 0.0), 1.0)
+    ex, ey, ez = px - u * dx, py - u * dy, pz - u * dz
+    return math.sqrt(ex * ex + ey * ey + ez * ez)
+
+
+def _angle(q, start, end, u):
+    """Angle in degrees between q and the normalised lerp of start and end."""
+    sign = -1.0 if sum(a * b for a, b in zip(start, end)) < 0 else 1.0
+    lerp = [a + (sign * b - a) * u for a, b in zip(start, end)]
+    norm = math.sqrt(sum(c * c for c in lerp))
+    qnorm = math.sqrt(sum(c * c for c in q))
+    if norm == 0 or qnorm == 0:
+        return 180.0
+    dot = abs(sum(a * b for a, b in zip(q, lerp))) / (norm * qnorm)
+    return math.degrees(2 * math.acos(min(dot, 1.0)))
+
+
+def _error(points, index, first, last, tolerance):
+    """Returns the error of dropping points[index] relative to the tolerance
+    (> 1 means it must be kept) and its position error.
+    """
+    point, start, end = points[index], points[first], points[last]
+    span = end['t'] - start['t']
+    if span > 0:
+        u = float(point['t'] - start['t']) / span
+    else:
+        u = float(index - first) / (last - first)
+
+    position = _segment_distance(point['pos'][0], start['pos'][0], end['pos'][0])
+    angle = _angle(point['pos'][1], start['pos'][1], end['pos'][1], u)
+    pressure = abs(point['p'] - (start['p'] + (end['p'] - start['p']) * u))
+
+    relative = max(
+        position / tolerance.position,
+        angle / tolerance.angle,
+        pressure / tolerance.pressure,
+    )
+    return relative, position
+
+
+def simplify(points, tolerance):
+    """Returns (kept points, largest position error of a dropped point)."""
+    if len(points) <= 2:
+        return list(points), 0.0
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_error = None, 1.0
+        for index in xrange(first + 1, last):
+            relative, _ = _error(points, index, first, last, tolerance)
+            if relative > worst_error:
+                worst, worst_error = index, relative
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+
+    kept = [index for index, flag in enumerate(keep) if flag]
+    max_error = 0.0
+    for first, last in zip(kept, kept[1:]):
+        for index in xrange(first + 1, last):
+            max_error = max(max_error, _error(points, index, first, last, tolerance)[1])
+    return [points[index] for index in kept], max_error
+
+
+def simplify_sketch(sketch, tolerance):
+    """Returns (simplified actions.json document, report) for one level."""
+    actions = []
+    points_before = points_after = 0
+    max_error = 0.0
+    for action in sketch['actions']:
+        if action['type'] != 'STROKE':
+            actions.append(action)
+            continue
+
+        segments = []
+        for segment in action['data']['points']:
+            simplified, error = simplify(segment, tolerance)
+            segments.append(simplified)
+            points_before += len(segment)
+            points_after += len(simplified)
+            max_error = max(max_error, error)
+
+        data = dict(action['data'], points=segments)
+        actions.append(dict(action, data=data))
+
+    report = {
+        'points': points_after,
+        'source_points': points_before,
+        'max_error': max_error,
+    }
+    return dict(sketch, actions=actions), report
+
+
+def build_levels(sketch, levels=None):
+    """Returns ({file name: contents}, {level: report}) for every LOD level."""
+    files = {}
+    reports = {}
+    for level, tolerance in sorted((levels or LEVELS).items()):
+        simplified, report = simplify_sketch(sketch, tolerance)
+        files[file_name(level)] = json.dumps(simplified, separators=(',', ':'))
+        reports[level] = report
+    return files, reports
@@ -0,0 +1,330 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+The OBJ models in data/models as indexed, binary meshes.
+
+scripts/compile_models.py writes build/models/<model>.mesh, a
+udon.sketchformat container with the magic 'VASM' whose header is
+
+    {
+        "format": "mesh",
+        "quantized": false,
+        "vertex_count": 1234,
+        "index_count": 5678,
+        "bounds": [x0, y0, z0, x1, y1, z1],
+        "groups": [
+            {"name": "Geo_HMD", "material": "HMD", "bounds": [...],
+             "vertex_start": 0, "vertex_count": 1234,
+             "index_start": 0, "index_count": 5678},
+            ...
+        ],
+        "max_error": {"normal": 0.0, "uv": 0.0}
+    }
+
+with one group per object ('o' line) of the OBJ, as OBJLoader makes one
+mesh per object. Sections:
+
+    position     f  x, y, z per vertex
+    normal       f  x, y, z per vertex, if the OBJ has normals
+    uv           f  u, v per vertex, if the OBJ has texture coordinates
+    index        H  three per triangle, relative to the group's vertex_start
+                    (I if a group has more than 65536 vertices)
+
+Vertices are deduplicated within a group: corners with the same position,
+normal and texture coordinates share one vertex. Quads are split the way
+OBJLoader splits them and larger polygons are fanned out from their first
+corner.
+
+When compiled with quantize=True normals are stored as signed bytes
+(value = q / 127) and texture coordinates as
+
+    uv           H  quantized: value = offset + q * scale
+    uv.offset    f  per component
+    uv.scale     f
+
+header['max_error'] is the largest difference from the OBJ in each.
+"""
+from array import array
+
+from .sketchformat import FormatError, _quantize_column, read_container, write_container
+
+
+MAGIC = 'VASM'
+FILE_SUFFIX = '.mesh'
+NORMAL_STEPS = 127
+MAX_SHORT_INDEX = 65536
+
+
+class MeshError(FormatError):
+    pass
+
+
+def _object(name):
+    return {'name': name, 'material': '', 'faces': []}
+
+
+def _resolve(value, count, what, line_number):
+    index = int(value)
+    index = index - 1 if index > 0 else index + count
+    if not 0 <= index < count:
+        raise MeshError("line %d: %s index %s is out of range" % (line_number, what, value))
+    return index
+
+
+def parse_obj(text):
+    """Returns (positions, uvs, normals, objects) from the text of an OBJ
+    file. The first three are lists of tuples; each object is a dict of its
+    name, material and faces, a face being a list of (position, uv, normal)
+    indices into them with None for the ones it does not have.
+    """
+    positions, uvs, normals = [], [], []
+    objects = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        parts = line.split()
+        if not parts or parts[0].startswith('#'):
+            continue
+        keyword = parts[0]
+        try:
+            if keyword == 'v':
+                positions.append(tuple(float(value) for value in parts[1:4]))
+            elif keyword == 'vn':
+                normals.append(tuple(float(value) for value in parts[1:4]))
+            elif keyword == 'vt':
+                uvs.append(tuple(float(value) for value in parts[1:3]))
+            elif keyword == 'f':
+                if len(parts) < 4:
+                    raise MeshError("line %d: a face needs at least three corners" % line_number)
+                face = []
+                for corner in parts[1:]:
+                    fields = corner.split('/') + ['', '']
+                    face.append((
+                        _resolve(fields[0], len(positions), 'position', line_number),
+                        _resolve(fields[1], len(uvs), 'uv', line_number) if fields[1] else None,
+                        _resolve(fields[2], len(normals), 'normal', line_number) if fields[2] else None,
+                    ))
+                if not objects:
+                    objects.append(_object(''))
+                objects[-1]['faces'].append(face)
+            elif keyword == 'o':
+                objects.append(_object(line[1:].strip()))
+            elif keyword == 'usemtl':
+                if not objects:
+                    objects.append(_object(''))
+                objects[-1]['material'] = line.split(None, 1)[1].strip()
+        except ValueError as e:
+            if isinstance(e, MeshError):
+                raise
+            raise MeshError("line %d: %s" % (line_number, e))
+        # g, s and mtllib lines do not change the geometry
+    return positions, uvs, normals, objects
+
+
+def _triangles(face):
+    if len(face) == 4:
+        a, b, c, d = face
+        return [(a, b, d), (b, c, d)]
+    return [(face[0], face[i], face[i + 1]) for i in xrange(1, len(face) - 1)]
+
+
+def _bounds(values):
+    xs, ys, zs = values[0::3], values[1::3], values[2::3]
+    return [min(xs), min(ys), min(zs), max(xs), max(ys), max(zs)]
+
+
+def _quantize_normal(value):
+    return int(round(max(-1.0, min(1.0, value)) * NORMAL_STEPS))
+
+
+def _decode_normal(normal):
+    return tuple(value / float(NORMAL_STEPS) for value in normal)
+
+
+def _decode_uv(uv, offset, scale):
+    return tuple(offset[i] + q * scale[i] for i, q in enumerate(uv))
+
+
+def _max_error(stored, source):
+    return max([abs(a - b) for values, expected in zip(stored, source) for a, b in zip(values, expected)] or [0])
+
+
+def compile_obj(text, quantize=False):
+    """Compiles the text of an OBJ file into a .mesh string."""
+    positions, uvs, normals, objects = parse_obj(text)
+    objects = [obj for obj in objects if obj['faces']]
+    if not objects:
+        raise MeshError("The OBJ has no faces")
+
+    corners = [corner for obj in objects for face in obj['faces'] for corner in face]
+    has_uv = corners[0][1] is not None
+    has_normal = corners[0][2] is not None
+    if any((uv is not None) != has_uv or (normal is not None) != has_normal for _, uv, normal in corners):
+        raise MeshError("Either every face corner or none must have texture coordinates, and the same for normals")
+
+    header = {'format': 'mesh', 'quantized': quantize, 'groups': [], 'max_error': {}}
+
+    # What each OBJ position, uv and normal becomes in the file, so that
+    # corners are deduplicated on the values that are actually stored
+    stored_positions = [tuple(array('f', position)) for position in positions]
+    stored_uvs = [tuple(array('f', uv)) for uv in uvs]
+    stored_normals = [tuple(array('f', normal)) for normal in normals]
+    decoded_uvs, decoded_normals = stored_uvs, stored_normals
+    if quantize and has_uv:
+        columns = [_quantize_column([uv[i] for uv in uvs]) for i in xrange(2)]
+        uv_offset = array('f', [offset for offset, _, _ in columns])
+        uv_scale = array('f', [scale for _, scale, _ in columns])
+        stored_uvs = zip(columns[0][2], columns[1][2])
+        decoded_uvs = [_decode_uv(uv, uv_offset, uv_scale) for uv in stored_uvs]
+    if quantize and has_normal:
+        stored_normals = [tuple(_quantize_normal(value) for value in normal) for normal in normals]
+        decoded_normals = [_decode_normal(normal) for normal in stored_normals]
+    if has_uv:
+        header['max_error']['uv'] = _max_error(decoded_uvs, uvs)
+    if has_normal:
+        header['max_error']['normal'] = _max_error(decoded_normals, normals)
+
+    position_data, uv_data, normal_data = [], [], []
+    indices = []
+    for obj in objects:
+        vertex_start, index_start = len(position_data) // 3, len(indices)
+        vertices = {}
+        for face in obj['faces']:
+            for triangle in _triangles(face):
+                for position, uv, normal in triangle:
+                    key = (
+                        stored_positions[position],
+                        stored_uvs[uv] if has_uv else None,
+                        stored_normals[normal] if has_normal else None,
+                    )
+                    vertex = vertices.get(key)
+                    if vertex is None:
+                        vertex = vertices[key] = len(vertices)
+                        position_data.extend(key[0])
+                        if has_uv:
+                            uv_data.extend(key[1])
+                        if has_normal:
+                            normal_data.extend(key[2])
+                    indices.append(vertex)
+        header['groups'].append({
+            'name': obj['name'],
+            'material': obj['material'],
+            'bounds': _bounds(position_data[vertex_start * 3:]),
+            'vertex_start': vertex_start,
+            'vertex_count': len(vertices),
+            'index_start': index_start,
+            'index_count': len(indices) - index_start,
+        })
+
+    header['vertex_count'] = len(position_data) // 3
+    header['index_count'] = len(indices)
+    header['bounds'] = _bounds(position_data)
+    short = all(group['vertex_count'] <= MAX_SHORT_INDEX for group in header['groups'])
+
+    sections = [('position', array('f', position_data))]
+    if has_normal:
+        sections.append(('normal', array('b' if quantize else 'f', normal_data)))
+    if has_uv:
+        if quantize:
+            sections.extend([('uv', array('H', uv_data)), ('uv.offset', uv_offset), ('uv.scale', uv_scale)])
+        else:
+            sections.append(('uv', array('f', uv_data)))
+    sections.append(('index', array('H' if short else 'I', indices)))
+
+    return write_container(MAGIC, header, sections)
+
+
+def decode_mesh(data):
+    """Returns the header of a .mesh string with its sections decoded to
+    lists of floats under 'position', 'normal' and 'uv', and of ints under
+    'index'.
+    """
+    header, sections = read_container(data, MAGIC)
+    if header.get('format') != 'mesh':
+        raise MeshError("Not a mesh container")
+    mesh = dict(header, sections={})
+    mesh['sections']['position'] = sections['position'].tolist()
+    mesh['sections']['index'] = sections['index'].tolist()
+    if 'normal' in sections:
+        normal = sections['normal'].tolist()
+        if header['quantized']:
+            normal = list(_decode_normal(normal))
+        mesh['sections']['normal'] = normal
+    if 'uv' in sections:
+        uv = sections['uv'].tolist()
+        if header['quantized']:
+            offset, scale = sections['uv.offset'], sections['uv.scale']
+            uv = [offset[i % 2] + q * scale[i % 2] for i, q in enumerate(uv)]
+        mesh['sections']['uv'] = uv
+    return mesh
+
+
+def _vertex(values, vertex, size):
+    return tuple(values[vertex * size:vertex * size + size])
+
+
+def _obj_corners(objects):
+    for obj in objects:
+        for face in obj['faces']:
+            for triangle in _triangles(face):
+                for corner in triangle:
+                    yield corner
+
+
+def verify(text, data):
+    """Returns a list of problems with a .mesh string compiled from the OBJ
+    `text`: every triangle corner must match the OBJ to float32 precision,
+    or to the header's max_error for quantized attributes.
+    """
+    positions, uvs, normals, objects = parse_obj(text)
+    objects = [obj for obj in objects if obj['faces']]
+    mesh = decode_mesh(data)
+    sections = mesh['sections']
+    problems = []
+    if len(objects) != len(mesh['groups']):
+        return ["%d objects became %d groups" % (len(objects), len(mesh['groups']))]
+    if len(sections['position']) != mesh['vertex_count'] * 3 or len(sections['index']) != mesh['index_count']:
+        return ["section lengths do not match the header's counts"]
+
+    sources = [('position', 3, 0, positions, 0.0)]
+    if 'normal' in sections:
+        sources.append(('normal', 3, 2, normals, mesh['max_error']['normal']))
+    if 'uv' in sections:
+        sources.append(('uv', 2, 1, uvs, mesh['max_error']['uv']))
+
+    corners = list(_obj_corners(objects))
+    if len(corners) != mesh['index_count']:
+        return ["the OBJ has %d triangle corners, the mesh %d" % (len(corners), mesh['index_count'])]
+
+    for group in mesh['groups']:
+        vertex_end = group['vertex_start'] + group['vertex_count']
+        for i in xrange(group['index_start'], group['index_start'] + group['index_count']):
+            vertex = group['vertex_start'] + sections['index'][i]
+            if vertex >= vertex_end:
+                problems.append("index %d points outside group %r" % (i, group['name']))
+                continue
+            corner = corners[i]
+            for name, size, column, source, tolerance in sources:
+                expected = array('f', source[corner[column]]).tolist()
+                got = _vertex(sections[name], vertex, size)
+                # float32 rounding of the offset/scale arithmetic
+                if any(abs(a - b) > tolerance + 1e-6 * max(1.0, abs(a)) for a, b in zip(got, expected)):
+                    problems.append("corner %d: %s %r is not %r" % (i, name, got, expected))
+        if len(problems) > 20:
+            break
+
+    bounds = _bounds(sections['position'])
+    if bounds != mesh['bounds']:
+        problems.append("bounds %r do not match the vertices' %r" % (mesh['bounds'], bounds))
+    return problems
@@ -0,0 +1,331 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Just enough of the ISO base media (MP4) format to move the moov box in
+front of the media data ("fast start") and to index where the keyframes of
+the video track are.
+
+A keyframe index, written next to a video as <name>.keyframes.json, looks
+like:
+
+    {
+        "version": 1,
+        "size": 12345678,
+        "timescale": 30000,
+        "keyframes": [[decode time in seconds, byte offset], ...]
+    }
+
+The byte offset is where the keyframe's sample data starts in the file.
+"""
+import json
+import os
+import struct
+from collections import OrderedDict, namedtuple
+
+
+VERSION = 1
+INDEX_SUFFIX = '.keyframes.json'
+
+COPY_SIZE = 1024 * 1024
+
+# Boxes whose payload is just more boxes, on the way down to the sample tables
+CONTAINERS = frozenset(['moov', 'trak', 'mdia', 'minf', 'stbl'])
+
+Box = namedtuple('Box', ['type', 'offset', 'size', 'header_size'])
+
+
+class MP4Error(ValueError):
+    pass
+
+
+def read_boxes(data, start=0, end=None):
+    """Returns the boxes in data[start:end] (a string or any object with
+    seek/read, in which case `end` is required).
+    """
+    if end is None:
+        end = len(data)
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        header = _read(data, offset, 16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise MP4Error("bad %r box at %d" % (box_type, offset))
+        boxes.append(Box(box_type, offset, size, header_size))
+        offset += size
+    return boxes
+
+
+def _read(data, offset, length):
+    if isinstance(data, (str, bytearray)):
+        return str(data[offset:offset + length])
+    data.seek(offset)
+    return data.read(length)
+
+
+def find(data, box, path):
+    """Returns the boxes found by following a list of box types down from box."""
+    found = [box]
+    for box_type in path:
+        found = [
+            child
+            for parent in found
+            for child in read_boxes(data, parent.offset + parent.header_size, parent.offset + parent.size)
+            if child.type == box_type
+        ]
+    return found
+
+
+def walk(data, boxes):
+    """Yields every box under `boxes`, descending into CONTAINERS."""
+    for box in boxes:
+        yield box
+        if box.type in CONTAINERS:
+            children = read_boxes(data, box.offset + box.header_size, box.offset + box.size)
+            for child in walk(data, children):
+                yield child
+
+
+def _full_box_payload(data, box):
+    # skips the version and flags of a full box
+    return box.offset + box.header_size + 4
+
+
+def chunk_offset_tables(moov_data):
+    """Yields (box, entry format, offset of the first entry, entry count) for
+    every stco and co64 box in a moov box's bytes.
+    """
+    for box in walk(moov_data, read_boxes(moov_data)):
+        if box.type in ('stco', 'co64'):
+            payload = _full_box_payload(moov_data, box)
+            count = struct.unpack('>I', moov_data[payload:payload + 4])[0]
+            entry_format = '>I' if box.type == 'stco' else '>Q'
+            yield box, entry_format, payload + 4, count
+
+
+def top_level(path):
+    with open(path, 'rb') as video:
+        return read_boxes(video, 0, os.path.getsize(path))
+
+
+def needs_faststart(boxes):
+    types = [box.type for box in boxes]
+    if 'moov' not in types or 'mdat' not in types:
+        raise MP4Error("not an MP4 file with a moov and an mdat box")
+    return types.index('moov') > types.index('mdat')
+
+
+def faststart(source_path, output_path):
+    """Writes source_path to output_path with moov moved to just after the
+    boxes that precede the first mdat, fixing up every chunk offset.
+    Returns {old box offset: new box offset} for the top-level boxes.
+    """
+    boxes = top_level(source_path)
+    needs_faststart(boxes)
+
+    moov = [box for box in boxes if box.type == 'moov'][0]
+    first_mdat = [box.type for box in boxes].index('mdat')
+    order = [box for box in boxes[:first_mdat] if box.type != 'moov']
+    order.append(moov)
+    order.extend(box for box in boxes[first_mdat:] if box.type != 'moov')
+
+    moved = OrderedDict()
+    offset = 0
+    for box in order:
+        moved[box.offset] = offset
+        offset += box.size
+
+    def new_offset(old):
+        for box in boxes:
+            if box.offset <= old < box.offset + box.size:
+                return old - box.offset + moved[box.offset]
+        raise MP4Error("chunk offset %d is outside the file" % old)
+
+    with open(source_path, 'rb') as source:
+        source.seek(moov.offset)
+        moov_data = bytearray(source.read(moov.size))
+
+        for box, entry_format, first, count in chunk_offset_tables(moov_data):
+            size = struct.calcsize(entry_format)
+            for position in xrange(first, first + count * size, size):
+                old = struct.unpack(entry_format, str(moov_data[position:position + size]))[0]
+                new = new_offset(old)
+                if entry_format == '>I' and new > 0xffffffff:
+                    raise MP4Error("chunk offset %d no longer fits in stco" % new)
+                moov_data[position:position + size] = struct.pack(entry_format, new)
+
+        with open(output_path, 'wb') as output:
+            for box in order:
+                if box is moov:
+                    output.write(moov_data)
+                    continue
+                source.seek(box.offset)
+                remaining = box.size
+                while remaining:
+                    data = source.read(min(COPY_SIZE, remaining))
+                    if not data:
+                        raise MP4Error("%s ends early" % source_path)
+                    output.write(data)
+                    remaining -= len(data)
+    return moved
+
+
+def chunk_offsets(path):
+    """Returns every chunk offset of every track, in order."""
+    boxes = top_level(path)
+    moov = [box for box in boxes if box.type == 'moov'][0]
+    with open(path, 'rb') as video:
+        video.seek(moov.offset)
+        moov_data = video.read(moov.size)
+    offsets = []
+    for box, entry_format, first, count in chunk_offset_tables(moov_data):
+        size = struct.calcsize(entry_format)
+        for position in xrange(first, first + count * size, size):
+            offsets.append(struct.unpack(entry_format, moov_data[position:position + size])[0])
+    return offsets
+
+
+def verify_faststart(source_path, output_path, sample_bytes=64):
+    """Checks that output_path starts with its moov and that every chunk
+    still points at the same media data it did in source_path.
+    """
+    boxes = top_level(output_path)
+    if needs_faststart(boxes):
+        raise MP4Error("%s still has moov after mdat" % output_path)
+    if os.path.getsize(source_path) != os.path.getsize(output_path):
+        raise MP4Error("%s is not the same size as %s" % (output_path, source_path))
+
+    before = chunk_offsets(source_path)
+    after = chunk_offsets(output_path)
+    if len(before) != len(after):
+        raise MP4Error("%s has a different number of chunks" % output_path)
+    with open(source_path, 'rb') as source:
+        with open(output_path, 'rb') as output:
+            for old, new in zip(before, after):
+                source.seek(old)
+                output.seek(new)
+                if source.read(sample_bytes) != output.read(sample_bytes):
+                    raise MP4Error("chunk at %d moved to %d has different data" % (old, new))
+
+
+def _table(data, box, entry_format, header_format='>I'):
+    """Reads a full box made of a count and that many fixed-size entries."""
+    payload = _full_box_payload(data, box)
+    header_size = struct.calcsize(header_format)
+    header = struct.unpack(header_format, _read(data, payload, header_size))
+    count = header[-1]
+    size = struct.calcsize(entry_format)
+    raw = _read(data, payload + header_size, count * size)
+    return header, [struct.unpack(entry_format, raw[i:i + size]) for i in xrange(0, count * size, size)]
+
+
+def video_track(data, moov):
+    for trak in find(data, moov, ['trak']):
+        for hdlr in find(data, trak, ['mdia', 'hdlr']):
+            handler = _read(data, _full_box_payload(data, hdlr) + 4, 4)
+            if handler == 'vide':
+                return trak
+    raise MP4Error("no video track")
+
+
+def keyframes(path):
+    """Returns (timescale, [(decode time in seconds, byte offset), ...]) for
+    the keyframes of the video track.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as video:
+        boxes = read_boxes(video, 0, size)
+        moov = [box for box in boxes if box.type == 'moov'][0]
+        trak = video_track(video, moov)
+
+        mdhd = find(video, trak, ['mdia', 'mdhd'])[0]
+        payload = mdhd.offset + mdhd.header_size
+        version = ord(_read(video, payload, 1))
+        timescale_at = payload + (20 if version == 1 else 12)
+        timescale = struct.unpack('>I', _read(video, timescale_at, 4))[0]
+
+        stbl = find(video, trak, ['mdia', 'minf', 'stbl'])[0]
+        tables = dict((box.type, box) for box in read_boxes(video, stbl.offset + stbl.header_size, stbl.offset + stbl.size))
+        if 'stsz' not in tables:
+            raise MP4Error("unsupported sample size table")
+
+        (sample_size, _), sizes = _table(video, tables['stsz'], '>I', '>II')
+        if sample_size:
+            count = struct.unpack('>I', _read(video, _full_box_payload(video, tables['stsz']) + 4, 4))[0]
+            sizes = [sample_size] * count
+        else:
+            sizes = [entry[0] for entry in sizes]
+
+        _, sample_to_chunk = _table(video, tables['stsc'], '>III')
+        if 'stco' in tables:
+            _, chunks = _table(video, tables['stco'], '>I')
+        else:
+            _, chunks = _table(video, tables['co64'], '>Q')
+        chunks = [entry[0] for entry in chunks]
+
+        _, deltas = _table(video, tables['stts'], '>II')
+        sync = None
+        if 'stss' in tables:
+            _, sync = _table(video, tables['stss'], '>I')
+            sync = set(entry[0] for entry in sync)
+
+    # sample number (1-based) -> byte offset
+    offsets = []
+    for i, (first_chunk, per_chunk, _) in enumerate(sample_to_chunk):
+        last_chunk = sample_to_chunk[i + 1][0] if i + 1 < len(sample_to_chunk) else len(chunks) + 1
+        for chunk in xrange(first_chunk, last_chunk):
+            offset = chunks[chunk - 1]
+            for _ in xrange(per_chunk):
+                offsets.append(offset)
+                offset += sizes[len(offsets) - 1]
+
+    index = []
+    sample = 0
+    time = 0
+    for count, delta in deltas:
+        for _ in xrange(count):
+            sample += 1
+            if sample > len(offsets):
+                break
+            if sync is None or sample in sync:
+                index.append((float(time) / timescale, offsets[sample - 1]))
+            time += delta
+    return timescale, index
+
+
+def build_index(path):
+    timescale, frames = keyframes(path)
+    return {
+        'version': VERSION,
+        'size': os.path.getsize(path),
+        'timescale': timescale,
+        'keyframes': [[round(time, 6), offset] for time, offset in frames],
+    }
+
+
+def dumps(index):
+    return json.dumps(index, sort_keys=True, separators=(',', ':'))
+
+
+def load_index(path):
+    with open(path, 'rb') as index_file:
+        return json.loads(index_file.read())
@@ -0,0 +1,120 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+A cache of rendered pages whose output depends only on data.json.
+
+Pages are keyed on the catalog digest (data.json plus the fingerprint
+manifest) and the request path. The deploy version is part of every key
+already through CACHES['default']['KEY_PREFIX'].
+
+Entries are kept for PAGE_CACHE_STALE_TIMEOUT past their PAGE_CACHE_TIMEOUT
+so that when one expires a single request re-renders it, holding a lock,
+while everyone else keeps getting the stale copy.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+
+from . import utils
+
+
+WAIT_INTERVAL = 0.05  # seconds
+
+_catalog = None
+
+
+def page_key(digest, path):
+    return 'page:%s:%s' % (digest, hashlib.md5(path.encode('utf-8')).hexdigest())
+
+
+def page_paths(catalog):
+    """The paths of every page this cache can hold for a catalog."""
+    paths = [reverse('home')]
+    for artist in catalog.artists:
+        for session in catalog.get_sessions(artist['slug']):
+            paths.append(reverse('session', args=[artist['slug'], session['slug']]))
+    return paths
+
+
+def invalidate(catalog=None):
+    """Drops every cached page rendered from `catalog` (the current one by default)."""
+    catalog = catalog or utils.get_data()
+    cache.delete_many([page_key(catalog.digest, path) for path in page_paths(catalog)])
+
+
+def _current_catalog():
+    global _catalog
+    catalog = utils.get_data()
+    if _catalog is not None and _catalog is not catalog:
+        logging.info("data.json has changed, dropping the pages rendered from it")
+        invalidate(_catalog)
+    _catalog = catalog
+    return catalog
+
+
+def _response(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
+
+
+def _wait_for(key):
+    """Waits up to PAGE_CACHE_WAIT seconds for another request to store key."""
+    deadline = time.time() + settings.PAGE_CACHE_WAIT
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cache_page(view):
+    """Serves successful GET responses of `view` from the page cache."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.PAGE_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        key = page_key(_current_catalog().digest, request.path)
+        entry = cache.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            return _response(entry)
+
+        lock_key = key + ':lock'
+        if not cache.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            # Someone else is rendering this page
+            entry = entry or _wait_for(key)
+            if entry is not None:
+                return _response(entry)
+            return view(request, *args, **kwargs)
+
+        try:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, {
+                    'expires': time.time() + settings.PAGE_CACHE_TIMEOUT,
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                }, settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return response
+    return wrapper
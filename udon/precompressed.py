@@ -0,0 +1,182 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Gzip and brotli variants of the JSON and OBJ files under data/ (and of the
+compiled models in build/models, see scripts/compile_models.py).
+
+scripts/compress_data.py writes <path>.gz and <path>.br for every file
+into PRECOMPRESSED_DIR, along with an index:
+
+    {
+        "version": 1,
+        "files": {
+            "sketches/ab_bull/actions.json": {
+                "sha1": "...",
+                "size": 1234,
+                "encodings": {"br": 123, "gzip": 234},
+                "incompressible": []
+            },
+            ...
+        }
+    }
+
+An encoding is only listed in "encodings" if its variant is smaller than
+the original; otherwise no variant is written and it is listed in
+"incompressible", so it is not tried again until the file changes.
+Brotli is optional at build time; without the brotli package only gzip
+variants are written.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from cStringIO import StringIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+VERSION = 1
+INDEX_NAME = 'precompressed.json'
+EXTENSIONS = ('.json', '.obj')
+CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.obj': 'text/plain',
+    '.mesh': 'application/octet-stream',
+}
+
+# In order of preference when the client accepts several equally
+SUFFIXES = [
+    ('br', '.br'),
+    ('gzip', '.gz'),
+]
+
+
+def _gzip(data):
+    out = StringIO()
+    # A fixed mtime keeps the output identical between builds
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return out.getvalue()
+
+
+def _brotli(data):
+    return brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+
+
+def available_encodings():
+    encodings = {'gzip': _gzip}
+    if brotli is not None:
+        encodings['br'] = _brotli
+    return encodings
+
+
+def content_type(path):
+    return (
+        CONTENT_TYPES.get(os.path.splitext(path)[1]) or
+        mimetypes.guess_type(path)[0] or
+        'application/octet-stream'
+    )
+
+
+def variant_name(path, encoding):
+    return path + dict(SUFFIXES)[encoding]
+
+
+def compress_file(data):
+    """Returns (index entry, {encoding: compressed data}) for a file's contents."""
+    entry = {'sha1': hashlib.sha1(data).hexdigest(), 'size': len(data), 'encodings': {}, 'incompressible': []}
+    variants = {}
+    for encoding, compress in sorted(available_encodings().items()):
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            entry['encodings'][encoding] = len(compressed)
+            variants[encoding] = compressed
+        else:
+            entry['incompressible'].append(encoding)
+    return entry, variants
+
+
+def find_sources(source_dir):
+    """Yields the paths, relative to source_dir, of every file to compress."""
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(EXTENSIONS):
+                yield os.path.relpath(os.path.join(dir_path, file_name), source_dir).replace(os.sep, '/')
+
+
+def parse_accept_encoding(header):
+    """Returns {coding: q value} for an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header, encodings):
+    """Picks the best of the available `encodings` for an Accept-Encoding
+    header, or None to send the file as it is.
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding, _ in SUFFIXES:
+        if encoding not in encodings:
+            continue
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    if best is not None and accepted.get('identity', 0.0) > best_q:
+        return None
+    return best
+
+
+_indexes = {}
+
+
+def load_index(output_dir):
+    """Returns the parsed index, re-reading it only when it changes. A missing
+    index is treated as empty, so files are simply served uncompressed.
+    """
+    path = os.path.join(output_dir, INDEX_NAME)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {'version': VERSION, 'files': {}}
+    cached = _indexes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as index_file:
+            cached = _indexes[path] = (mtime, json.loads(index_file.read()))
+    return cached[1]
+
+
+def dumps(index):
+    return json.dumps(index, sort_keys=True, separators=(',', ':'))
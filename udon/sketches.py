@@ -0,0 +1,450 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+data/sketches as NumPy arrays, for the scripts in scripts/ (the app itself
+does not use it and numpy is only needed here, pip install numpy).
+
+    from udon import sketches
+
+    sketch = sketches.load('ab_bull')
+    sketch.meta                     # meta.json, parsed; likewise props,
+                                    # offsets, playback and editing (None if
+                                    # the sketch has no such file)
+    sketch.strokes                  # STROKE_DTYPE, one row per STROKE action
+    sketch.points                   # POINT_DTYPE, every point of every stroke
+    sketch.stroke_points(i)         # the points of stroke row i (a view)
+    sketch.input                    # float32 (frames, 29), INPUT_COLUMNS
+
+The arrays are loaded the first time they are used and load() keeps the
+last CACHE_SIZE sketches. actions.json and input.json are parsed as a
+stream, so a large sketch never needs its whole JSON text and the parsed
+Python objects in memory at once.
+
+Column layouts
+--------------
+
+strokes (STROKE_DTYPE), in the order the STROKE actions appear:
+
+    id              uint32   stroke id, as referenced by DELETE actions
+    brush           uint16   index into metadata['BrushIndex']
+    size            float32  brush size
+    color           float32  (3,) r, g, b
+    time            uint32   time of the STROKE action, ms
+    t0, t1          uint32   time of the first and last point, ms
+    point_start     uint32   first row of the stroke in points
+    point_end       uint32   one past its last row
+    segment_count   uint32   number of segments (pen lifts) in the stroke
+    deleted         int64    time of the DELETE of the stroke, ms, or -1;
+                             resolved like udon.snapshots: a DELETE before the
+                             stroke is drawn or of a deleted stroke is ignored
+
+points (POINT_DTYPE), grouped by stroke in stroke order:
+
+    stroke          uint32   row of the stroke in strokes
+    segment         uint32   segment of the stroke the point belongs to
+    t               uint32   ms
+    p               float32  pressure
+    pos             float32  (3,) x, y, z in Tilt Brush units
+    rot             float32  (4,) qx, qy, qz, qw
+
+point_offsets is uint32 (strokes + 1,): stroke i is
+points[point_offsets[i]:point_offsets[i + 1]].
+
+deletes (DELETE_DTYPE): time uint32 ms and stroke uint32 (a stroke id).
+
+input is float32 (frames, 29); INPUT_COLUMNS names the columns (the same
+layout as sketchformat.INPUT_LAYOUT): the time, then x, y, z, qx, qy, qz,
+qw for the HMD, right hand, left hand and mirror.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .sketchformat import INPUT_LAYOUT, INPUT_STRIDE
+
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sketches')
+CACHE_SIZE = 8
+
+READ_SIZE = 1024 * 1024
+
+STROKE_DTYPE = [
+    ('id', '<u4'),
+    ('brush', '<u2'),
+    ('size', '<f4'),
+    ('color', '<f4', (3,)),
+    ('time', '<u4'),
+    ('t0', '<u4'),
+    ('t1', '<u4'),
+    ('point_start', '<u4'),
+    ('point_end', '<u4'),
+    ('segment_count', '<u4'),
+    ('deleted', '<i8'),
+]
+
+POINT_DTYPE = [
+    ('stroke', '<u4'),
+    ('segment', '<u4'),
+    ('t', '<u4'),
+    ('p', '<f4'),
+    ('pos', '<f4', (3,)),
+    ('rot', '<f4', (4,)),
+]
+
+DELETE_DTYPE = [
+    ('time', '<u4'),
+    ('stroke', '<u4'),
+]
+
+INPUT_COLUMNS = INPUT_LAYOUT
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("udon.sketches needs numpy (pip install numpy)")
+
+
+class _JSONStream(object):
+    """Reads JSON values one at a time from a file, buffering only as much
+    text as the value being decoded needs.
+    """
+
+    def __init__(self, json_file):
+        self.file = json_file
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.file.read(max(READ_SIZE, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+
+    def peek(self):
+        """Returns the next non-whitespace character, or '' at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("expected %r at %r" % (char, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # a number at the end of the buffer may continue in the next read
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Yields (key, stream) for each member of an object; the caller must
+        consume each value before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key, self
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def elements(self):
+        """Yields each element of an array."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def parse_actions(json_file):
+    """Returns (metadata, strokes, points, deletes, other actions) from an
+    actions.json file object.
+    """
+    _require_numpy()
+    metadata = {}
+    strokes = []
+    deletes = []
+    deleted = {}  # stroke row -> time
+    rows = {}  # stroke id -> row of the last stroke drawn with it
+    others = []
+    point_columns = dict((name, []) for name in ('segment', 't', 'p', 'pos', 'rot'))
+    point_counts = []
+
+    stream = _JSONStream(json_file)
+    for key, value in stream.items():
+        if key != 'actions':
+            parsed = value.value()
+            if key == 'metadata':
+                metadata = parsed
+            continue
+
+        for action in value.elements():
+            data = action['data']
+            if action['type'] == 'STROKE':
+                count = 0
+                for segment_index, segment in enumerate(data['points']):
+                    for point in segment:
+                        point_columns['segment'].append(segment_index)
+                        point_columns['t'].append(point['t'])
+                        point_columns['p'].append(point['p'])
+                        point_columns['pos'].append(point['pos'][0])
+                        point_columns['rot'].append(point['pos'][1])
+                        count += 1
+                point_counts.append(count)
+                rows[data['id']] = len(strokes)
+                strokes.append((
+                    data['id'], data['brush'], data['b_size'], data['color'],
+                    action['time'], len(data['points']),
+                ))
+            elif action['type'] == 'DELETE':
+                deletes.append((action['time'], data['strokeID']))
+                row = rows.get(data['strokeID'])
+                if row is not None and row not in deleted:
+                    deleted[row] = action['time']
+            else:
+                others.append(action)
+
+    point_offsets = np.zeros(len(strokes) + 1, dtype='<u4')
+    np.cumsum(point_counts, out=point_offsets[1:])
+
+    points = np.zeros(int(point_offsets[-1]), dtype=POINT_DTYPE)
+    for name, values in point_columns.items():
+        if values:
+            points[name] = values
+    points['stroke'] = np.repeat(np.arange(len(strokes), dtype='<u4'), point_counts)
+
+    table = np.zeros(len(strokes), dtype=STROKE_DTYPE)
+    if strokes:
+        ids, brushes, sizes, colors, times, segment_counts = zip(*strokes)
+        table['id'] = ids
+        table['brush'] = brushes
+        table['size'] = sizes
+        table['color'] = colors
+        table['time'] = times
+        table['segment_count'] = segment_counts
+    table['point_start'] = point_offsets[:-1]
+    table['point_end'] = point_offsets[1:]
+
+    # the first and last point of each stroke, or the action time if it has none
+    has_points = table['point_end'] > table['point_start']
+    table['t0'] = table['time']
+    table['t1'] = table['time']
+    table['t0'][has_points] = points['t'][table['point_start'][has_points]]
+    table['t1'][has_points] = points['t'][table['point_end'][has_points] - 1]
+
+    table['deleted'] = -1
+    for row, time in deleted.items():
+        table['deleted'][row] = time
+
+    return metadata, table, points, np.array(deletes, dtype=DELETE_DTYPE), others
+
+
+def parse_input(json_file):
+    """Returns the frames of an input.json file object as a float32
+    (frames, INPUT_STRIDE) matrix.
+    """
+    _require_numpy()
+    parts = []
+    tail = ''
+    started = False
+    while True:
+        data = json_file.read(READ_SIZE)
+        text = tail + data
+        if not started:
+            text = text.lstrip()
+            if not text:
+                if not data:
+                    break
+                continue
+            if text[0] != '[':
+                raise ValueError("input.json is not an array")
+            text = text[1:]
+            started = True
+        if data:
+            # the last number may continue in the next read
+            cut = text.rfind(',')
+            tail, text = text[cut + 1:], text[:cut + 1]
+        else:
+            tail = ''
+            text = text.rstrip().rstrip(']')
+        if text.strip():
+            parts.append(np.fromstring(text.replace(',', ' '), dtype='<f8', sep=' ').astype('<f4'))
+        if not data:
+            break
+    values = np.concatenate(parts) if parts else np.zeros(0, dtype='<f4')
+    if len(values) % INPUT_STRIDE:
+        raise ValueError("%d values is not a whole number of %d value frames" % (len(values), INPUT_STRIDE))
+    return values.reshape(-1, INPUT_STRIDE)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'rb') as json_file:
+            return json.loads(json_file.read())
+    except IOError:
+        return None
+
+
+class Sketch(object):
+    """One sketch directory, loaded a file at a time as attributes are used."""
+
+    def __init__(self, name, data_dir=DEFAULT_DATA_DIR):
+        self.name = name
+        self.path = os.path.join(data_dir, name)
+        if not os.path.isdir(self.path):
+            raise KeyError(name)
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, loader):
+        with self._lock:
+            if key not in self._loaded:
+                self._loaded[key] = loader()
+            return self._loaded[key]
+
+    def _json(self, part):
+        return self._get(part, lambda: _read_json(os.path.join(self.path, part + '.json')))
+
+    meta = property(lambda self: self._json('meta'))
+    props = property(lambda self: self._json('props'))
+    offsets = property(lambda self: self._json('offsets'))
+    playback = property(lambda self: self._json('playback'))
+    editing = property(lambda self: self._json('editing'))
+
+    def _actions(self):
+        def load():
+            path = os.path.join(self.path, 'actions.json')
+            if not os.path.exists(path):
+                _require_numpy()
+                return {}, np.zeros(0, STROKE_DTYPE), np.zeros(0, POINT_DTYPE), np.zeros(0, DELETE_DTYPE), []
+            with open(path, 'rb') as json_file:
+                return parse_actions(json_file)
+        return self._get('actions', load)
+
+    metadata = property(lambda self: self._actions()[0])
+    strokes = property(lambda self: self._actions()[1])
+    points = property(lambda self: self._actions()[2])
+    deletes = property(lambda self: self._actions()[3])
+    other_actions = property(lambda self: self._actions()[4])
+
+    @property
+    def point_offsets(self):
+        strokes = self.strokes
+        offsets = np.zeros(len(strokes) + 1, dtype='<u4')
+        offsets[:-1] = strokes['point_start']
+        offsets[-1] = len(self.points)
+        return offsets
+
+    @property
+    def input(self):
+        def load():
+            path = os.path.join(self.path, 'input.json')
+            if not os.path.exists(path):
+                _require_numpy()
+                return np.zeros((0, INPUT_STRIDE), dtype='<f4')
+            with open(path, 'rb') as json_file:
+                return parse_input(json_file)
+        return self._get('input', load)
+
+    def input_column(self, name):
+        return self.input[:, INPUT_COLUMNS.index(name)]
+
+    def stroke_points(self, row):
+        stroke = self.strokes[row]
+        return self.points[stroke['point_start']:stroke['point_end']]
+
+    def live_strokes(self, time):
+        """Rows of the strokes on the canvas at `time` (ms), by the rule of
+        snapshots.on_canvas.
+        """
+        strokes = self.strokes
+        deleted = strokes['deleted']
+        return np.nonzero((strokes['time'] <= time) & ((deleted < 0) | (deleted > time)))[0]
+
+    def bounds(self, rows=None):
+        """(min xyz, max xyz) of the points of the strokes in `rows` (all by
+        default), or None if there are none.
+        """
+        points = self.points
+        if rows is not None:
+            points = points[np.in1d(points['stroke'], rows)]
+        if not len(points):
+            return None
+        return points['pos'].min(axis=0), points['pos'].max(axis=0)
+
+
+def names(data_dir=DEFAULT_DATA_DIR):
+    """The sketches in data_dir that have a meta.json, in order."""
+    return [
+        name for name in sorted(os.listdir(data_dir))
+        if os.path.exists(os.path.join(data_dir, name, 'meta.json'))
+    ]
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load(name, data_dir=DEFAULT_DATA_DIR):
+    """Returns the Sketch for a sketch name, keeping the CACHE_SIZE most
+    recently used. Raises KeyError if there is no such sketch.
+    """
+    key = (data_dir, name)
+    with _cache_lock:
+        sketch = _cache.pop(key, None)
+        if sketch is None:
+            sketch = Sketch(name, data_dir)
+        _cache[key] = sketch
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return sketch
@@ -0,0 +1,446 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Binary containers for sketch data.
+
+actions.bin and input.bin files are both laid out as:
+
+    magic ('VASK' or 'VASI'), uint16 version, uint16 reserved, uint32 header length
+    a UTF-8 JSON header, padded with spaces to a multiple of 8 bytes
+    the sections listed in the header, each aligned to 8 bytes
+
+Every section is a flat little-endian array that can be wrapped directly in
+a typed array. The header maps each section name to [offset, count, type],
+where offset is relative to the start of the file and type is one of the
+`array` module type codes below ('B', 'H', 'I', 'f', 'd').
+
+actions.bin sections:
+
+    action_types           B  one entry per action, in order: 0 STROKE,
+                              1 DELETE, 2 anything else (kept in the header)
+    stroke_id              I
+    stroke_brush           H  index into header['metadata']['BrushIndex']
+    stroke_size            f
+    stroke_color           f  3 per stroke
+    stroke_time            I  time of the STROKE action
+    stroke_t0, stroke_t1   I  time of the first and last point
+    stroke_point_offset    I  n + 1 offsets into the point columns
+    stroke_segment_offset  I  n + 1 offsets into segment_offset
+    segment_offset         I  offsets into the point columns, one per segment
+                              plus a final end offset
+    point_t                I
+    point_p                f
+    point_pos              f  x, y, z per point
+    point_rot              f  qx, qy, qz, qw per point
+    delete_time            I
+    delete_stroke          I
+
+The source JSON mixes short decimals (0.143) with widened float32 values
+(0.02500000037252903), so each float column `c` also has:
+
+    c.exact                B  bitmap, LSB first; a set bit means the value is
+                              the float32 itself, a clear bit means it is the
+                              shortest decimal that rounds to that float32
+    c.exception_index      I  values neither rule reproduces ...
+    c.exception_value      d  ... and their exact float64 values
+
+which makes the round trip back to JSON numerically lossless.
+
+input.bin holds the input.json frames, INPUT_STRIDE values each: the time
+followed by position and quaternion for the HMD, right hand, left hand and
+mirror. Its single section is either
+
+    frames                 f  every frame, back to back
+
+or, when compiled with quantize=True,
+
+    time                   f  the first value of each frame
+    frames                 H  the remaining values, quantized
+    frames.offset          f  per column: value = offset + q * scale
+    frames.scale           f
+
+Quantization scales are powers of two, so every multiple of the scale
+(including 0, which the viewer tests the mirror position against) decodes
+exactly. header['max_error'] is the largest difference from the source.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+
+
+MAGIC = 'VASK'
+INPUT_MAGIC = 'VASI'
+VERSION = 1
+ALIGNMENT = 8
+
+PREAMBLE = struct.Struct('<4sHHI')
+
+ACTION_STROKE = 0
+ACTION_DELETE = 1
+ACTION_OTHER = 2
+
+FLOAT_COLUMNS = ('stroke_size', 'stroke_color', 'point_p', 'point_pos', 'point_rot')
+
+INPUT_STRIDE = 29
+INPUT_LAYOUT = ['time'] + [
+    '%s.%s' % (device, component)
+    for device in ('hmd', 'rhand', 'lhand', 'mirror')
+    for component in ('x', 'y', 'z', 'qx', 'qy', 'qz', 'qw')
+]
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _to_float32(values):
+    return array('f', values).tolist()
+
+
+_F32 = struct.Struct('<f')
+_shortest_cache = {}
+
+
+def _shortest(value):
+    """Returns the shortest decimal that rounds to the same float32."""
+    try:
+        return _shortest_cache[value]
+    except KeyError:
+        pass
+    packed = _F32.pack(value)
+    result = value
+    for digits in xrange(1, 10):
+        candidate = float('%.*g' % (digits, value))
+        if _F32.pack(candidate) == packed:
+            result = candidate
+            break
+    if len(_shortest_cache) < 100000:
+        _shortest_cache[value] = result
+    return result
+
+
+def _encode_floats(values):
+    """Splits float values into float32 data, an exact bitmap and exceptions."""
+    floats = _to_float32(values)
+    exact = array('B', [0]) * ((len(values) + 7) // 8)
+    exception_index = array('I')
+    exception_value = array('d')
+    for idx, (value, single) in enumerate(zip(values, floats)):
+        if single == value:
+            exact[idx >> 3] |= 1 << (idx & 7)
+        elif _shortest(single) != value:
+            exception_index.append(idx)
+            exception_value.append(value)
+    return array('f', floats), exact, exception_index, exception_value
+
+
+def _decode_floats(data, exact, exception_index, exception_value):
+    values = [
+        single if exact[idx >> 3] & (1 << (idx & 7)) else _shortest(single)
+        for idx, single in enumerate(data.tolist())
+    ]
+    for idx, value in zip(exception_index, exception_value):
+        values[idx] = value
+    return values
+
+
+def _uint(value, what):
+    if value != int(value) or not 0 <= value < 2 ** 32:
+        raise FormatError("%s must be an unsigned 32 bit integer, got %r" % (what, value))
+    return int(value)
+
+
+def _little_endian(arr):
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def write_container(magic, header, sections):
+    """Serialises a header dict and an ordered list of (name, array) pairs."""
+    header = dict(header, sections={})
+
+    # The section offsets depend on the header length, which depends on the
+    # offsets; reserve enough room by sizing the header with maximal offsets.
+    for name, arr in sections:
+        header['sections'][name] = [2 ** 32 - 1, len(arr), arr.typecode]
+    header_length = len(json.dumps(header, sort_keys=True, separators=(',', ':')))
+    header_length += -(PREAMBLE.size + header_length) % ALIGNMENT
+
+    offset = PREAMBLE.size + header_length
+    for name, arr in sections:
+        header['sections'][name][0] = offset
+        offset += len(arr) * arr.itemsize
+        offset += -offset % ALIGNMENT
+
+    header_json = json.dumps(header, sort_keys=True, separators=(',', ':'))
+    header_json += ' ' * (header_length - len(header_json))
+
+    chunks = [PREAMBLE.pack(magic, VERSION, 0, header_length), header_json]
+    position = PREAMBLE.size + header_length
+    for name, arr in sections:
+        data = _little_endian(arr).tostring()
+        chunks.append(data)
+        position += len(data)
+        padding = -position % ALIGNMENT
+        chunks.append('\0' * padding)
+        position += padding
+    return ''.join(chunks)
+
+
+def read_container(data, magic):
+    """Returns (header, {name: array}) for a container written by write_container."""
+    if len(data) < PREAMBLE.size:
+        raise FormatError("File is too short")
+    file_magic, version, _, header_length = PREAMBLE.unpack_from(data)
+    if file_magic != magic:
+        raise FormatError("Bad magic %r" % file_magic)
+    if version > VERSION:
+        raise FormatError("Unsupported version %d" % version)
+
+    header = json.loads(data[PREAMBLE.size:PREAMBLE.size + header_length])
+    sections = {}
+    for name, (offset, count, typecode) in header['sections'].items():
+        arr = array(str(typecode))
+        arr.fromstring(data[offset:offset + count * arr.itemsize])
+        sections[name] = _little_endian(arr)
+    return header, sections
+
+
+def compile_actions(sketch):
+    """Compiles a parsed actions.json document into an actions.bin string."""
+    action_types = array('B')
+    strokes = {
+        'stroke_id': array('I'),
+        'stroke_brush': array('H'),
+        'stroke_time': array('I'),
+        'stroke_t0': array('I'),
+        'stroke_t1': array('I'),
+        'stroke_point_offset': array('I', [0]),
+        'stroke_segment_offset': array('I', [0]),
+        'segment_offset': array('I', [0]),
+        'point_t': array('I'),
+        'delete_time': array('I'),
+        'delete_stroke': array('I'),
+    }
+    floats = dict((name, []) for name in FLOAT_COLUMNS)
+    others = []
+
+    for action in sketch['actions']:
+        data = action['data']
+        if action['type'] == 'STROKE':
+            action_types.append(ACTION_STROKE)
+            strokes['stroke_id'].append(_uint(data['id'], 'stroke id'))
+            strokes['stroke_brush'].append(data['brush'])
+            strokes['stroke_time'].append(_uint(action['time'], 'action time'))
+            floats['stroke_size'].append(data['b_size'])
+            if len(data['color']) != 3:
+                raise FormatError("Stroke %s has a %d component colour" % (data['id'], len(data['color'])))
+            floats['stroke_color'].extend(data['color'])
+
+            times = []
+            for segment in data['points']:
+                for point in segment:
+                    times.append(_uint(point['t'], 'point time'))
+                    floats['point_p'].append(point['p'])
+                    position, rotation = point['pos']
+                    floats['point_pos'].extend(position)
+                    floats['point_rot'].extend(rotation)
+                strokes['segment_offset'].append(strokes['segment_offset'][-1] + len(segment))
+
+            strokes['point_t'].extend(times)
+            strokes['stroke_t0'].append(times[0] if times else action['time'])
+            strokes['stroke_t1'].append(times[-1] if times else action['time'])
+            strokes['stroke_point_offset'].append(len(strokes['point_t']))
+            strokes['stroke_segment_offset'].append(len(strokes['segment_offset']) - 1)
+
+        elif action['type'] == 'DELETE':
+            action_types.append(ACTION_DELETE)
+            strokes['delete_time'].append(_uint(action['time'], 'action time'))
+            strokes['delete_stroke'].append(_uint(data['strokeID'], 'stroke id'))
+
+        else:
+            action_types.append(ACTION_OTHER)
+            others.append(action)
+
+    sections = [('action_types', action_types)]
+    for name in ('stroke_id', 'stroke_brush', 'stroke_time', 'stroke_t0', 'stroke_t1',
+                 'stroke_point_offset', 'stroke_segment_offset', 'segment_offset', 'point_t',
+                 'delete_time', 'delete_stroke'):
+        sections.append((name, strokes[name]))
+    for name in FLOAT_COLUMNS:
+        data, exact, exception_index, exception_value = _encode_floats(floats[name])
+        sections.append((name, data))
+        sections.append((name + '.exact', exact))
+        sections.append((name + '.exception_index', exception_index))
+        sections.append((name + '.exception_value', exception_value))
+
+    header = {
+        'format': 'actions',
+        'metadata': sketch.get('metadata', {}),
+        'other_actions': others,
+        'stroke_count': len(strokes['stroke_id']),
+        'point_count': len(strokes['point_t']),
+        'delete_count': len(strokes['delete_time']),
+    }
+    return write_container(MAGIC, header, sections)
+
+
+def decode_actions(data):
+    """Rebuilds the actions.json document from an actions.bin string."""
+    header, sections = read_container(data, MAGIC)
+    if header.get('format') != 'actions':
+        raise FormatError("Not an actions container")
+
+    floats = {}
+    for name in FLOAT_COLUMNS:
+        floats[name] = _decode_floats(
+            sections[name],
+            sections[name + '.exact'],
+            sections[name + '.exception_index'],
+            sections[name + '.exception_value'],
+        )
+
+    segment_offset = sections['segment_offset']
+    point_t = sections['point_t']
+    pos = floats['point_pos']
+    rot = floats['point_rot']
+    pressure = floats['point_p']
+
+    actions = []
+    others = iter(header['other_actions'])
+    stroke = 0
+    delete = 0
+    for action_type in sections['action_types']:
+        if action_type == ACTION_STROKE:
+            segments = []
+            first = sections['stroke_segment_offset'][stroke]
+            last = sections['stroke_segment_offset'][stroke + 1]
+            for segment in xrange(first, last):
+                segments.append([
+                    {
+                        't': point_t[i],
+                        'p': pressure[i],
+                        'pos': [pos[i * 3:i * 3 + 3], rot[i * 4:i * 4 + 4]],
+                    }
+                    for i in xrange(segment_offset[segment], segment_offset[segment + 1])
+                ])
+            actions.append({
+                'type': 'STROKE',
+                'time': sections['stroke_time'][stroke],
+                'data': {
+                    'id': sections['stroke_id'][stroke],
+                    'brush': sections['stroke_brush'][stroke],
+                    'b_size': floats['stroke_size'][stroke],
+                    'color': floats['stroke_color'][stroke * 3:stroke * 3 + 3],
+                    'points': segments,
+                },
+            })
+            stroke += 1
+        elif action_type == ACTION_DELETE:
+            actions.append({
+                'type': 'DELETE',
+                'time': sections['delete_time'][delete],
+                'data': {'strokeID': sections['delete_stroke'][delete]},
+            })
+            delete += 1
+        else:
+            actions.append(next(others))
+
+    return {'metadata': header['metadata'], 'actions': actions}
+
+
+def _quantize_column(values):
+    low, high = min(values), max(values)
+    if high == low:
+        return low, 0.0, [0] * len(values)
+    scale = 2.0 ** math.ceil(math.log((high - low) / 65535.0, 2))
+    offset = math.floor(low / scale) * scale
+    # rounding the ends can need one step more than 65535
+    if round((high - offset) / scale) > 65535:
+        scale *= 2
+        offset = math.floor(low / scale) * scale
+    return offset, scale, [int(round((value - offset) / scale)) for value in values]
+
+
+def compile_input(frames, quantize=False):
+    """Compiles the flat list of numbers in input.json into an input.bin string."""
+    if len(frames) % INPUT_STRIDE:
+        raise FormatError("%d values is not a whole number of %d value frames" % (len(frames), INPUT_STRIDE))
+    for value in frames:
+        if not isinstance(value, (int, long, float)) or math.isinf(value) or math.isnan(value):
+            raise FormatError("Frames must be finite numbers, got %r" % (value,))
+
+    times = frames[::INPUT_STRIDE]
+    if any(later < earlier for earlier, later in zip(times, times[1:])):
+        raise FormatError("Frame times are not in order")
+
+    header = {
+        'format': 'input',
+        'stride': INPUT_STRIDE,
+        'layout': INPUT_LAYOUT,
+        'frame_count': len(times),
+        'quantized': quantize,
+    }
+
+    if not quantize:
+        data = array('f', frames)
+        header['max_error'] = max([abs(a - b) for a, b in zip(data.tolist(), frames)] or [0])
+        return write_container(INPUT_MAGIC, header, [('frames', data)])
+
+    time = array('f', times)
+    offsets = array('f')
+    scales = array('f')
+    quantized = array('H', [0]) * (len(times) * (INPUT_STRIDE - 1))
+    max_error = max([abs(a - b) for a, b in zip(time.tolist(), times)] or [0])
+    for column in xrange(1, INPUT_STRIDE):
+        values = frames[column::INPUT_STRIDE]
+        offset, scale, steps = _quantize_column(values)
+        offsets.append(offset)
+        scales.append(scale)
+        quantized[column - 1::INPUT_STRIDE - 1] = array('H', steps)
+        decoded = _to_float32([offsets[-1] + step * scales[-1] for step in steps])
+        max_error = max([max_error] + [abs(a - b) for a, b in zip(decoded, values)])
+
+    header['max_error'] = max_error
+    return write_container(INPUT_MAGIC, header, [
+        ('time', time),
+        ('frames', quantized),
+        ('frames.offset', offsets),
+        ('frames.scale', scales),
+    ])
+
+
+def decode_input(data):
+    """Returns the flat list of frame values stored in an input.bin string."""
+    header, sections = read_container(data, INPUT_MAGIC)
+    if header.get('format') != 'input':
+        raise FormatError("Not an input container")
+    if not header['quantized']:
+        return sections['frames'].tolist()
+
+    stride = header['stride']
+    frames = [0.0] * (header['frame_count'] * stride)
+    frames[::stride] = sections['time'].tolist()
+    quantized = sections['frames']
+    for column in xrange(1, stride):
+        offset = sections['frames.offset'][column - 1]
+        scale = sections['frames.scale'][column - 1]
+        frames[column::stride] = [offset + step * scale for step in quantized[column - 1::stride - 1]]
+    return frames
@@ -0,0 +1,167 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+DELETE resolution and keyframe snapshots of the live strokes in a sketch.
+
+snapshots.json looks like:
+
+    {
+        "version": 1,
+        "interval": 30000,
+        "duration": 1234567,
+        "strokes": [[id, brush, start, end, deleted], ...],
+        "events": [[time, id, 1 or -1], ...],
+        "keyframes": [{"time": t, "event": n, "live": [[first, last], ...]}, ...],
+        "final": [[first, last], ...],
+        "ignored_deletes": 0
+    }
+
+`strokes` lists every stroke in action order with the times its first and
+last points are drawn and the time it is deleted (null if it survives).
+`events` is every stroke appearing (1) or being deleted (-1) in time order.
+A keyframe's `live` holds the ids of the strokes on the canvas at `time`
+as inclusive [first, last] id ranges; to seek to t, start from the last
+keyframe at or before t and apply events from index `event` while their
+time is <= t. `final` is the finished piece, with every DELETE applied.
+
+DELETEs of strokes that were never drawn or are already gone do nothing
+in the viewer, so they are dropped here and counted in `ignored_deletes`.
+A stroke is on the canvas from the time it is drawn until the time it is
+deleted, not at that time itself (see on_canvas); udon.sketches and
+udon.spatial follow the same rules.
+"""
+import json
+
+
+VERSION = 1
+DEFAULT_INTERVAL = 30000  # milliseconds
+
+FILE_NAME = 'snapshots.json'
+
+
+def on_canvas(start, deleted, time):
+    """Whether a stroke drawn at `start` and deleted at `deleted` (None or
+    negative if it never is) is on the canvas at `time`.
+    """
+    return start <= time and (deleted is None or deleted < 0 or deleted > time)
+
+
+def _stroke_end(action):
+    end = action['time']
+    for segment in action['data']['points']:
+        if segment:
+            end = max(end, segment[-1]['t'])
+    return end
+
+
+def resolve_deletes(sketch):
+    """Returns (strokes, events, ignored deletes) for an actions.json document."""
+    strokes = []
+    by_id = {}
+    events = []
+    ignored = 0
+
+    for action in sketch['actions']:
+        data = action['data']
+        if action['type'] == 'STROKE':
+            stroke = [data['id'], data['brush'], action['time'], _stroke_end(action), None]
+            strokes.append(stroke)
+            by_id[data['id']] = stroke
+            events.append([action['time'], data['id'], 1])
+        elif action['type'] == 'DELETE':
+            stroke = by_id.get(data['strokeID'])
+            if stroke is None or stroke[4] is not None:
+                ignored += 1
+                continue
+            stroke[4] = action['time']
+            events.append([action['time'], data['strokeID'], -1])
+
+    # A stable sort keeps a stroke's appearance ahead of its deletion when
+    # both happen in the same millisecond.
+    events.sort(key=lambda event: event[0])
+    return strokes, events, ignored
+
+
+def id_ranges(ids):
+    """Compresses a collection of integer ids into sorted [first, last] ranges."""
+    ranges = []
+    for stroke_id in sorted(ids):
+        if ranges and stroke_id == ranges[-1][1] + 1:
+            ranges[-1][1] = stroke_id
+        else:
+            ranges.append([stroke_id, stroke_id])
+    return ranges
+
+
+def build_snapshots(sketch, interval=DEFAULT_INTERVAL):
+    strokes, events, ignored = resolve_deletes(sketch)
+    duration = max([stroke[3] for stroke in strokes] + [event[0] for event in events] + [0])
+
+    keyframes = []
+    live = set()
+    event_index = 0
+    time = 0
+    while True:
+        while event_index < len(events) and events[event_index][0] <= time:
+            _, stroke_id, change = events[event_index]
+            if change > 0:
+                live.add(stroke_id)
+            else:
+                live.discard(stroke_id)
+            event_index += 1
+        keyframes.append({'time': time, 'event': event_index, 'live': id_ranges(live)})
+        if time >= duration:
+            break
+        time += interval
+
+    return {
+        'version': VERSION,
+        'interval': interval,
+        'duration': duration,
+        'strokes': strokes,
+        'events': events,
+        'keyframes': keyframes,
+        'final': id_ranges(stroke[0] for stroke in strokes if stroke[4] is None),
+        'ignored_deletes': ignored,
+    }
+
+
+def live_at(snapshots, time):
+    """Returns the set of stroke ids on the canvas at `time`, the way a
+    client would: nearest keyframe plus the events since it.
+    """
+    live = set()
+    event_index = 0
+    if time >= 0:
+        keyframes = snapshots['keyframes']
+        keyframe = keyframes[min(int(time // snapshots['interval']), len(keyframes) - 1)]
+        for first, last in keyframe['live']:
+            live.update(xrange(first, last + 1))
+        event_index = keyframe['event']
+
+    events = snapshots['events']
+    while event_index < len(events) and events[event_index][0] <= time:
+        _, stroke_id, change = events[event_index]
+        if change > 0:
+            live.add(stroke_id)
+        else:
+            live.discard(stroke_id)
+        event_index += 1
+    return live
+
+
+def dumps(snapshots):
+    return json.dumps(snapshots, sort_keys=True, separators=(',', ':'))
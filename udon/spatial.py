@@ -0,0 +1,278 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Where a sketch's strokes are in space.
+
+scripts/compile_sketches.py writes spatial.json for every sketch (building
+it needs numpy and udon.sketches; querying it does not):
+
+    {
+        "version": 1,
+        "bounds": [x0, y0, z0, x1, y1, z1],     # every point, or null
+        "strokes": {
+            "id": [...], "brush": [...], "time": [...],
+            "deleted": [...],                   # ms, or -1
+            "bounds": [[x0, y0, z0, x1, y1, z1], ...]
+        },
+        "chunks": {
+            "window": 10000,
+            "bounds": [[x0, y0, z0, x1, y1, z1] or null, ...]
+        },
+        "bvh": [[x0, y0, z0, x1, y1, z1, a, b], ...],
+        "order": [stroke row, ...]
+    }
+
+The strokes columns are in stroke order. Chunk i holds the strokes whose
+STROKE action is in [i * window, (i + 1) * window).
+
+bvh is a bounding volume hierarchy over the stroke boxes, flattened depth
+first with node 0 as the root. Each node is its box followed by a and b.
+For an inner node b is -1, its left child is the next node and a is the
+index of its right child. For a leaf, its strokes are order[a:a + b].
+
+Bounds are rounded outwards to BOUNDS_PRECISION, so they never shrink.
+"""
+import json
+import math
+import threading
+
+from .snapshots import on_canvas
+
+
+VERSION = 1
+FILE_NAME = 'spatial.json'
+LEAF_SIZE = 8
+BOUNDS_PRECISION = 10000  # 1e-4 Tilt Brush units
+
+
+def _round_bounds(lower, upper):
+    return (
+        [math.floor(value * BOUNDS_PRECISION) / BOUNDS_PRECISION for value in lower] +
+        [math.ceil(value * BOUNDS_PRECISION) / BOUNDS_PRECISION for value in upper]
+    )
+
+
+def stroke_bounds(sketch):
+    """Returns a float64 (strokes, 6) array of the box around each stroke's
+    points, NaN for strokes without any.
+    """
+    import numpy as np
+    strokes = sketch.strokes
+    positions = sketch.points['pos'].astype('<f8')
+    bounds = np.full((len(strokes), 6), np.nan)
+    has_points = strokes['point_end'] > strokes['point_start']
+    starts = strokes['point_start'][has_points].astype(np.intp)
+    if len(starts):
+        bounds[has_points, :3] = np.minimum.reduceat(positions, starts, axis=0)
+        bounds[has_points, 3:] = np.maximum.reduceat(positions, starts, axis=0)
+    return bounds
+
+
+def _build_bvh(bounds, rows, nodes, order):
+    """Appends the nodes for `rows` (indices into bounds) depth first."""
+    import numpy as np
+    box = bounds[rows]
+    lower, upper = box[:, :3].min(axis=0), box[:, 3:].max(axis=0)
+    node = _round_bounds(lower, upper) + [len(order), len(rows)]
+    nodes.append(node)
+    if len(rows) <= LEAF_SIZE:
+        order.extend(int(row) for row in rows)
+        return
+
+    centres = (box[:, :3] + box[:, 3:]) / 2
+    axis = int(np.argmax(centres.max(axis=0) - centres.min(axis=0)))
+    # split at the median centre along the longest axis
+    ranked = rows[np.argsort(centres[:, axis], kind='mergesort')]
+    half = len(ranked) // 2
+    node[7] = -1
+    _build_bvh(bounds, ranked[:half], nodes, order)
+    node[6] = len(nodes)
+    _build_bvh(bounds, ranked[half:], nodes, order)
+
+
+def build_index(sketch, window):
+    """Returns the spatial index of a udon.sketches.Sketch."""
+    import numpy as np
+    strokes = sketch.strokes
+    bounds = stroke_bounds(sketch)
+    has_points = ~np.isnan(bounds[:, 0])
+
+    index = {
+        'version': VERSION,
+        'bounds': None,
+        'strokes': {
+            'id': strokes['id'].tolist(),
+            'brush': strokes['brush'].tolist(),
+            'time': strokes['time'].tolist(),
+            'deleted': strokes['deleted'].tolist(),
+            'bounds': [
+                _round_bounds(box[:3], box[3:]) if present else None
+                for box, present in zip(bounds, has_points)
+            ],
+        },
+        'chunks': {'window': window, 'bounds': []},
+        'bvh': [],
+        'order': [],
+    }
+    if not has_points.any():
+        return index
+
+    present = bounds[has_points]
+    index['bounds'] = _round_bounds(present[:, :3].min(axis=0), present[:, 3:].max(axis=0))
+
+    chunk_of = strokes['time'] // window
+    for chunk in xrange(int(chunk_of.max()) + 1 if len(chunk_of) else 0):
+        members = bounds[has_points & (chunk_of == chunk)]
+        index['chunks']['bounds'].append(
+            _round_bounds(members[:, :3].min(axis=0), members[:, 3:].max(axis=0)) if len(members) else None
+        )
+
+    _build_bvh(bounds, np.nonzero(has_points)[0], index['bvh'], index['order'])
+    return index
+
+
+def dumps(index):
+    return json.dumps(index, sort_keys=True, separators=(',', ':'))
+
+
+def intersects(a, b):
+    return (
+        a[0] <= b[3] and b[0] <= a[3] and
+        a[1] <= b[4] and b[1] <= a[4] and
+        a[2] <= b[5] and b[2] <= a[5]
+    )
+
+
+def _matches(strokes, row, time, brush):
+    if brush is not None and strokes['brush'][row] != brush:
+        return False
+    if time is not None and not on_canvas(strokes['time'][row], strokes['deleted'][row], time):
+        return False
+    return True
+
+
+def query(index, box=None, time=None, brush=None):
+    """Returns the rows of the strokes whose box intersects `box`
+    ([x0, y0, z0, x1, y1, z1], anywhere by default), that are on the canvas
+    at `time` (ms) if given and that use `brush` if given, in stroke order.
+    """
+    strokes = index['strokes']
+    nodes = index['bvh']
+    order = index['order']
+    rows = []
+    if not nodes:
+        return rows
+
+    stack = [0]
+    while stack:
+        position = stack.pop()
+        node = nodes[position]
+        if box is not None and not intersects(node, box):
+            continue
+        a, b = node[6], node[7]
+        if b < 0:
+            stack.append(a)
+            stack.append(position + 1)
+            continue
+        for row in order[a:a + b]:
+            if _matches(strokes, row, time, brush) and (box is None or intersects(strokes['bounds'][row], box)):
+                rows.append(row)
+    rows.sort()
+    return rows
+
+
+def brute_force(sketch, box=None, time=None, brush=None):
+    """query() worked out from the points of a udon.sketches.Sketch, without
+    an index, to check indexes against.
+    """
+    import numpy as np
+    strokes = sketch.strokes
+    bounds = stroke_bounds(sketch)
+    keep = ~np.isnan(bounds[:, 0])
+    if box is not None:
+        lower = np.floor(bounds[:, :3] * BOUNDS_PRECISION) / BOUNDS_PRECISION
+        upper = np.ceil(bounds[:, 3:] * BOUNDS_PRECISION) / BOUNDS_PRECISION
+        keep &= (lower <= box[3:]).all(axis=1) & (upper >= box[:3]).all(axis=1)
+    if time is not None:
+        live = np.zeros(len(strokes), dtype=bool)
+        live[sketch.live_strokes(time)] = True
+        keep &= live
+    if brush is not None:
+        keep &= strokes['brush'] == brush
+    return np.nonzero(keep)[0].tolist()
+
+
+def verify(index, sketch, queries=200, seed=0):
+    """Runs random queries against the index and brute_force and returns the
+    ones that disagree, as (box, time, brush).
+    """
+    import random
+    rng = random.Random(seed)
+    if index['bounds'] is None:
+        return []
+    lower, upper = index['bounds'][:3], index['bounds'][3:]
+    times = index['strokes']['time']
+    brushes = sorted(set(index['strokes']['brush']))
+    failures = []
+    for i in xrange(queries):
+        box = None
+        if i % 10:
+            corners = [
+                sorted([rng.uniform(lo - 1, hi + 1), rng.uniform(lo - 1, hi + 1)])
+                for lo, hi in zip(lower, upper)
+            ]
+            box = [corner[0] for corner in corners] + [corner[1] for corner in corners]
+        time = rng.randint(0, max(times) + 1000) if times and rng.random() < 0.5 else None
+        brush = rng.choice(brushes) if brushes and rng.random() < 0.3 else None
+        if query(index, box, time, brush) != brute_force(sketch, box, time, brush):
+            failures.append((box, time, brush))
+    return failures
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def load_index(bucket, name):
+    """Returns the parsed index `name` in a streaming bucket, re-reading it
+    only when it changes. Raises streaming.ObjectNotFound if there is none.
+    """
+    stat = bucket.stat(name)
+    key = (bucket.key, name)
+    cached = _indexes.get(key)
+    if cached is None or cached[0] != stat.generation:
+        cached = (stat.generation, json.loads(bucket.read(name, 0, stat.size)))
+        with _lock:
+            _indexes[key] = cached
+    return cached[1]
+
+
+def parse_box(text):
+    """Parses 'x0,y0,z0,x1,y1,z1' into a box, raising ValueError if it is not one."""
+    values = [float(value) for value in text.split(',')]
+    if len(values) != 6 or any(math.isnan(value) for value in values):
+        raise ValueError("a box is six numbers, x0,y0,z0,x1,y1,z1")
+    if any(values[i] > values[i + 3] for i in xrange(3)):
+        raise ValueError("a box's first corner must be its lowest")
+    return values
+
+
+def union(boxes):
+    """The box around `boxes`, or None if there are none."""
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return [min(box[i] for box in boxes) for i in xrange(3)] + [max(box[i] for box in boxes) for i in xrange(3, 6)]
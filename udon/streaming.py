@@ -0,0 +1,409 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+
+from . import instrumentation
+
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+# A client asking for more ranges than this is almost certainly not a video
+# element, so we just send the whole object rather than a huge multipart body.
+MAX_RANGES = 16
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+ObjectStat = namedtuple('ObjectStat', ['name', 'size', 'generation', 'content_type'])
+
+
+class CloudStorageBucket(object):
+    """Reads objects from a Cloud Storage bucket."""
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self.key = 'gs:' + bucket_name
+
+    def path(self, name):
+        return '/{}/{}'.format(self.bucket_name, name)
+
+    def stat(self, name):
+        import cloudstorage
+        try:
+            info = cloudstorage.stat(self.path(name))
+        except cloudstorage.errors.NotFoundError:
+            raise ObjectNotFound(name)
+        return ObjectStat(name, info.st_size, info.etag, info.content_type)
+
+    def read(self, name, offset, length):
+        import cloudstorage
+        try:
+            gcs_file = cloudstorage.open(self.path(name), 'r')
+        except cloudstorage.errors.NotFoundError:
+            raise ObjectNotFound(name)
+        try:
+            gcs_file.seek(offset)
+            return gcs_file.read(length)
+        finally:
+            gcs_file.close()
+
+
+class LocalBucket(object):
+    """Stands in for a bucket using a directory on the local filesystem."""
+
+    # stat() is cheap here, and skipping the cache means rebuilt files are
+    # picked up straight away
+    cache_stats = False
+
+    def __init__(self, root):
+        self.root = root
+        self.key = 'file:' + root
+
+    def path(self, name):
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ObjectNotFound(name)
+        return path
+
+    def stat(self, name):
+        path = self.path(name)
+        try:
+            info = os.stat(path)
+        except OSError:
+            raise ObjectNotFound(name)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        generation = '%d-%d' % (info.st_mtime, info.st_size)
+        return ObjectStat(name, info.st_size, generation, content_type)
+
+    def read(self, name, offset, length):
+        try:
+            with open(self.path(name), 'rb') as local_file:
+                local_file.seek(offset)
+                return local_file.read(length)
+        except IOError:
+            raise ObjectNotFound(name)
+
+
+class BlockCache(object):
+    """A thread-safe LRU of byte blocks, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            block = self._blocks.pop(key, None)
+            if block is None:
+                self.misses += 1
+                return None
+            self._blocks[key] = block
+            self.hits += 1
+            return block
+
+    def put(self, key, block):
+        if len(block) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._blocks[key] = block
+            self.size += len(block)
+            while self.size > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.size = 0
+
+
+class StatCache(object):
+    """Remembers object stats for a short time so a seek costs no RPC."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._stats = {}
+
+    def get(self, bucket, name):
+        if not getattr(bucket, 'cache_stats', True):
+            with instrumentation.span('storage_stat'):
+                return bucket.stat(name)
+
+        key = (bucket.key, name)
+        cached = self._stats.get(key)
+        if cached is not None and cached[0] > time.time():
+            return cached[1]
+        with instrumentation.span('storage_stat'):
+            stat = bucket.stat(name)
+        self._stats[key] = (time.time() + self.ttl, stat)
+        return stat
+
+
+_block_cache = None
+_stat_cache = None
+
+
+def get_block_cache():
+    global _block_cache
+    if _block_cache is None:
+        _block_cache = BlockCache(settings.SERVE_FILE_CACHE_SIZE)
+    return _block_cache
+
+
+def get_stat_cache():
+    global _stat_cache
+    if _stat_cache is None:
+        _stat_cache = StatCache(settings.SERVE_FILE_STAT_TTL)
+    return _stat_cache
+
+
+_copies = {}
+_copies_lock = threading.Lock()
+
+
+def copy_to_cloudstorage(local_path, gcs_path, chunk_size=None):
+    """Copies a local file to Cloud Storage on a background thread.
+
+    Only meant for the dev server, where serve_file uses it to fill the local
+    bucket from scripts/videos. On App Engine a thread cannot outlive the
+    request that started it, so a copy there could stop halfway.
+
+    Only one copy per destination runs at a time; asking for a copy that is
+    already in flight returns the same threading.Event, which is set once the
+    copy has finished (successfully or not). serve_file does not wait on it.
+    """
+    with _copies_lock:
+        done = _copies.get(gcs_path)
+        if done is not None:
+            return done
+        done = _copies[gcs_path] = threading.Event()
+
+    thread = threading.Thread(
+        target=_copy_to_cloudstorage,
+        args=(local_path, gcs_path, chunk_size or settings.SERVE_FILE_BLOCK_SIZE, done),
+    )
+    thread.daemon = True
+    thread.start()
+    return done
+
+
+def _copy_to_cloudstorage(local_path, gcs_path, chunk_size, done):
+    import cloudstorage
+    content_type = mimetypes.guess_type(local_path)[0] or 'application/octet-stream'
+    try:
+        logging.info("Creating a local copy of %s...", gcs_path)
+        with open(local_path, 'rb') as local_file:
+            gcs_file = cloudstorage.open(gcs_path, 'w', content_type=content_type)
+            try:
+                while True:
+                    chunk = local_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    gcs_file.write(chunk)
+            finally:
+                gcs_file.close()
+        logging.info("Local copy of %s created", gcs_path)
+    except Exception:
+        logging.exception("Failed to create a local copy of %s", gcs_path)
+    finally:
+        with _copies_lock:
+            _copies.pop(gcs_path, None)
+        done.set()
+
+
+def get_bucket():
+    if settings.SERVE_FILE_ROOT:
+        return LocalBucket(settings.SERVE_FILE_ROOT)
+    return CloudStorageBucket(settings.BUCKET_KEY)
+
+
+def parse_range_header(header, size):
+    """Returns a list of inclusive (start, end) byte ranges.
+
+    Returns None if there is no usable Range header, in which case the whole
+    object should be sent. Raises RangeNotSatisfiable if the header is valid
+    but none of its ranges overlap the object.
+    """
+    if not header or not size:
+        return None
+
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+
+        if not first:
+            # suffix range: the final N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable(header)
+
+    if len(ranges) > 1:
+        ranges = coalesce_ranges(ranges)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def coalesce_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def read_block(bucket, stat, index, cache, block_size):
+    if not getattr(bucket, 'cache_blocks', True):
+        return bucket.read(stat.name, index * block_size, block_size)
+
+    key = (bucket.key, stat.name, stat.generation, index)
+    block = cache.get(key)
+    if block is None:
+        with instrumentation.span('storage_read'):
+            block = bucket.read(stat.name, index * block_size, block_size)
+        cache.put(key, block)
+    return block
+
+
+def iter_range(bucket, stat, start, end, cache=None, block_size=None):
+    """Yields the bytes start..end (inclusive) of an object, block by block."""
+    cache = cache or get_block_cache()
+    block_size = block_size or settings.SERVE_FILE_BLOCK_SIZE
+
+    for index in xrange(start // block_size, end // block_size + 1):
+        block = read_block(bucket, stat, index, cache, block_size)
+        block_start = index * block_size
+        lo = max(start - block_start, 0)
+        hi = min(end - block_start + 1, len(block))
+        yield block[lo:hi]
+
+
+def _multipart(bucket, stat, ranges, boundary, cache, block_size):
+    for start, end in ranges:
+        yield _part_header(stat, start, end, boundary)
+        for chunk in iter_range(bucket, stat, start, end, cache, block_size):
+            yield chunk
+    yield '\r\n--%s--\r\n' % boundary
+
+
+def _part_header(stat, start, end, boundary):
+    return (
+        '\r\n--%s\r\n'
+        'Content-Type: %s\r\n'
+        'Content-Range: bytes %d-%d/%d\r\n\r\n'
+    ) % (boundary, stat.content_type, start, end, stat.size)
+
+
+def serve(request, bucket, name, cache=None, block_size=None, content_type=None, etag=None):
+    """Serves an object from a bucket, honouring single and multipart Range
+    requests. Raises ObjectNotFound if the object does not exist.
+
+    content_type and etag override the ones derived from the object's stat.
+    """
+    stat = get_stat_cache().get(bucket, name)
+    if content_type:
+        stat = stat._replace(content_type=content_type)
+    etag = '"%s"' % (etag or stat.generation)
+
+    if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    ranges = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag:
+        try:
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), stat.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % stat.size
+            return response
+
+    head = request.method == 'HEAD'
+
+    if ranges is None:
+        body = [] if head else iter_range(bucket, stat, 0, stat.size - 1, cache, block_size)
+        response = StreamingHttpResponse(body, content_type=stat.content_type)
+        response['Content-Length'] = str(stat.size)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        body = [] if head else iter_range(bucket, stat, start, end, cache, block_size)
+        response = StreamingHttpResponse(body, status=206, content_type=stat.content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, stat.size)
+    else:
+        boundary = uuid.uuid4().hex
+        length = len('\r\n--%s--\r\n' % boundary)
+        for start, end in ranges:
+            length += len(_part_header(stat, start, end, boundary)) + end - start + 1
+        body = [] if head else _multipart(bucket, stat, ranges, boundary, cache, block_size)
+        response = StreamingHttpResponse(
+            body,
+            status=206,
+            content_type='multipart/byteranges; boundary=%s' % boundary,
+        )
+        response['Content-Length'] = str(length)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
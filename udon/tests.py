@@ -0,0 +1,268 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Run with `python manage.py test udon`.
+"""
+import copy
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.test.utils import override_settings
+
+from . import fingerprint, instrumentation, pagecache, sketches, snapshots, spatial, streaming, utils, validators, views
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class PageConditionTest(SimpleTestCase):
+    """A request whose validators match is answered before the view renders."""
+
+    def setUp(self):
+        self.rendered = []
+        self.render = views.render
+        views.render = self.fake_render
+        self.path = reverse('home')
+        self.request = RequestFactory().get(self.path)
+
+    def tearDown(self):
+        views.render = self.render
+
+    def fake_render(self, request, template_name, *args, **kwargs):
+        self.rendered.append(template_name)
+        return HttpResponse(template_name)
+
+    def test_renders_without_validators(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rendered, ['home.html'])
+
+    def test_matching_etag_is_not_rendered(self):
+        etag = validators.page_etag(self.request)
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH='"%s"' % etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.rendered, [])
+
+    def test_stale_etag_is_rendered(self):
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rendered, ['home.html'])
+
+    def test_if_modified_since_alone_is_rendered(self):
+        # pages have no Last-Modified, as file mtimes do not survive a deploy
+        response = self.client.get(self.path, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.rendered, ['home.html'])
+
+    def test_non_ascii_path(self):
+        # matches the (unicode) slug pattern but no artist
+        response = self.client.get(u'/artists/\xe9/sessions/\xe9/')
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(self.rendered, [])
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        pagecache.invalidate()
+
+    def test_non_ascii_path(self):
+        response = self.client.get(u'/artists/\xe9/sessions/\xe9/')
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_page_key(self):
+        digest = utils.get_data().digest
+        self.assertNotEqual(pagecache.page_key(digest, u'/artists/\xe9/'), pagecache.page_key(digest, u'/artists/e/'))
+
+
+class CatalogTest(SimpleTestCase):
+    """The catalog adds the thumbnail index to copies of data.json's sessions."""
+
+    def setUp(self):
+        self.raw_data = {
+            'globals': {},
+            'artists': [{
+                'slug': 'artist',
+                'sessions': [
+                    {'slug': 'drawn', 'sketch': 'drawn', 'enabled': True, 'thumbnail': False},
+                    {'slug': 'not-drawn', 'sketch': 'not_drawn', 'enabled': True, 'thumbnail': False},
+                ],
+            }],
+        }
+        self.thumbnails = {
+            'drawn': {'png': {'170': '/data/thumbnails/drawn/170.png', '680': '/data/thumbnails/drawn/680.png'}},
+        }
+
+    def test_thumbnails(self):
+        catalog = utils.Catalog(self.raw_data, thumbnails=self.thumbnails)
+        drawn = catalog.get_session('artist', 'drawn')
+        self.assertEqual(drawn['thumbnail_src'], '/data/thumbnails/drawn/170.png')
+        self.assertEqual(drawn['thumbnail_srcset']['png'], '/data/thumbnails/drawn/170.png 170w, /data/thumbnails/drawn/680.png 680w')
+        self.assertNotIn('thumbnail_srcset', catalog.get_session('artist', 'not-drawn'))
+        self.assertEqual(catalog.get_artist('artist')['thumbnail_sessions'], (drawn,))
+
+    def test_raw_data_is_not_changed(self):
+        raw_data = copy.deepcopy(self.raw_data)
+        utils.Catalog(self.raw_data, thumbnails=self.thumbnails)
+        self.assertEqual(self.raw_data, raw_data)
+
+
+class FingerprintFileTest(SimpleTestCase):
+    """Digests are only reused for files that were settled when hashed."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'actions.json')
+        self.write('[1]')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, data, mtime=None):
+        with open(self.path, 'wb') as out:
+            out.write(data)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_fresh_file_is_rehashed(self):
+        # rewritten within the same second, at the same size
+        entry = fingerprint.fingerprint_file(self.path)
+        self.write('[2]')
+        self.assertNotEqual(fingerprint.fingerprint_file(self.path, entry)['digest'], entry['digest'])
+
+    def test_settled_file_is_reused(self):
+        self.write('[1]', mtime=1467000000)
+        entry = fingerprint.fingerprint_file(self.path)
+        self.assertEqual(entry['mtime'], 1467000000)
+        self.assertIs(fingerprint.fingerprint_file(self.path, entry), entry)
+
+
+class LogCapture(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTest(SimpleTestCase):
+    """Storage reads made while a body streams are logged with it."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.root, 'video.mp4'), 'wb') as out:
+            out.write('x' * 10000)
+        self.log = LogCapture()
+        logger = logging.getLogger()
+        self.level = logger.level
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self.log)
+
+    def tearDown(self):
+        logger = logging.getLogger()
+        logger.removeHandler(self.log)
+        logger.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def test_streamed_reads_are_logged(self):
+        middleware = instrumentation.InstrumentationMiddleware()
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=100-')
+        middleware.process_request(request)
+        response = streaming.serve(
+            request, streaming.LocalBucket(self.root), 'video.mp4', cache=streaming.BlockCache(1 << 20), block_size=4096)
+        response = middleware.process_response(request, response)
+        self.assertEqual(self.log.messages, [])
+
+        body = ''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(len(body), 9900)
+        line = json.loads(self.log.messages[-1].split(' ', 1)[1])
+        self.assertEqual(line['bytes'], 9900)
+        self.assertEqual(line['spans']['storage_read']['count'], 3)
+        self.assertIn('body_ms', line)
+
+
+@unittest.skipIf(sketches.np is None, "needs numpy")
+class SpatialQueryTest(SimpleTestCase):
+    """spatial.query agrees with brute force and with the snapshots."""
+
+    def setUp(self):
+        rng = random.Random(0)
+        actions = []
+        for stroke_id in xrange(60):
+            x, y, z = [rng.uniform(-5, 5) for _ in xrange(3)]
+            time = stroke_id * 100
+            points = [[
+                {'t': time + i, 'p': 1.0, 'pos': [[x + rng.uniform(0, 1), y + rng.uniform(0, 1), z + rng.uniform(0, 1)], [0, 0, 0, 1]]}
+                for i in xrange(rng.randint(1, 5))
+            ]]
+            actions.append({'type': 'STROKE', 'time': time, 'data': {
+                'id': stroke_id, 'brush': stroke_id % 3, 'b_size': 0.1, 'color': [1, 1, 1], 'points': points}})
+            if stroke_id % 4 == 1:
+                # deleted a while later; the second DELETE is ignored
+                actions.append({'type': 'DELETE', 'time': time + 250, 'data': {'strokeID': stroke_id}})
+                actions.append({'type': 'DELETE', 'time': time + 260, 'data': {'strokeID': stroke_id}})
+            elif stroke_id % 4 == 2:
+                # deleted the moment it is drawn
+                actions.append({'type': 'DELETE', 'time': time, 'data': {'strokeID': stroke_id}})
+            elif stroke_id % 4 == 3:
+                # deletes the stroke drawn next, before it exists, so it is ignored
+                actions.append({'type': 'DELETE', 'time': time, 'data': {'strokeID': stroke_id + 1}})
+        actions.sort(key=lambda action: action['time'])
+        self.actions = {'metadata': {}, 'actions': actions}
+
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'synthetic'))
+        with open(os.path.join(self.root, 'synthetic', 'actions.json'), 'wb') as out:
+            out.write(json.dumps(self.actions))
+        self.sketch = sketches.Sketch('synthetic', self.root)
+        self.index = spatial.build_index(self.sketch, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1)
+        for i in xrange(300):
+            box = None
+            if i % 5:
+                corners = [sorted([rng.uniform(-7, 7), rng.uniform(-7, 7)]) for _ in xrange(3)]
+                box = [corner[0] for corner in corners] + [corner[1] for corner in corners]
+            # stroke and DELETE times themselves, and times between them
+            time = rng.choice([None, rng.randint(0, 60) * 100, rng.randint(0, 60) * 100 + 250, rng.randint(-100, 6500)])
+            brush = rng.choice([None, 0, 1, 2])
+            self.assertEqual(
+                spatial.query(self.index, box, time, brush),
+                spatial.brute_force(self.sketch, box, time, brush),
+                (box, time, brush))
+
+    def test_matches_snapshots(self):
+        built = snapshots.build_snapshots(self.actions, interval=1000)
+        ids = self.index['strokes']['id']
+        for time in xrange(-100, 6500, 50):
+            live = set(ids[row] for row in spatial.query(self.index, time=time))
+            self.assertEqual(live, snapshots.live_at(built, time), time)
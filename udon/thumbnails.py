@@ -0,0 +1,350 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Preview images of finished sketches, rendered on the CPU with numpy.
+
+scripts/render_thumbnails.py draws the strokes that are still on the canvas
+at the end of a sketch (everything that was never deleted) from a fixed
+camera, CAMERA_YAW degrees round from where the artist stood and
+CAMERA_PITCH degrees above, framed to fit. Each stroke is drawn as a
+polyline as wide as its brush size times the pressure at each point, in its
+brush colour, faded towards the background with distance.
+
+Images are drawn at SUPERSAMPLE times their size with a depth buffer and
+scaled down, which smooths the edges. write_png needs nothing but numpy;
+WebP needs Pillow (pip install pillow) and is skipped without it.
+
+The script then lists the thumbnails it finds on disk in an index,
+THUMBNAIL_INDEX, which udon.utils.Catalog adds to the sessions of data.json:
+
+    {
+        "ab_bull": {
+            "png": {"170": "/data/thumbnails/ab_bull/170.png", ...},
+            "webp": {...}
+        },
+        ...
+    }
+"""
+import json
+import math
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from cStringIO import StringIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# (width, height); the session selector and artist modal show them at 17:10
+SIZES = ((170, 100), (340, 200), (680, 400))
+SUPERSAMPLE = 3
+
+CAMERA_YAW = 30.0  # degrees
+CAMERA_PITCH = 15.0  # degrees
+FIELD_OF_VIEW = 40.0  # degrees
+MARGIN = 0.06  # of each side
+FRAME_PERCENTILE = 1.0  # of the points may fall outside each side
+
+BACKGROUND = (0x1a, 0x1a, 0x1a)
+FOG = 0.6  # how far the farthest stroke fades towards the background
+MIN_PRESSURE = 0.2
+MAX_RADIUS = 8  # pixels, at the supersampled size
+
+# Samples drawn at once, which bounds the memory a large sketch needs
+BATCH_SIZE = 1 << 18
+# Precision depths are sorted at
+DEPTH_BITS = 24
+DEPTH_STEPS = (1 << DEPTH_BITS) - 1
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("udon.thumbnails needs numpy (pip install numpy)")
+
+
+def formats():
+    """The image formats this machine can write."""
+    return ('png', 'webp') if Image is not None else ('png',)
+
+
+def _rotation(yaw, pitch):
+    yaw, pitch = math.radians(yaw), math.radians(pitch)
+    about_y = np.array([
+        [math.cos(yaw), 0, -math.sin(yaw)],
+        [0, 1, 0],
+        [math.sin(yaw), 0, math.cos(yaw)],
+    ])
+    about_x = np.array([
+        [1, 0, 0],
+        [0, math.cos(pitch), -math.sin(pitch)],
+        [0, math.sin(pitch), math.cos(pitch)],
+    ])
+    return about_x.dot(about_y)
+
+
+def _disk(radius):
+    """(dy, dx) offsets of the pixels within radius of a pixel."""
+    span = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(span, span, indexing='ij')
+    inside = dy * dy + dx * dx <= radius * radius + radius
+    return dy[inside], dx[inside]
+
+
+class Scene(object):
+    """The final strokes of a udon.sketches.Sketch seen from the camera:
+    their points projected onto the image plane, with depths from 0 (nearest)
+    to 1 (farthest).
+    """
+
+    def __init__(self, sketch, yaw=CAMERA_YAW, pitch=CAMERA_PITCH):
+        _require_numpy()
+        strokes = sketch.strokes
+        points = sketch.points
+        keep = strokes['deleted'] < 0
+        points = points[keep[points['stroke']]]
+        self.empty = not len(points)
+        if self.empty:
+            return
+
+        positions = points['pos'].astype('f8')
+        lower, upper = positions.min(axis=0), positions.max(axis=0)
+        centre = (lower + upper) / 2
+        radius = max(np.linalg.norm(upper - lower) / 2, 1e-6)
+        distance = radius / math.tan(math.radians(FIELD_OF_VIEW) / 2)
+
+        view = (positions - centre).dot(_rotation(yaw, pitch).T)
+        depth = view[:, 2] + distance + radius
+        focal = distance / radius
+        x = view[:, 0] * focal / depth
+        y = view[:, 1] * focal / depth
+
+        # frame the projected points rather than the bounding box, so a
+        # sketch fills the image from any angle, leaving out the few
+        # furthest out so a stray stroke does not shrink the rest
+        x_range = np.percentile(x, [FRAME_PERCENTILE, 100 - FRAME_PERCENTILE])
+        y_range = np.percentile(y, [FRAME_PERCENTILE, 100 - FRAME_PERCENTILE])
+        self.centre = ((x_range[0] + x_range[1]) / 2, (y_range[0] + y_range[1]) / 2)
+        self.extent = (max(x_range[1] - x_range[0], 1e-9), max(y_range[1] - y_range[0], 1e-9))
+
+        self.x, self.y = x, y
+        self.near, self.far = depth.min(), depth.max()
+        self.depth = (depth - self.near) / max(self.far - self.near, 1e-9)
+        pressure = np.maximum(points['p'], MIN_PRESSURE)
+        # brush size is a diameter in sketch units
+        self.radius = strokes['size'][points['stroke']] * pressure * focal / depth / 2
+        self.colour = strokes['color'][points['stroke']]
+        # consecutive points are joined unless a stroke ends or lifts between them
+        self.joined = (points['stroke'][1:] == points['stroke'][:-1]) & (points['segment'][1:] == points['segment'][:-1])
+
+    def _samples(self, scale, offset_x, offset_y):
+        """Yields batches of (x, y, radius, depth, point index) in pixels."""
+        px = (self.x - self.centre[0]) * scale + offset_x
+        py = (self.centre[1] - self.y) * scale + offset_y
+        pr = self.radius * scale
+
+        # every point, then the gaps between joined points filled in at
+        # steps of half the stroke's radius (half a pixel for thin ones)
+        yield px, py, pr, self.depth, np.arange(len(px))
+
+        starts = np.nonzero(self.joined)[0]
+        lengths = np.hypot(px[starts + 1] - px[starts], py[starts + 1] - py[starts])
+        spacing = np.maximum(np.minimum(pr[starts], pr[starts + 1]), 1) / 2
+        steps = np.ceil(lengths / spacing).astype(np.intp) - 1
+        starts, steps = starts[steps > 0], steps[steps > 0]
+        bounds = np.concatenate([[0], np.cumsum(steps)])
+        first = 0
+        while first < len(starts):
+            last = max(np.searchsorted(bounds, bounds[first] + BATCH_SIZE, side='right') - 1, first + 1)
+            segment = np.repeat(np.arange(first, last), steps[first:last])
+            step = np.arange(len(segment)) - np.repeat(bounds[first:last] - bounds[first], steps[first:last])
+            t = (step + 1.0) / (steps[segment] + 1.0)
+            a = starts[segment]
+            b = a + 1
+            yield (
+                px[a] + (px[b] - px[a]) * t,
+                py[a] + (py[b] - py[a]) * t,
+                pr[a] + (pr[b] - pr[a]) * t,
+                self.depth[a] + (self.depth[b] - self.depth[a]) * t,
+                np.where(t < 0.5, a, b),
+            )
+            first = last
+
+    def draw(self, big_width, big_height):
+        """Returns a float (big_height, big_width, 3) RGB image, 0 to 1."""
+        background = np.array(BACKGROUND, dtype='f8') / 255
+        if self.empty:
+            return np.tile(background, (big_height, big_width, 1))
+
+        scale = min(
+            big_width * (1 - 2 * MARGIN) / self.extent[0],
+            big_height * (1 - 2 * MARGIN) / self.extent[1],
+        )
+        depth_buffer = np.full(big_width * big_height, np.inf)
+        point_buffer = np.full(big_width * big_height, -1, dtype=np.intp)
+
+        for x, y, radius, depth, point in self._samples(scale, big_width / 2.0, big_height / 2.0):
+            radius = np.clip(np.round(radius), 0, MAX_RADIUS).astype(np.intp)
+            for size in np.unique(radius):
+                chosen = radius == size
+                dy, dx = _disk(int(size))
+                sx = (np.round(x[chosen]).astype(np.intp)[:, None] + dx).ravel()
+                sy = (np.round(y[chosen]).astype(np.intp)[:, None] + dy).ravel()
+                sdepth = np.repeat(depth[chosen], len(dx))
+                spoint = np.repeat(point[chosen], len(dx))
+                inside = (sx >= 0) & (sx < big_width) & (sy >= 0) & (sy < big_height)
+                pixel = sy[inside] * big_width + sx[inside]
+                sdepth, spoint = sdepth[inside], spoint[inside]
+
+                # nearest sample per pixel, then only where it beats the buffer
+                key = pixel.astype(np.int64) << DEPTH_BITS | (sdepth * DEPTH_STEPS).astype(np.int64)
+                order = np.argsort(key)
+                pixel, sdepth, spoint = pixel[order], sdepth[order], spoint[order]
+                first = np.ones(len(pixel), dtype=bool)
+                first[1:] = pixel[1:] != pixel[:-1]
+                pixel, sdepth, spoint = pixel[first], sdepth[first], spoint[first]
+                nearer = sdepth < depth_buffer[pixel]
+                depth_buffer[pixel[nearer]] = sdepth[nearer]
+                point_buffer[pixel[nearer]] = spoint[nearer]
+
+        image = np.tile(background, (big_width * big_height, 1))
+        drawn = point_buffer >= 0
+        fog = (depth_buffer[drawn] * FOG)[:, None]
+        image[drawn] = self.colour[point_buffer[drawn]] * (1 - fog) + background * fog
+        return image.reshape(big_height, big_width, 3)
+
+    def render(self, sizes=SIZES):
+        """Returns {(width, height): uint8 (height, width, 3) RGB image}.
+
+        The largest size is drawn at SUPERSAMPLE times and every size that
+        divides it evenly is scaled down from that one drawing.
+        """
+        width, height = max(sizes)
+        big = self.draw(width * SUPERSAMPLE, height * SUPERSAMPLE)
+        images = {}
+        for width, height in sizes:
+            if big.shape[1] % width or big.shape[0] % height or big.shape[1] // width != big.shape[0] // height:
+                image = self.draw(width * SUPERSAMPLE, height * SUPERSAMPLE)
+            else:
+                image = big
+            factor = image.shape[1] // width
+            # box filter down to the requested size
+            image = image.reshape(height, factor, width, factor, 3).mean(axis=(1, 3))
+            images[(width, height)] = (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+        return images
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def write_png(image):
+    """Encodes a uint8 (height, width, 3) RGB image as PNG.
+
+    Each row uses whichever of the None, Sub and Up filters leaves the
+    smallest residuals, the usual heuristic for picking one.
+    """
+    height, width, _ = image.shape
+    rows = image.reshape(height, width * 3).astype(np.int16)
+    sub = rows.copy()
+    sub[:, 3:] -= rows[:, :-3]
+    up = rows.copy()
+    up[1:] -= rows[:-1]
+    candidates = np.stack([rows, sub, up]) % 256
+    cost = np.minimum(candidates, 256 - candidates).sum(axis=2)
+    best = cost.argmin(axis=0)
+    filtered = candidates[best, np.arange(height)].astype(np.uint8)
+    raw = np.hstack([best.astype(np.uint8)[:, None], filtered]).tostring()
+
+    return ''.join([
+        '\x89PNG\r\n\x1a\n',
+        _chunk('IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        _chunk('IDAT', zlib.compress(raw, 9)),
+        _chunk('IEND', ''),
+    ])
+
+
+def write_webp(image, quality=80):
+    """Encodes a uint8 (height, width, 3) RGB image as WebP. Needs Pillow."""
+    if Image is None:
+        raise ImportError("WebP thumbnails need Pillow (pip install pillow)")
+    out = StringIO()
+    Image.fromarray(image, 'RGB').save(out, 'WEBP', quality=quality, method=6)
+    return out.getvalue()
+
+
+WRITERS = {
+    'png': write_png,
+    'webp': write_webp,
+}
+
+
+def file_name(width, image_format):
+    return '%d.%s' % (width, image_format)
+
+
+def url(sketch_name, width, image_format):
+    return '/data/thumbnails/%s/%s' % (sketch_name, file_name(width, image_format))
+
+
+def render_sketch(sketch, sizes=SIZES, image_formats=None):
+    """Returns {(width, format): encoded image} for a udon.sketches.Sketch."""
+    images = {}
+    for (width, _), image in Scene(sketch).render(sizes).items():
+        for image_format in image_formats or formats():
+            images[(width, image_format)] = WRITERS[image_format](image)
+    return images
+
+
+def thumbnail_field(sketch_name, sizes=SIZES, image_formats=None, output=None):
+    """The thumbnail of a session, {format: {width: url}}. Given the directory
+    the thumbnails are written to, only lists the files that exist there.
+    """
+    field = OrderedDict()
+    for image_format in image_formats or formats():
+        urls = OrderedDict(
+            (str(width), url(sketch_name, width, image_format))
+            for width, _ in sorted(sizes)
+            if output is None or os.path.exists(os.path.join(output, sketch_name, file_name(width, image_format)))
+        )
+        if urls:
+            field[image_format] = urls
+    return field
+
+
+def build_index(output, sizes=SIZES):
+    """Returns the index of the thumbnails under output. A sketch is only
+    listed once it has a PNG, which pages fall back to.
+    """
+    index = {}
+    if os.path.isdir(output):
+        for name in sorted(os.listdir(output)):
+            field = thumbnail_field(name, sizes, WRITERS.keys(), output)
+            if 'png' in field:
+                index[name] = field
+    return index
+
+
+def dumps_index(index):
+    return json.dumps(index, sort_keys=True, indent=1, separators=(',', ':'))
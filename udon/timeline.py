@@ -0,0 +1,276 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+Lookup tables between video time and sketch time for the edits in
+editing.json, and the one mapping the viewer plays the whole session with.
+
+Each edit in editing.json is a list of segments
+
+    {"video": {"start": seconds, "end": seconds},
+     "data": {"start": milliseconds, "end": milliseconds}}
+
+which must be in order and must not overlap on either timeline. An edit
+compiles to parallel, sorted arrays:
+
+    {
+        "video": [[start, end], ...],   # seconds
+        "data": [[start, end], ...]     # milliseconds
+    }
+
+Both columns are sorted, so a time on either side is found by a binary
+search on the segment starts; within a segment the other side is linearly
+interpolated. A time in a gap between segments maps to the start of the
+next segment, which is where an edit cuts to, and a time past the last
+segment maps to its end.
+
+The viewer plays the sketch offsets.time seconds behind the video, which is
+hand-tuned per session. The edits were cut in the test page's editor and
+need not agree with it, so they only drive playback once they have been
+checked against it: "drift" is how far, in milliseconds, the first edit's
+segment corners are from the offsets.time mapping, and only when it is
+within PLAYBACK_TOLERANCE is "playback" set (otherwise it is null and the
+viewer keeps offsets.time). It joins the two into one continuous mapping,
+so that playing, seeking and scrubbing all agree:
+
+    {"video": [seconds, ...], "data": [milliseconds, ...]}
+
+are the corners of a piecewise linear function: the offsets.time mapping at
+video time 0, then the start and end of every segment of the first edit.
+Between corners the sketch time is interpolated and beyond them it runs at
+the speed of the video. Both columns only ever increase, so sketch time
+never runs backwards during playback; where two segments meet the sketch
+jumps forward to the next one.
+
+Fades ({"fade": "in" or "out", "time": seconds of video}) compile to
+{"fade", "video", "data"}, with data the sketch time of the fade under the
+mapping the viewer plays with.
+
+The viewer's copy of the playback lookups is
+static/src/js/viewer/app/timeline.js.
+"""
+import bisect
+
+
+VERSION = 3
+FADES = ('in', 'out')
+# How far (milliseconds) an edit may be from offsets.time and still drive
+# playback; about a frame of video
+PLAYBACK_TOLERANCE = 40.0
+
+
+class TimelineError(ValueError):
+    pass
+
+
+def _segment(index, segment):
+    try:
+        video, data = segment['video'], segment['data']
+        values = (float(video['start']), float(video['end']), float(data['start']), float(data['end']))
+    except (KeyError, TypeError, ValueError):
+        raise TimelineError("segment %d is not {video: {start, end}, data: {start, end}}" % index)
+    if values[0] >= values[1]:
+        raise TimelineError("segment %d ends before it starts in the video" % index)
+    if values[2] > values[3]:
+        raise TimelineError("segment %d ends before it starts in the sketch" % index)
+    return values
+
+
+def validate_edit(edit):
+    """Returns an edit as a list of (video start, video end, data start,
+    data end), raising TimelineError if it is not usable.
+    """
+    segments = [_segment(i, segment) for i, segment in enumerate(edit)]
+    for i in xrange(1, len(segments)):
+        previous, segment = segments[i - 1], segments[i]
+        if segment[0] < previous[1]:
+            raise TimelineError("segment %d overlaps or precedes segment %d in the video" % (i, i - 1))
+        if segment[2] < previous[3]:
+            raise TimelineError("segment %d overlaps or precedes segment %d in the sketch" % (i, i - 1))
+    return segments
+
+
+def build_edit(edit):
+    segments = validate_edit(edit)
+    return {
+        'video': [[video_start, video_end] for video_start, video_end, _, _ in segments],
+        'data': [[data_start, data_end] for _, _, data_start, data_end in segments],
+    }
+
+
+def build_playback(offset, edit=None):
+    """Returns the corners of the playback mapping for offsets.time and an
+    edit table (see build_edit).
+    """
+    video, data = [], []
+    if edit is not None:
+        for (video_start, video_end), (data_start, data_end) in zip(edit['video'], edit['data']):
+            video.extend((video_start, video_end))
+            data.extend((data_start, data_end))
+    # the offsets.time mapping holds until the edit starts, unless it would
+    # already be past the edit's first sketch time
+    if not video or (video[0] > 0 and 0.0 - offset * 1000.0 <= data[0]):
+        video.insert(0, 0.0)
+        data.insert(0, 0.0 - offset * 1000.0)
+    return {'video': video, 'data': data}
+
+
+def drift(edit, offset):
+    """The furthest, in milliseconds, any segment corner of an edit table is
+    from the offsets.time mapping.
+    """
+    return max(
+        abs(data - (video - offset) * 1000.0)
+        for videos, datas in zip(edit['video'], edit['data'])
+        for video, data in zip(videos, datas)
+    )
+
+
+def build_fades(fades, playback):
+    mapping = Playback(playback)
+    compiled = []
+    for i, fade in enumerate(fades):
+        try:
+            kind, seconds = fade['fade'], float(fade['time'])
+        except (KeyError, TypeError, ValueError):
+            raise TimelineError("fade %d is not {fade, time}" % i)
+        if kind not in FADES:
+            raise TimelineError("fade %d is neither in nor out" % i)
+        if compiled and seconds < compiled[-1]['video']:
+            raise TimelineError("fade %d is before fade %d" % (i, i - 1))
+        compiled.append({'fade': kind, 'video': seconds, 'data': mapping.video_to_data(seconds)})
+    return compiled
+
+
+def build_timeline(editing, offsets=None):
+    """Returns the tables for the edits and fades in an editing.json and,
+    if the first edit agrees with offsets.json, the playback mapping they
+    make together; or None if it has neither edits nor fades.
+    """
+    edits = (editing or {}).get('edits') or []
+    fades = (editing or {}).get('fades') or []
+    if not edits and not fades:
+        return None
+    tables = []
+    for i, edit in enumerate(edits):
+        try:
+            tables.append(build_edit(edit))
+        except TimelineError as e:
+            raise TimelineError("edit %d: %s" % (i, e))
+    try:
+        offset = float((offsets or {}).get('time') or 0)
+    except (TypeError, ValueError):
+        raise TimelineError("offsets.time is not a number")
+    edit_drift = drift(tables[0], offset) if tables else None
+    playback = None
+    if edit_drift is not None and edit_drift <= PLAYBACK_TOLERANCE:
+        playback = build_playback(offset, tables[0])
+    return {
+        'version': VERSION,
+        'edits': tables,
+        'drift': edit_drift,
+        'playback': playback,
+        'fades': build_fades(fades, playback or build_playback(offset)),
+    }
+
+
+def _lookup(starts, source, target, value):
+    if not source:
+        return None
+    i = bisect.bisect_right(starts, value) - 1
+    if i < 0:
+        return target[0][0]
+    start, end = source[i]
+    if value >= end:
+        if i + 1 < len(source):
+            return target[i + 1][0]
+        return target[i][1]
+    ratio = (value - start) / (end - start) if end > start else 0.0
+    return target[i][0] + ratio * (target[i][1] - target[i][0])
+
+
+class Edit(object):
+    """Lookups over one compiled edit table."""
+
+    def __init__(self, table):
+        self.video = table['video']
+        self.data = table['data']
+        self.video_starts = [start for start, _ in self.video]
+        self.data_starts = [start for start, _ in self.data]
+
+    def video_to_data(self, seconds):
+        """Sketch time in milliseconds at a video time in seconds."""
+        return _lookup(self.video_starts, self.video, self.data, seconds)
+
+    def data_to_video(self, milliseconds):
+        """Video time in seconds at a sketch time in milliseconds."""
+        return _lookup(self.data_starts, self.data, self.video, milliseconds)
+
+
+def _interpolate(xs, ys, value, speed):
+    i = bisect.bisect_right(xs, value) - 1
+    if i < 0:
+        return ys[0] + (value - xs[0]) * speed
+    if i + 1 == len(xs):
+        return ys[i] + (value - xs[i]) * speed
+    ratio = (value - xs[i]) / (xs[i + 1] - xs[i]) if xs[i + 1] > xs[i] else 0.0
+    return ys[i] + ratio * (ys[i + 1] - ys[i])
+
+
+class Playback(object):
+    """Lookups over the playback mapping."""
+
+    def __init__(self, table):
+        self.video = table['video']
+        self.data = table['data']
+
+    def video_to_data(self, seconds):
+        return _interpolate(self.video, self.data, seconds, 1000.0)
+
+    def data_to_video(self, milliseconds):
+        return _interpolate(self.data, self.video, milliseconds, 0.001)
+
+
+def verify(timeline, tolerance=1e-6):
+    """Checks that every segment boundary and midpoint maps back to itself,
+    and that a playback mapping was only built from an edit that agrees
+    with offsets.time, never runs backwards and passes through every
+    segment of that edit.
+    """
+    if not timeline:
+        return
+    for i, table in enumerate(timeline['edits']):
+        edit = Edit(table)
+        for video_start, video_end in table['video']:
+            for seconds in (video_start, (video_start + video_end) / 2):
+                back = edit.data_to_video(edit.video_to_data(seconds))
+                if abs(back - seconds) > tolerance:
+                    raise TimelineError("edit %d: %fs maps back to %fs" % (i, seconds, back))
+
+    if timeline['playback'] is None:
+        return
+    if timeline['drift'] > PLAYBACK_TOLERANCE:
+        raise TimelineError("playback follows an edit %.0fms away from offsets.time" % timeline['drift'])
+    playback = Playback(timeline['playback'])
+    for column in ('video', 'data'):
+        values = timeline['playback'][column]
+        if any(b < a for a, b in zip(values, values[1:])):
+            raise TimelineError("playback %s times run backwards" % column)
+    if timeline['edits']:
+        edit = Edit(timeline['edits'][0])
+        for video_start, video_end in edit.video:
+            for seconds in (video_start, (video_start + video_end) / 2):
+                if abs(playback.video_to_data(seconds) - edit.video_to_data(seconds)) > tolerance * 1000:
+                    raise TimelineError("playback leaves the edit at %fs" % seconds)
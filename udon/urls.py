@@ -20,6 +20,7 @@ from . import views
 
 urlpatterns = patterns(
     '',
+    url(r'^_ah/stats/$', views.request_stats, name='request_stats'),
     url(r'^_ah/', include('djangae.urls')),
     url(r'^csp/', include('cspreports.urls')),
 
@@ -27,6 +28,15 @@ urlpatterns = patterns(
     url(r'^unsupported/$', views.unsupported, name='unsupported'),
     url(r'^serve-file/(?P<blob_key_or_info>.*)/$', views.serve_file, name='serve_file'),
     url(r'^video/(?P<blob_key_or_info>.*)/$', views.video, name='video'),
+    url(r'^data/sketches/(?P<sketch_name>[\w-]+)/(?P<asset_name>[\w.-]+\.bin|snapshots\.json|spatial\.json|actions\.lod\d\.json)$', views.sketch_asset, name='sketch_asset'),
+    url(r'^data/sketches/(?P<sketch_name>[\w-]+)/bundle\.json$', views.sketch_bundle, name='sketch_bundle'),
+    url(r'^data/sketches/(?P<sketch_name>[\w-]+)/strokes/$', views.sketch_strokes, name='sketch_strokes'),
+    url(r'^data/sketches/(?P<sketch_name>[\w-]+)/chunks/$', views.sketch_chunks, name='sketch_chunks'),
+    url(r'^data/sketches/(?P<sketch_name>[\w-]+)/chunks/(?P<track>\w+)/(?P<index>\d+)/$', views.sketch_chunk, name='sketch_chunk'),
+    url(r'^data/models/(?P<model_name>[\w.-]+\.mesh)$', views.model_file, name='model_file'),
+    url(r'^data/thumbnails/(?P<sketch_name>[\w-]+)/(?P<file_name>\d+\.(?:png|webp))$', views.thumbnail, name='thumbnail'),
+    url(r'^data/(?P<path>[\w./-]+\.\w+)$', views.data_file, name='data_file'),
+    url(r'^v/(?P<digest>[0-9a-f]+)(?P<path>/.+)$', views.fingerprinted, name='fingerprinted'),
     url(r'^artists/(?P<artist_slug>[\w-]+)/$', views.session, name='session'),
     url(r'^artists/(?P<artist_slug>[\w-]+)/sessions/(?P<session_slug>[\w-]+)/$', views.session, name='session'),
 
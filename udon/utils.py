@@ -13,68 +13,176 @@
  * See the License for the specific language governing permissions and
  * limitations under the License.
 """
+import hashlib
 import json
+import os
+
 from django.conf import settings
 
+from . import boot, fingerprint, instrumentation
+
+
+DATA_FILE = 'data.json'
+
+
+class Catalog(object):
+    """An indexed snapshot of data.json and the thumbnail index.
+
+    Built once per load and never mutated afterwards, so every lookup the
+    views need is a dictionary access rather than a scan over the artists.
+    The artists and sessions are copies of the ones in raw_data, which the
+    fields added here (assets, thumbnails) never reach.
+    """
+
+    def __init__(self, raw_data, mtime=None, fingerprints=None, digest=None, thumbnails=None):
+        self.raw_data = raw_data
+        self.mtime = mtime
+        # identifies this snapshot, e.g. in cache keys
+        self.digest = digest
+        self.artists = [
+            dict(art, sessions=[dict(session) for session in art['sessions']])
+            for art in raw_data['artists']
+        ]
+        self.artists_list = tuple(art['slug'] for art in self.artists)
+
+        self._artists = {}
+        self._previous = {}
+        self._next = {}
+        self._sessions = {}
+        self._enabled_sessions = {}
+
+        count = len(self.artists)
+        for idx, artist in enumerate(self.artists):
+            slug = artist['slug']
+            self._artists[slug] = artist
+            self._previous[slug] = self.artists[(idx - 1) % count]
+            self._next[slug] = self.artists[(idx + 1) % count]
+
+            enabled = tuple(s for s in artist['sessions'] if s['enabled'] is True)
+            self._enabled_sessions[slug] = enabled
+            for session in enabled:
+                # {url: content-hashed url} for the files the session loads
+                session['assets'] = fingerprint.sketch_urls(session['sketch'], fingerprints)
+                # rendered thumbnails win over any set by hand in data.json
+                session['thumbnail'] = (thumbnails or {}).get(session['sketch']) or session.get('thumbnail')
+                if session['thumbnail']:
+                    self._add_thumbnail(session, fingerprints)
+                self._sessions[(slug, session['slug'])] = session
+            artist['thumbnail_sessions'] = tuple(s for s in enabled if s.get('thumbnail'))
+
+    @staticmethod
+    def _add_thumbnail(session, fingerprints):
+        """Adds the srcset of each format of the session's thumbnail (see
+        udon/thumbnails.py) and the smallest PNG as a fallback src.
+        """
+        session['thumbnail_srcset'] = {}
+        for image_format, urls in session['thumbnail'].items():
+            widths = sorted(urls, key=int)
+            session['thumbnail_srcset'][image_format] = ', '.join(
+                '%s %sw' % (fingerprint.fingerprinted_url(urls[width], fingerprints), width)
+                for width in widths
+            )
+            if image_format == 'png':
+                session['thumbnail_src'] = fingerprint.fingerprinted_url(urls[widths[0]], fingerprints)
+
+    @property
+    def globals(self):
+        return self.raw_data['globals']
+
+    def get_artist(self, artist_slug):
+        return self._artists[artist_slug]
+
+    def get_previous_artist(self, artist_slug):
+        return self._previous[artist_slug]
+
+    def get_next_artist(self, artist_slug):
+        return self._next[artist_slug]
+
+    def get_sessions(self, artist_slug):
+        return self._enabled_sessions[artist_slug]
+
+    def get_session(self, artist_slug, session_slug):
+        return self._sessions[(artist_slug, session_slug)]
+
+
+def _get_mtime():
+    try:
+        thumbnails_mtime = os.stat(settings.THUMBNAIL_INDEX).st_mtime
+    except OSError:
+        thumbnails_mtime = None
+    return os.stat(DATA_FILE).st_mtime, fingerprint.manifest_mtime(), thumbnails_mtime
+
+
+def _load_thumbnails():
+    """Returns the contents of the thumbnail index, or an empty index if the
+    thumbnails have not been rendered.
+    """
+    try:
+        with open(settings.THUMBNAIL_INDEX, 'rb') as index_file:
+            return index_file.read()
+    except IOError:
+        return '{}'
+
 
 def load_data():
-    raw_data = json.loads(open('data.json', 'rb').read())
-    artists = [art['slug'] for art in raw_data['artists']]
-    return raw_data, artists
+    mtime = _get_mtime()
+    contents = open(DATA_FILE, 'rb').read()
+    thumbnails = _load_thumbnails()
+    fingerprints = fingerprint.load_manifest()
+    digest = hashlib.sha1(contents)
+    digest.update(thumbnails)
+    digest.update(fingerprint.dumps(fingerprints))
+    return Catalog(json.loads(contents), mtime, fingerprints, digest.hexdigest(), json.loads(thumbnails))
+
 
-RAW_DATA, ARTISTS_LIST = load_data()
+with boot.timed('load_data'):
+    CATALOG = load_data()
 
 
 def get_data():
-    if settings.DEBUG:
-        return load_data()
-    return RAW_DATA, ARTISTS_LIST
+    global CATALOG
+    with instrumentation.span('catalog'):
+        # Only the dev server ever sees data.json or the fingerprint manifest
+        # change underneath it, so production skips the stat() entirely.
+        if settings.DEBUG and _get_mtime() != CATALOG.mtime:
+            CATALOG = load_data()
+        return CATALOG
 
 
 def get_artists():
-    raw_data, _ = get_data()
-    return raw_data['artists']
+    return get_data().artists
 
 
 def get_artist(artist_slug):
-    return filter(lambda art: art['slug'] == artist_slug, get_artists())[0]
+    # raises KeyError for unknown artists
+    return get_data().get_artist(artist_slug)
 
 
 def get_previous_artist(artist_slug):
-    _, artists_list = get_data()
-    prev_artist_slug_idx = artists_list.index(artist_slug) - 1
-    prev_artist_slug = artists_list[prev_artist_slug_idx % len(artists_list)]
-
-    return get_artist(prev_artist_slug)
+    return get_data().get_previous_artist(artist_slug)
 
 
 def get_next_artist(artist_slug):
-    _, artists_list = get_data()
-    next_artist_slug_idx = artists_list.index(artist_slug) + 1
-    next_artist_slug = artists_list[next_artist_slug_idx % len(artists_list)]
-
-    return get_artist(next_artist_slug)
+    return get_data().get_next_artist(artist_slug)
 
 
 def get_sessions(artist_slug):
-    return filter(lambda session: session['enabled'] is True, get_artist(artist_slug)['sessions'])
+    return get_data().get_sessions(artist_slug)
 
 
 def get_session(artist_slug, session_slug):
-    # can throw IndexError if all sessions are disabled
-    sessions = get_sessions(artist_slug)
-    return filter(lambda s: s['slug'] == session_slug, sessions)[0]
+    # raises KeyError for unknown or disabled sessions
+    return get_data().get_session(artist_slug, session_slug)
 
 
 def get_first_session(artist_slug):
-    # can throw IndexError if all sessions are disabled
+    # can throw IndexError if the artist has no sessions
     artist = get_artist(artist_slug)
     return artist['sessions'][0]
 
 
 def get_globals():
-    raw_data, _ = get_data()
-    return raw_data['globals']
+    return get_data().globals
 
 
 def get_full_path(path):
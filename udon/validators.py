@@ -0,0 +1,75 @@
+"""
+ * Copyright 2016 Google Inc. All Rights Reserved.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+"""
+"""
+The ETag of pages rendered from data.json and the templates, for use with
+django.views.decorators.http.condition, which checks it before the view
+runs so a matching request never renders anything.
+
+There is deliberately no Last-Modified: file mtimes do not survive a deploy
+in any meaningful way, so If-Modified-Since could match a page that has
+changed.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+
+from . import utils
+
+
+TEMPLATE_EXTENSIONS = ('.html', '.svg')
+
+_templates = None
+
+
+def _template_files():
+    dirs = [os.path.join(os.path.dirname(__file__), 'templates')]
+    for engine in settings.TEMPLATES:
+        dirs.extend(engine.get('DIRS', []))
+    for template_dir in dirs:
+        for dir_path, dir_names, file_names in os.walk(template_dir):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith(TEMPLATE_EXTENSIONS):
+                    yield os.path.join(dir_path, file_name)
+
+
+def template_version():
+    """Returns the digest of every template a page can include, by their
+    paths relative to the project and their contents, so every checkout
+    and instance of a deploy agrees on it.
+
+    Templates only change with a deploy, so this is worked out once per
+    process, except under DEBUG.
+    """
+    global _templates
+    if _templates is None or settings.DEBUG:
+        digest = hashlib.sha1()
+        for path in _template_files():
+            with open(path, 'rb') as template_file:
+                digest.update(os.path.relpath(path, settings.PROJECT_DIR).replace(os.sep, '/'))
+                digest.update(template_file.read())
+        _templates = digest.hexdigest()
+    return _templates
+
+
+def page_etag(request, *args, **kwargs):
+    catalog = utils.get_data()
+    digest = hashlib.sha1()
+    digest.update(catalog.digest)
+    digest.update(template_version())
+    digest.update(request.path.encode('utf-8'))
+    return digest.hexdigest()
@@ -13,39 +13,66 @@
  * See the License for the specific language governing permissions and
  * limitations under the License.
 """
+import json
 import os
 import logging
 
 import cloudstorage
 from djangae.storage import serve_file as djangae_serve_view
 from django.conf import settings
-from django.core.urlresolvers import reverse
-from django.http import Http404
+from django.core.urlresolvers import Resolver404, resolve, reverse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.shortcuts import (
     render,
     redirect,
     render_to_response,
 )
-from django.views.decorators.cache import cache_control
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
 from django.views.decorators.vary import vary_on_headers
 
-from . import utils
+from . import (
+    archive,
+    boot,
+    bundles,
+    chunks,
+    fingerprint,
+    instrumentation,
+    pagecache,
+    precompressed,
+    spatial,
+    streaming,
+    utils,
+    validators,
+)
+
+
+# Answers If-None-Match with a 304 before the view renders
+page_condition = condition(etag_func=validators.page_etag)
 
 
 @cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+@page_condition
+@pagecache.cache_page
 def home(request):
     context = {
         'artists': utils.get_artists(),
     }
-    return render(request, 'home.html', context)
+    with instrumentation.span('render'):
+        return render(request, 'home.html', context)
 
 
 @cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+@page_condition
 def unsupported(request):
-    return render(request, 'unsupported.html', {})
+    with instrumentation.span('render'):
+        return render(request, 'unsupported.html', {})
 
 
 @cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+@page_condition
+@pagecache.cache_page
 def session(request, artist_slug, session_slug=None):
 
     if session_slug is None:
@@ -81,18 +108,23 @@ def session(request, artist_slug, session_slug=None):
         'artist': artist,
         'next': utils.get_next_artist(artist_slug),
         'session': session,
+        'assets': json.dumps(session['assets']),
         'sharing_url': utils.get_full_path(request.path)
     }
-    return render(request, 'session.html', context)
+    with instrumentation.span('render'):
+        return render(request, 'session.html', context)
 
 
 def test(request):
-    return render(request, 'test.html', {})
+    with instrumentation.span('render'):
+        return render(request, 'test.html', {})
 
 
 @cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+@page_condition
 def video(request, blob_key_or_info):
-    return render(request, 'video.html', {'blob_key_or_info': blob_key_or_info})
+    with instrumentation.span('render'):
+        return render(request, 'video.html', {'blob_key_or_info': blob_key_or_info})
 
 
 @vary_on_headers('Range')
@@ -105,6 +137,9 @@ def serve_file(
     cs_blob_key_or_info = '/{}/{}'.format(settings.BUCKET_KEY, blob_key_or_info)
 
     def serve():
+        if settings.SERVE_FILE_STREAMING:
+            return streaming.serve(request, streaming.get_bucket(), blob_key_or_info)
+
         return djangae_serve_view(
             request,
             blob_key_or_info=cs_blob_key_or_info,
@@ -114,19 +149,220 @@ def serve_file(
     if settings.DEBUG:
         try:
             return serve()
-        except cloudstorage.errors.NotFoundError:
-            video_path = os.path.join(settings.PROJECT_DIR, 'scripts', 'videos', blob_key_or_info)
+        except (cloudstorage.errors.NotFoundError, streaming.ObjectNotFound):
+            videos_bucket = streaming.LocalBucket(os.path.join(settings.PROJECT_DIR, 'scripts', 'videos'))
+
+            try:
+                video_path = videos_bucket.path(blob_key_or_info)
+            except streaming.ObjectNotFound:
+                raise Http404
 
             if os.path.exists(video_path):
-                logging.info("Creating a local copy...")
-                local_file = open(video_path, 'rb')
-                local_gcs_file = cloudstorage.open(cs_blob_key_or_info, 'w', content_type='video/mp4')
-                local_gcs_file.write(local_file.read())
-                local_gcs_file.close()
+                # Serve straight from disk while the dev bucket is filled in
+                # the background, so the first play doesn't have to wait.
+                # Only the dev server gets here (DEBUG), where the copy's
+                # thread outlives the request.
+                streaming.copy_to_cloudstorage(video_path, cs_blob_key_or_info)
+                return streaming.serve(request, videos_bucket, blob_key_or_info)
             else:
                 logging.info("File already created. Serving...")
 
-    return serve()
+    try:
+        return serve()
+    except streaming.ObjectNotFound:
+        raise Http404
+
+
+def sketch_bucket(name):
+    """The bucket a compiled sketch file is served from: the sketch archive,
+    or build/sketches for files that are not packed.
+    """
+    bucket = archive.get_bucket() if settings.SKETCH_ARCHIVE else None
+    if bucket is None or name not in bucket.index['files']:
+        bucket = streaming.LocalBucket(settings.SKETCH_BUILD_DIR)
+    return bucket
+
+
+@vary_on_headers('Range')
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def sketch_asset(request, sketch_name, asset_name):
+    name = '{}/{}'.format(sketch_name, asset_name)
+    try:
+        return streaming.serve(request, sketch_bucket(name), name)
+    except streaming.ObjectNotFound:
+        raise Http404
+
+
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def sketch_chunks(request, sketch_name):
+    return sketch_asset(request, sketch_name, chunks.MANIFEST_NAME)
+
+
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def sketch_bundle(request, sketch_name):
+    name = '{}/{}'.format(sketch_name, bundles.FILE_NAME)
+    bucket = archive.get_bucket() if settings.SKETCH_ARCHIVE else None
+    if bucket is not None and name in bucket.index['files']:
+        # packed by the same build as every file it lists
+        entry = bucket.index['files'][name]
+        payload, sha1 = bucket.read(name, 0, entry['length']), entry['sha1']
+    else:
+        bundle = bundles.load_bundle(
+            sketch_name,
+            os.path.join(settings.DATA_DIR, 'sketches'),
+            settings.SKETCH_BUILD_DIR,
+            manifest=fingerprint.load_manifest(),
+            manifest_mtime=fingerprint.manifest_mtime(),
+        )
+        if bundle is None:
+            raise Http404
+        payload, sha1 = bundle
+
+    etag = '"%s"' % sha1
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def sketch_strokes(request, sketch_name):
+    """The strokes of a sketch inside ?box=x0,y0,z0,x1,y1,z1, optionally only
+    those on the canvas at ?time= (ms) and drawn with ?brush= (an index into
+    the sketch's BrushIndex).
+    """
+    name = '{}/{}'.format(sketch_name, spatial.FILE_NAME)
+    try:
+        index = spatial.load_index(sketch_bucket(name), name)
+    except streaming.ObjectNotFound:
+        raise Http404
+
+    try:
+        box = spatial.parse_box(request.GET['box']) if 'box' in request.GET else None
+        time = int(request.GET['time']) if 'time' in request.GET else None
+        brush = int(request.GET['brush']) if 'brush' in request.GET else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e), content_type='text/plain')
+
+    rows = spatial.query(index, box, time, brush)
+    strokes = index['strokes']
+    return HttpResponse(json.dumps({
+        'sketch': sketch_name,
+        'strokes': [strokes['id'][row] for row in rows],
+        'bounds': spatial.union(strokes['bounds'][row] for row in rows),
+    }), content_type='application/json')
+
+
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def sketch_chunk(request, sketch_name, track, index):
+    # chunks.json comes from the same place as the other compiled files, the
+    # chunk itself is a range of the source JSON in data/
+    manifest_name = '{}/{}'.format(sketch_name, chunks.MANIFEST_NAME)
+    try:
+        chunk, payload = chunks.read_chunk(
+            sketch_bucket(manifest_name),
+            streaming.LocalBucket(os.path.join(settings.DATA_DIR, 'sketches')),
+            sketch_name, track, int(index))
+    except (streaming.ObjectNotFound, KeyError, IndexError):
+        raise Http404
+
+    etag = '"%s"' % chunk['sha1']
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def serve_precompressed(request, source_dir, variants_dir, path):
+    """Serves source_dir/path, or the variant of it in variants_dir that suits
+    the request's Accept-Encoding.
+    """
+    entry = precompressed.load_index(variants_dir)['files'].get(path)
+    encoding = None
+    etag = None
+    if entry is not None:
+        encoding = precompressed.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'), entry['encodings'])
+        # Each representation needs its own strong validator
+        etag = '%s-%s' % (entry['sha1'], encoding) if encoding else entry['sha1']
+
+    if encoding:
+        bucket = streaming.LocalBucket(variants_dir)
+        name = precompressed.variant_name(path, encoding)
+    else:
+        bucket = streaming.LocalBucket(source_dir)
+        name = path
+
+    try:
+        response = streaming.serve(
+            request,
+            bucket,
+            name,
+            content_type=precompressed.content_type(path),
+            etag=etag,
+        )
+    except streaming.ObjectNotFound:
+        raise Http404
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+@vary_on_headers('Accept-Encoding', 'Range')
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def data_file(request, path):
+    return serve_precompressed(request, settings.DATA_DIR, settings.PRECOMPRESSED_DIR, path)
+
+
+@vary_on_headers('Accept-Encoding', 'Range')
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def model_file(request, model_name):
+    return serve_precompressed(request, settings.MODEL_BUILD_DIR, settings.MODEL_BUILD_DIR, model_name)
+
+
+@cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
+def thumbnail(request, sketch_name, file_name):
+    bucket = streaming.LocalBucket(settings.THUMBNAIL_BUILD_DIR)
+    try:
+        return streaming.serve(request, bucket, '{}/{}'.format(sketch_name, file_name))
+    except streaming.ObjectNotFound:
+        raise Http404
+
+
+def fingerprinted(request, digest, path):
+    entry = fingerprint.load_manifest()['files'].get(path)
+    if entry is None:
+        raise Http404
+    if entry['digest'] != digest:
+        # A page cached from before the file changed; send it to the new copy
+        return redirect(fingerprint.fingerprinted_url(path))
+
+    try:
+        match = resolve(path)
+    except Resolver404:
+        raise Http404
+
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code in (200, 206, 304):
+        # patch_cache_control keeps the smaller of two max-ages
+        del response['Cache-Control']
+        patch_cache_control(response, public=True, max_age=fingerprint.IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+@never_cache
+def request_stats(request):
+    # admin only, see app.yaml
+    stats = {
+        'sample_rate': settings.INSTRUMENTATION_SAMPLE_RATE,
+        'requests': instrumentation.get_stats().summary(),
+        'startup': boot.STARTUP_TIMINGS,
+    }
+    return HttpResponse(json.dumps(stats, indent=2, sort_keys=True), content_type='application/json')
 
 
 @cache_control(public=True, max_age=settings.CACHE_TIMEOUT)
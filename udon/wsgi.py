@@ -22,8 +22,8 @@ For more information on this file, see
 https://docs.djangoproject.com/en/1.6/howto/deployment/wsgi/
 """
 
-from udon.boot import fix_path
-fix_path()
+from udon import boot
+boot.fix_path()
 
 import os
 from django.core.wsgi import get_wsgi_application
@@ -33,5 +33,11 @@ from djangae.utils import on_production
 settings = "udon.conf.production" if on_production() else "udon.conf.local"
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings)
 
+with boot.timed('settings'):
+    from django.conf import settings as django_settings
+    django_settings.INSTALLED_APPS
 
-application = DjangaeApplication(get_wsgi_application())
+with boot.timed('django_setup'):
+    application = DjangaeApplication(get_wsgi_application())
+
+boot.warm_up()